@@ -0,0 +1,437 @@
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+from capture_backend import ArchiveCapture
+from frame_archive import FrameArchiveWriter
+from ocr_backend import filter_lines, lines_to_text
+from bubble_layout import segment, overlaps, MESSAGE
+
+# 常见的中文字体位置（Windows / macOS / Linux）
+CJK_FONTS = [
+    'C:/Windows/Fonts/msyh.ttc',
+    'C:/Windows/Fonts/simhei.ttf',
+    'C:/Windows/Fonts/simsun.ttc',
+    '/System/Library/Fonts/PingFang.ttc',
+    '/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc',
+    '/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc',
+    '/usr/share/fonts/truetype/wqy/wqy-microhei.ttc',
+    '/usr/share/fonts/wqy-microhei/wqy-microhei.ttc',
+]
+
+# 生成消息用的常用汉字
+FILLER_CHARS = ('的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动'
+                '同工也能下过子说产种面而方后多定行学法所民得经十三之进着等部度家电力里如水化高自'
+                '今天明早晚到达出发车票请问谁有空位拼顺路吗好的谢谢收到')
+
+BACKGROUND = (237, 237, 237)
+OTHER_BUBBLE = (255, 255, 255)
+OWN_BUBBLE = (149, 236, 105)
+AVATAR = (120, 160, 200)
+TEXT_COLOR = (25, 25, 25)
+
+STAGES = ['capture', 'hash', 'segment', 'preprocess', 'ocr', 'match', 'dedup', 'end_to_end']
+
+# 启动耗时报告中测量导入耗时的入口模块
+STARTUP_MODULES = ['monitor_engine', 'wechat_monitor_pro']
+
+# 子进程中测量导入引擎并创建MonitorEngine的耗时（不含解释器启动）
+ENGINE_READY_CODE = '''
+import time
+start = time.perf_counter()
+from monitor_engine import MonitorEngine
+engine = MonitorEngine({'log_to_file': False}, log_callback=lambda *args: None)
+print(time.perf_counter() - start)
+engine.close()
+'''
+
+
+def load_font(size):
+    """加载中文字体，找不到时使用PIL自带字体（无法显示中文，但仍有笔画像素）"""
+    for path in CJK_FONTS:
+        if os.path.exists(path):
+            return ImageFont.truetype(path, size), path
+    try:
+        return ImageFont.load_default(size), None
+    except TypeError:
+        return ImageFont.load_default(), None
+
+
+class ChatFrameGenerator:
+    """
+    合成类似微信聊天窗口的截图：左侧他人气泡、右侧自己的绿色气泡、头像和中文消息
+    message_rate为平均每帧新增的消息数，city_ratio为消息中包含城市名的概率
+    scroll_speed为每帧最多滚动的像素数，0表示新消息出现时直接跳到底部
+    """
+    def __init__(self, cities, width=400, height=600, message_rate=0.3, city_ratio=0.2,
+                 scroll_speed=0, own_ratio=0.2, font_size=16, seed=0):
+        self.cities = list(cities)
+        self.width = width
+        self.height = height
+        self.message_rate = message_rate
+        self.city_ratio = city_ratio
+        self.scroll_speed = scroll_speed
+        self.own_ratio = own_ratio
+        self.random = random.Random(seed)
+        self.font, self.font_path = load_font(font_size)
+
+        self.line_height = font_size + 6
+        self.chars_per_line = max(4, (width - 140) // font_size)
+        self.messages = []  # (顶部y, 高度, 文字行, 是否自己的消息, 是否含城市)
+        self.content_height = 10
+        self.view_top = 0
+        self.pending = 0.0
+
+    def random_message(self):
+        """生成一条随机消息，返回(文字, 是否含城市)"""
+        length = self.random.randint(4, self.chars_per_line * 2)
+        text = ''.join(self.random.choice(FILLER_CHARS) for _ in range(length))
+        has_city = bool(self.cities) and self.random.random() < self.city_ratio
+        if has_city:
+            position = self.random.randint(0, len(text))
+            city = self.random.choice(self.cities)
+            if position % self.chars_per_line + len(city) > self.chars_per_line:
+                position -= position % self.chars_per_line  # 城市名不跨行
+            text = text[:position] + city + text[position:]
+        return text, has_city
+
+    def add_message(self):
+        """在聊天记录末尾追加一条消息"""
+        text, has_city = self.random_message()
+        own = self.random.random() < self.own_ratio
+        lines = [text[i:i + self.chars_per_line] for i in range(0, len(text), self.chars_per_line)]
+        height = len(lines) * self.line_height + 16
+        self.messages.append((self.content_height, height, lines, own, has_city))
+        self.content_height += height + 14
+
+    def advance(self):
+        """前进一帧：按消息速率追加消息，并向底部滚动"""
+        self.pending += self.message_rate
+        while self.pending >= 1:
+            self.add_message()
+            self.pending -= 1
+
+        bottom = max(0, self.content_height - self.height)
+        if self.scroll_speed:
+            self.view_top = min(bottom, self.view_top + self.scroll_speed)
+        else:
+            self.view_top = bottom
+
+        # 丢弃早已滚出画面的消息
+        while self.messages and self.messages[0][0] + self.messages[0][1] < self.view_top - self.height:
+            self.messages.pop(0)
+
+    def render(self):
+        """绘制当前画面，返回(图像, 画面中他人消息的文字)"""
+        image = Image.new('RGB', (self.width, self.height), BACKGROUND)
+        draw = ImageDraw.Draw(image)
+        visible_text = []
+
+        for top, height, lines, own, _ in self.messages:
+            y = top - self.view_top
+            if y + height < 0 or y > self.height:
+                continue
+
+            text_width = max(draw.textlength(line, font=self.font) for line in lines)
+            bubble_width = int(text_width) + 20
+            if own:
+                avatar_x = self.width - 46
+                bubble_x = avatar_x - 10 - bubble_width
+                color = OWN_BUBBLE
+            else:
+                avatar_x = 10
+                bubble_x = 56
+                color = OTHER_BUBBLE
+                visible_text.extend(lines)
+
+            draw.rectangle((avatar_x, y, avatar_x + 36, y + 36), fill=AVATAR)
+            draw.rounded_rectangle((bubble_x, y, bubble_x + bubble_width, y + height), radius=4, fill=color)
+            for i, line in enumerate(lines):
+                draw.text((bubble_x + 10, y + 8 + i * self.line_height), line, font=self.font, fill=TEXT_COLOR)
+
+        return image, '\n'.join(visible_text)
+
+    def frames(self, count):
+        """依次生成count帧，返回(图像, 文字)"""
+        for _ in range(count):
+            self.advance()
+            yield self.render()
+
+
+def summarize(timings):
+    """汇总一个阶段的耗时（秒）：次数、吞吐量和p50/p99延迟（毫秒）"""
+    if not timings:
+        return {'count': 0}
+    values = np.array(timings) * 1000
+    total = values.sum() / 1000
+    return {
+        'count': len(timings),
+        'throughput_per_s': round(len(timings) / total, 1) if total else None,
+        'mean_ms': round(float(values.mean()), 3),
+        'p50_ms': round(float(np.percentile(values, 50)), 3),
+        'p99_ms': round(float(np.percentile(values, 99)), 3),
+        'max_ms': round(float(values.max()), 3),
+    }
+
+
+def run_benchmark(engine, generator, frame_count, use_ocr=True, archive_path=None, log=print):
+    """
+    逐帧依次运行截图（帧存档回放代替真实截图）、变化检测、气泡分割、预处理、OCR、匹配和去重，分别计时
+    开启气泡分割时预处理和OCR按气泡计时
+    OCR不可用或关闭时用合成画面的真实文字代替识别结果
+    返回各阶段的统计和运行信息
+    """
+    # 先把合成的帧录制成帧存档，截图阶段测量回放取帧的耗时
+    keep_archive = archive_path is not None
+    if not keep_archive:
+        fd, archive_path = tempfile.mkstemp(suffix='.wdfa')
+        os.close(fd)
+
+    truth = []
+    start = time.perf_counter()
+    writer = FrameArchiveWriter(archive_path)
+    for index, (image, text) in enumerate(generator.frames(frame_count)):
+        writer.write_frame('benchmark', image, float(index))
+        truth.append(text)
+    archive_stats = writer.stats()
+    writer.close()
+    log(f"生成{frame_count}帧合成画面耗时 {time.perf_counter() - start:.1f}s, 存档 {archive_stats['archive_kb']}KB")
+
+    ocr_error = None
+    if use_ocr:
+        try:
+            engine.get_ocr()
+        except Exception as e:
+            ocr_error = str(e)
+            log(f"OCR不可用，使用合成文字代替识别结果: {ocr_error}")
+
+    region = engine.regions[0]
+    differ = engine.create_differ()
+    capture = ArchiveCapture(archive_path)
+    timings = {stage: [] for stage in STAGES}
+    detections = 0
+    ocr_texts = 0
+    changed_frames = 0
+
+    def timed(stage, func, *args):
+        begin = time.perf_counter()
+        result = func(*args)
+        timings[stage].append(time.perf_counter() - begin)
+        return result
+
+    try:
+        for index in range(frame_count):
+            frame_start = time.perf_counter()
+            frame = timed('capture', capture.grab)
+            box = timed('hash', differ.diff, frame)
+            if box is None:
+                timings['end_to_end'].append(time.perf_counter() - frame_start)
+                continue
+
+            changed_frames += 1
+            crops = None
+            if engine.config.get('bubble_segmentation', True):
+                blocks = timed('segment', segment, frame)
+                if any(kind == MESSAGE for _, kind in blocks):
+                    crops = [frame.crop(block) for block, kind in blocks
+                             if kind == MESSAGE and overlaps(block, box)]
+            if crops is None:
+                crops = [engine.crop_dirty(frame, box)]
+
+            lines = []
+            for crop in crops:
+                processed, _ = timed('preprocess', engine.preprocessor.process, crop)
+                if use_ocr and ocr_error is None and processed is not None:
+                    lines += timed('ocr', engine.get_ocr().image_to_lines, processed)
+
+            if use_ocr and ocr_error is None:
+                text = lines_to_text(filter_lines(lines, engine.config.get('ocr_confidence', 0)))
+            else:
+                text = truth[index]
+            ocr_texts += bool(text)
+
+            matches = timed('match', region.rules.match, text)
+            new_lines = timed('dedup', lambda: [line for line, _ in matches
+                                                if not engine.dedup.seen(f"{region.name}\n{line}")])
+            detections += len(new_lines)
+            timings['end_to_end'].append(time.perf_counter() - frame_start)
+    finally:
+        capture.close()
+        if not keep_archive:
+            os.remove(archive_path)
+
+    return {
+        'stages': {stage: summarize(values) for stage, values in timings.items()},
+        'frames': frame_count,
+        'changed_frames': changed_frames,
+        'texts': ocr_texts,
+        'detections': detections,
+        'ocr': 'ground_truth' if (not use_ocr or ocr_error) else engine.config.get('ocr_backend', 'auto'),
+        'ocr_error': ocr_error,
+        'archive': archive_stats,
+    }
+
+
+def parse_importtime(output, module):
+    """
+    解析 python -X importtime 的输出，返回(module的累计导入耗时ms, [(直接导入的模块, 累计耗时ms), ...])
+    输出按导入完成的顺序排列：子模块在前，每深一层多缩进两个空格
+    """
+    children = []
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue  # 表头
+        name = fields[2]
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        cumulative_ms = int(fields[1]) / 1000
+        if depth == 1:
+            children.append((name.strip(), cumulative_ms))
+        elif depth == 0:
+            if name.strip() == module:
+                return cumulative_ms, sorted(children, key=lambda child: -child[1])
+            children = []
+    return None, []
+
+
+def run_python(code, cwd, *options):
+    """在子进程中运行一段代码，返回(进程总耗时秒, 标准输出, 标准错误)"""
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, *options, '-c', code], cwd=cwd, capture_output=True,
+                            text=True, encoding='utf-8', errors='replace', timeout=120)
+    elapsed = time.perf_counter() - start
+    if result.returncode:
+        error = result.stderr.strip().splitlines()
+        raise RuntimeError(error[-1] if error else f"子进程退出码 {result.returncode}")
+    return elapsed, result.stdout, result.stderr
+
+
+def measure_startup(repeat=3, top=8):
+    """
+    启动耗时报告（各项取repeat次中的最小值）：空解释器的启动耗时，
+    各入口模块的进程总耗时、导入耗时（-X importtime）和耗时最多的直接依赖，
+    以及导入引擎并创建MonitorEngine的耗时
+    """
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    report = {'interpreter_ms': round(min(run_python('pass', cwd)[0] for _ in range(repeat)) * 1000, 1),
+              'modules': {}}
+
+    for module in STARTUP_MODULES:
+        best = None
+        for _ in range(repeat):
+            wall, _, output = run_python(f'import {module}', cwd, '-X', 'importtime')
+            import_ms, children = parse_importtime(output, module)
+            if import_ms is not None and (best is None or import_ms < best[1]):
+                best = (wall, import_ms, children)
+        if best is None:
+            continue
+        wall, import_ms, children = best
+        report['modules'][module] = {
+            'wall_ms': round(wall * 1000, 1),
+            'import_ms': round(import_ms, 1),
+            'top_imports': [{'module': name, 'ms': round(ms, 1)} for name, ms in children[:top]],
+        }
+
+    ready = min(float(run_python(ENGINE_READY_CODE, cwd)[1]) for _ in range(repeat))
+    report['engine_ready_ms'] = round(ready * 1000, 1)
+    return report
+
+
+def parse_args(argv=None):
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="合成聊天画面，分阶段测量识别流水线的吞吐量和延迟")
+    parser.add_argument('--frames', type=int, default=200, help="生成的帧数（默认200）")
+    parser.add_argument('--width', type=int, default=400, help="画面宽度（默认400）")
+    parser.add_argument('--height', type=int, default=600, help="画面高度（默认600）")
+    parser.add_argument('--rate', type=float, default=0.3, help="平均每帧新增消息数（默认0.3）")
+    parser.add_argument('--city-ratio', type=float, default=0.2, help="消息包含城市名的概率（默认0.2）")
+    parser.add_argument('--scroll', type=int, default=0, help="每帧最多滚动像素数，0表示直接跳到底部")
+    parser.add_argument('--seed', type=int, default=0, help="随机种子（默认0）")
+    parser.add_argument('--no-ocr', action='store_true', help="跳过OCR，用合成文字代替识别结果")
+    parser.add_argument('--fuzzy', action='store_true', help="使用容错匹配（形近字、个别错字）")
+    parser.add_argument('--extra-keywords', type=int, default=0,
+                        help="额外加入的随机关键词数，用于测试大量关键词时的匹配耗时")
+    parser.add_argument('--no-startup', action='store_true', help="不测量启动耗时")
+    parser.add_argument('--config', default=None, help="使用的配置文件（默认config.json，不存在时用默认配置）")
+    parser.add_argument('--archive', default=None, help="保留合成帧的存档，可用--replay回放")
+    parser.add_argument('--output', default='benchmark_results.json', help="结果JSON文件（默认benchmark_results.json）")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """运行基准测试并写入JSON结果"""
+    from monitor_engine import MonitorEngine, CONFIG_FILE
+
+    args = parse_args(argv)
+    engine = MonitorEngine(log_callback=lambda message, level='info': print(message))
+    engine.load_config(args.config or CONFIG_FILE)
+
+    generator = ChatFrameGenerator(engine.regions[0].cities, args.width, args.height, args.rate,
+                                   args.city_ratio, args.scroll, seed=args.seed)
+
+    # 匹配器使用的关键词（合成消息里仍只出现原有城市）
+    if args.fuzzy or args.extra_keywords:
+        cities = list(engine.config['cities'])
+        rng = random.Random(args.seed)
+        cities += [''.join(chr(rng.randint(0x4E00, 0x9FA5)) for _ in range(rng.randint(2, 5)))
+                   for _ in range(args.extra_keywords)]
+        engine.apply_config({'cities': cities, 'regions': [],
+                             'fuzzy_match': args.fuzzy or engine.config.get('fuzzy_match', False)})
+    if generator.font_path is None:
+        print("未找到中文字体，合成画面中的文字无法正常显示")
+
+    try:
+        result = run_benchmark(engine, generator, args.frames, not args.no_ocr, args.archive)
+    finally:
+        engine.close()
+
+    if not args.no_startup:
+        try:
+            result['startup'] = measure_startup()
+        except Exception as e:
+            print(f"测量启动耗时失败: {str(e)}")
+
+    result.update({
+        'time': datetime.now().isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'font': generator.font_path,
+        'params': {'width': args.width, 'height': args.height, 'rate': args.rate,
+                   'city_ratio': args.city_ratio, 'scroll': args.scroll, 'seed': args.seed,
+                   'tile_size': engine.config.get('tile_size'),
+                   'fuzzy_match': engine.config.get('fuzzy_match'),
+                   'keywords': len(engine.regions[0].cities),
+                   'preprocess_scale': engine.config.get('preprocess_scale')},
+    })
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+
+    for stage in STAGES:
+        stats = result['stages'][stage]
+        if stats['count']:
+            print(f"{stage:>10}: {stats['count']:>5}次  {stats['throughput_per_s']:>9}/s  "
+                  f"p50 {stats['p50_ms']:.2f}ms  p99 {stats['p99_ms']:.2f}ms")
+    startup = result.get('startup')
+    if startup:
+        print(f"   startup: 解释器 {startup['interpreter_ms']}ms  创建引擎 {startup['engine_ready_ms']}ms")
+        for module, stats in startup['modules'].items():
+            heaviest = ', '.join(f"{item['module']} {item['ms']}ms" for item in stats['top_imports'][:3])
+            print(f"{'':>12}导入{module} {stats['import_ms']}ms（进程共 {stats['wall_ms']}ms）  最慢: {heaviest}")
+    print(f"结果已保存到 {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+
+import numpy as np
+
+# 气泡分类
+MESSAGE = 'message'  # 他人的消息气泡
+OWN = 'own'  # 自己发送的绿色气泡
+AVATAR = 'avatar'  # 头像
+CHROME = 'chrome'  # 直接画在背景上的时间、昵称、系统提示等
+
+
+def background_color(frame, step=4):
+    """画面中出现最多的颜色作为背景色（抽样统计）"""
+    sample = frame[::step, ::step].reshape(-1, 3).astype(np.int32)
+    packed = (sample[:, 0] << 16) | (sample[:, 1] << 8) | sample[:, 2]
+    values, counts = np.unique(packed, return_counts=True)
+    color = int(values[counts.argmax()])
+    return np.array([color >> 16, (color >> 8) & 255, color & 255], dtype=np.int16)
+
+
+def foreground_mask(frame, background, threshold):
+    """与背景色任一通道相差超过threshold的像素（逐通道在uint8上比较，避免整幅图转换类型）"""
+    low = np.clip(background - threshold, 0, 255).astype(np.uint8)
+    high = np.clip(background + threshold, 0, 255).astype(np.uint8)
+    mask = np.zeros(frame.shape[:2], dtype=bool)
+    for channel in range(3):
+        values = frame[:, :, channel]
+        mask |= (values < low[channel]) | (values > high[channel])
+    return mask
+
+
+def _runs(profile, min_gap):
+    """投影中非空的连续区间[(起, 止)]，间隔不超过min_gap的区间合并"""
+    index = np.flatnonzero(profile)
+    if not len(index):
+        return []
+    breaks = np.flatnonzero(np.diff(index) > min_gap)
+    starts = index[np.r_[0, breaks + 1]]
+    ends = index[np.r_[breaks, len(index) - 1]] + 1
+    return list(zip(starts.tolist(), ends.tolist()))
+
+
+def _xy_cut(mask, box, min_gap, depth=0):
+    """
+    递归XY切分：沿背景行/列把前景切成互不相连的矩形块
+    聊天界面的气泡、头像、时间都是被背景隔开的矩形，切到无法再切即为一个连通块
+    """
+    left, top, right, bottom = box
+    for axis in (1, 0):
+        sub = mask[top:bottom, left:right]
+        runs = _runs(sub.any(axis=axis), min_gap)
+        if not runs:
+            return []
+        if axis == 1:
+            boxes = [(left, top + start, right, top + end) for start, end in runs]
+        else:
+            boxes = [(left + start, top, left + end, bottom) for start, end in runs]
+
+        if len(boxes) > 1 and depth < 8:
+            result = []
+            for part in boxes:
+                result += _xy_cut(mask, part, min_gap, depth + 1)
+            return result
+        left, top, right, bottom = boxes[0]  # 收紧到前景范围
+    return [(left, top, right, bottom)]
+
+
+def classify(frame, box, background):
+    """判断一个矩形块的类型"""
+    left, top, right, bottom = box
+    width = right - left
+    height = bottom - top
+    frame_width = frame.shape[1]
+
+    # 头像：贴近左右边缘的近似正方形
+    near_edge = left < frame_width * 0.08 or right > frame_width * 0.92
+    if near_edge and 0.75 <= width / height <= 1.33:
+        return AVATAR
+
+    fill = np.median(frame[top:bottom:2, left:right:2].reshape(-1, 3), axis=0)
+    if np.abs(fill - background).max() <= 6:
+        return CHROME
+    if fill[1] - max(fill[0], fill[2]) > 40:
+        return OWN
+    return MESSAGE
+
+
+def segment(image, min_gap=3, min_size=12, threshold=6):
+    """
+    按颜色和连通块分析聊天画面，返回[(区域(left, top, right, bottom), 类型)]
+    与背景色相差超过threshold的像素为前景
+    """
+    frame = np.asarray(image.convert('RGB'))
+    background = background_color(frame)
+    mask = foreground_mask(frame, background, threshold)
+
+    blocks = []
+    for box in _xy_cut(mask, (0, 0, frame.shape[1], frame.shape[0]), min_gap):
+        if box[2] - box[0] < min_size or box[3] - box[1] < min_size:
+            continue
+        blocks.append((box, classify(frame, box, background)))
+    return blocks
+
+
+def overlaps(box_a, box_b):
+    """两个区域是否相交"""
+    return (box_a[0] < box_b[2] and box_b[0] < box_a[2]
+            and box_a[1] < box_b[3] and box_b[1] < box_a[3])
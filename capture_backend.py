@@ -0,0 +1,460 @@
+
+import ctypes
+import ctypes.util
+import io
+import os
+import sys
+import threading
+import zipfile
+from PIL import Image
+from frame_archive import FrameArchiveReader, is_frame_archive
+
+IMAGE_EXTENSIONS = ('.png', '.bmp', '.jpg', '.jpeg')
+
+
+class PyautoguiCapture:
+    """pyautogui截图（兼容性最好，速度最慢，作为兜底方案）"""
+    name = 'pyautogui'
+
+    def __init__(self):
+        import pyautogui
+        self.pyautogui = pyautogui
+
+    def grab(self, region, name=None):
+        """截取区域(x, y, 宽, 高)，返回PIL图像（区域名称只用于回放）"""
+        return self.pyautogui.screenshot(region=tuple(region))
+
+    def close(self):
+        """释放资源"""
+        pass
+
+
+class XImage(ctypes.Structure):
+    """Xlib的XImage结构（只用到前面的字段）"""
+    _fields_ = [
+        ('width', ctypes.c_int),
+        ('height', ctypes.c_int),
+        ('xoffset', ctypes.c_int),
+        ('format', ctypes.c_int),
+        ('data', ctypes.c_void_p),
+        ('byte_order', ctypes.c_int),
+        ('bitmap_unit', ctypes.c_int),
+        ('bitmap_bit_order', ctypes.c_int),
+        ('bitmap_pad', ctypes.c_int),
+        ('depth', ctypes.c_int),
+        ('bytes_per_line', ctypes.c_int),
+        ('bits_per_pixel', ctypes.c_int),
+        ('red_mask', ctypes.c_ulong),
+        ('green_mask', ctypes.c_ulong),
+        ('blue_mask', ctypes.c_ulong),
+        ('obdata', ctypes.c_void_p),
+    ]
+
+
+class XShmSegmentInfo(ctypes.Structure):
+    """MIT-SHM共享内存段信息"""
+    _fields_ = [
+        ('shmseg', ctypes.c_ulong),
+        ('shmid', ctypes.c_int),
+        ('shmaddr', ctypes.c_void_p),
+        ('readOnly', ctypes.c_int),
+    ]
+
+
+class XErrorEvent(ctypes.Structure):
+    """Xlib的XErrorEvent结构"""
+    _fields_ = [
+        ('type', ctypes.c_int),
+        ('display', ctypes.c_void_p),
+        ('resourceid', ctypes.c_ulong),
+        ('serial', ctypes.c_ulong),
+        ('error_code', ctypes.c_ubyte),
+        ('request_code', ctypes.c_ubyte),
+        ('minor_code', ctypes.c_ubyte),
+    ]
+
+
+X_ERROR_HANDLER = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_void_p, ctypes.POINTER(XErrorEvent))
+
+ZPIXMAP = 2
+IPC_PRIVATE = 0
+IPC_CREAT = 0o1000
+IPC_RMID = 0
+ALL_PLANES = ctypes.c_ulong(-1)
+SHMAT_FAILED = ctypes.c_void_p(-1).value
+
+
+class X11ShmCapture:
+    """
+    X11共享内存截图（MIT-SHM扩展）：X服务器直接把像素写入共享内存，省去套接字传输和进程启动
+    共享内存段按区域尺寸缓存复用，可在Xvfb下运行；共享内存不可用时释放内存段并改用pyautogui
+    """
+    name = 'x11shm'
+
+    def __init__(self, display_name=None, log=None):
+        self.xlib = ctypes.CDLL(ctypes.util.find_library('X11') or 'libX11.so.6')
+        self.xext = ctypes.CDLL(ctypes.util.find_library('Xext') or 'libXext.so.6')
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self._declare_functions()
+        self.log = log
+        self.fallback = None
+
+        name = display_name.encode('utf-8') if display_name else None
+        self.display = self.xlib.XOpenDisplay(name)
+        if not self.display:
+            raise OSError("无法连接X服务器，请检查DISPLAY环境变量")
+        if not self.xext.XShmQueryExtension(self.display):
+            self.xlib.XCloseDisplay(self.display)
+            raise OSError("X服务器不支持MIT-SHM扩展")
+
+        # Xlib默认的错误处理函数会直接退出进程，改为记下错误码，由调用方检查后抛出异常
+        self.x_error = None
+        self._error_handler = X_ERROR_HANDLER(self._on_x_error)
+        self._previous_handler = self.xlib.XSetErrorHandler(
+            ctypes.cast(self._error_handler, ctypes.c_void_p))
+
+        screen = self.xlib.XDefaultScreen(self.display)
+        self.root = self.xlib.XDefaultRootWindow(self.display)
+        self.visual = self.xlib.XDefaultVisual(self.display, screen)
+        self.depth = self.xlib.XDefaultDepth(self.display, screen)
+
+        self.size = None
+        self.ximage = None
+        self.shminfo = None
+        self.lock = threading.Lock()
+
+    def _declare_functions(self):
+        """声明C函数签名"""
+        xlib, xext, libc = self.xlib, self.xext, self.libc
+        xlib.XOpenDisplay.argtypes = [ctypes.c_char_p]
+        xlib.XOpenDisplay.restype = ctypes.c_void_p
+        xlib.XCloseDisplay.argtypes = [ctypes.c_void_p]
+        xlib.XDefaultScreen.argtypes = [ctypes.c_void_p]
+        xlib.XDefaultRootWindow.argtypes = [ctypes.c_void_p]
+        xlib.XDefaultRootWindow.restype = ctypes.c_ulong
+        xlib.XDefaultVisual.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        xlib.XDefaultVisual.restype = ctypes.c_void_p
+        xlib.XDefaultDepth.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        xlib.XSync.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        xlib.XFree.argtypes = [ctypes.c_void_p]
+        xlib.XSetErrorHandler.argtypes = [ctypes.c_void_p]
+        xlib.XSetErrorHandler.restype = ctypes.c_void_p
+        xlib.XGetGeometry.argtypes = [ctypes.c_void_p, ctypes.c_ulong, ctypes.POINTER(ctypes.c_ulong),
+                                      ctypes.POINTER(ctypes.c_int), ctypes.POINTER(ctypes.c_int),
+                                      ctypes.POINTER(ctypes.c_uint), ctypes.POINTER(ctypes.c_uint),
+                                      ctypes.POINTER(ctypes.c_uint), ctypes.POINTER(ctypes.c_uint)]
+
+        xext.XShmQueryExtension.argtypes = [ctypes.c_void_p]
+        xext.XShmCreateImage.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int,
+                                         ctypes.c_char_p, ctypes.POINTER(XShmSegmentInfo),
+                                         ctypes.c_uint, ctypes.c_uint]
+        xext.XShmCreateImage.restype = ctypes.POINTER(XImage)
+        xext.XShmAttach.argtypes = [ctypes.c_void_p, ctypes.POINTER(XShmSegmentInfo)]
+        xext.XShmDetach.argtypes = [ctypes.c_void_p, ctypes.POINTER(XShmSegmentInfo)]
+        xext.XShmGetImage.argtypes = [ctypes.c_void_p, ctypes.c_ulong, ctypes.POINTER(XImage),
+                                      ctypes.c_int, ctypes.c_int, ctypes.c_ulong]
+
+        libc.shmget.argtypes = [ctypes.c_int, ctypes.c_size_t, ctypes.c_int]
+        libc.shmat.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_int]
+        libc.shmat.restype = ctypes.c_void_p
+        libc.shmdt.argtypes = [ctypes.c_void_p]
+        libc.shmctl.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_void_p]
+
+    def _on_x_error(self, display, event):
+        """X错误处理函数：只记下错误码，不退出进程"""
+        self.x_error = event.contents.error_code
+        return 0
+
+    def _check_x_error(self, action):
+        """等X服务器处理完已发出的请求，期间出现X错误时抛出OSError"""
+        self.xlib.XSync(self.display, 0)
+        code, self.x_error = self.x_error, None
+        if code is not None:
+            raise OSError(f"{action}失败（X错误码{code}）")
+
+    def screen_size(self):
+        """根窗口（整个屏幕）的宽和高"""
+        root = ctypes.c_ulong()
+        x, y = ctypes.c_int(), ctypes.c_int()
+        width, height, border, depth = (ctypes.c_uint() for _ in range(4))
+        self.xlib.XGetGeometry(self.display, self.root, ctypes.byref(root), ctypes.byref(x),
+                               ctypes.byref(y), ctypes.byref(width), ctypes.byref(height),
+                               ctypes.byref(border), ctypes.byref(depth))
+        return width.value, height.value
+
+    def _allocate(self, width, height):
+        """按区域尺寸创建共享内存图像，失败时释放已创建的部分并抛出OSError"""
+        self._release()
+
+        shminfo = XShmSegmentInfo()
+        ximage = self.xext.XShmCreateImage(self.display, self.visual, self.depth, ZPIXMAP,
+                                           None, ctypes.byref(shminfo), width, height)
+        if not ximage:
+            raise OSError("创建共享内存图像失败")
+
+        shminfo.shmid = -1
+        shminfo.shmaddr = None
+        try:
+            if ximage.contents.bits_per_pixel != 32:
+                raise OSError(f"不支持的像素格式: {ximage.contents.bits_per_pixel}位")
+
+            size = ximage.contents.bytes_per_line * height
+            shminfo.shmid = self.libc.shmget(IPC_PRIVATE, size, IPC_CREAT | 0o600)
+            if shminfo.shmid < 0:
+                raise OSError(ctypes.get_errno(), "shmget失败")
+            address = self.libc.shmat(shminfo.shmid, None, 0)
+            if address is None or address == SHMAT_FAILED:
+                raise OSError(ctypes.get_errno(), "shmat失败")
+            shminfo.shmaddr = address
+            shminfo.readOnly = 0
+            ximage.contents.data = address
+
+            if not self.xext.XShmAttach(self.display, ctypes.byref(shminfo)):
+                raise OSError("XShmAttach失败")
+            self._check_x_error("XShmAttach")
+        except Exception:
+            ximage.contents.data = None
+            self.xlib.XFree(ximage)
+            if shminfo.shmaddr:
+                self.libc.shmdt(shminfo.shmaddr)
+            if shminfo.shmid >= 0:
+                self.libc.shmctl(shminfo.shmid, IPC_RMID, None)
+            raise
+
+        # 双方都挂载后立即标记删除，进程退出时系统自动回收
+        self.libc.shmctl(shminfo.shmid, IPC_RMID, None)
+
+        self.ximage = ximage
+        self.shminfo = shminfo
+        self.size = (width, height)
+
+    def _release(self):
+        """释放共享内存图像"""
+        if self.ximage is None:
+            return
+        self.xext.XShmDetach(self.display, ctypes.byref(self.shminfo))
+        self.xlib.XSync(self.display, 0)
+        self.x_error = None
+        # data指向共享内存，不能交给Xlib释放
+        self.ximage.contents.data = None
+        self.ximage.contents.obdata = None
+        self.xlib.XFree(self.ximage)
+        self.libc.shmdt(self.shminfo.shmaddr)
+        self.ximage = None
+        self.shminfo = None
+        self.size = None
+
+    def grab(self, region, name=None):
+        """截取区域(x, y, 宽, 高)，返回PIL图像（区域名称只用于回放）"""
+        x, y, width, height = region
+        with self.lock:
+            if self.fallback is None:
+                screen_width, screen_height = self.screen_size()
+                if x < 0 or y < 0 or x + width > screen_width or y + height > screen_height:
+                    raise ValueError(f"截图区域超出屏幕（{screen_width}x{screen_height}）")
+                try:
+                    if self.size != (width, height):
+                        self._allocate(width, height)
+                    if not self.xext.XShmGetImage(self.display, self.root, self.ximage, x, y,
+                                                  ALL_PLANES):
+                        raise OSError("XShmGetImage失败")
+                    self._check_x_error("XShmGetImage")
+
+                    stride = self.ximage.contents.bytes_per_line
+                    data = ctypes.string_at(self.shminfo.shmaddr, stride * height)
+                    return Image.frombuffer('RGB', (width, height), data, 'raw', 'BGRX', stride, 1)
+                except OSError as e:
+                    self._switch_to_fallback(e)
+        return self.fallback.grab(region)
+
+    def _switch_to_fallback(self, error):
+        """共享内存截图出错：释放内存段，之后改用pyautogui截图（调用方需持有锁）"""
+        self._release()
+        self.fallback = PyautoguiCapture()
+        self.name = f"{self.fallback.name}（X11共享内存不可用）"
+        if self.log:
+            self.log(f"X11共享内存截图出错，改用pyautogui: {str(error)}", 'warning')
+
+    def close(self):
+        """释放资源"""
+        with self.lock:
+            if self.display:
+                self._release()
+                self.xlib.XCloseDisplay(self.display)
+                self.display = None
+                self.xlib.XSetErrorHandler(self._previous_handler)
+
+
+def replay_source_region(name, regions):
+    """
+    监控区域name回放回放源中的哪个区域：同名的区域优先，其次是未分区域的帧（''），
+    回放源只有一个区域时所有监控区域都回放它（各自独立播放，互不影响）
+    """
+    if name in regions:
+        return name
+    if '' in regions:
+        return ''
+    if len(regions) == 1:
+        return next(iter(regions))
+    raise ValueError(f"回放源中没有区域“{name}”的帧（已录制: {', '.join(sorted(regions))}）")
+
+
+class ReplayStream:
+    """回放中一个监控区域的播放进度：source为回放源中的区域，items为各帧（文件名或时间戳）"""
+    def __init__(self, source, items):
+        self.source = source
+        self.items = items
+        self.position = 0
+        self.frames = None
+        self.last_frame = None
+        self.finished = False
+
+
+class ReplayCapture:
+    """
+    回放截图：按文件名顺序读取目录或zip压缩包中的图片，用于离线复现和压测
+    与监控区域同名的子目录只回放给该区域，顶层的图片回放给其他区域，每个区域独立播放
+    """
+    name = 'replay'
+
+    def __init__(self, source, loop=False):
+        if not source:
+            raise ValueError("回放模式需要设置replay_source")
+
+        self.source = source
+        self.loop = loop
+        self.streams = {}
+        self.finished = False
+        self.lock = threading.Lock()
+
+        if os.path.isdir(source):
+            self.archive = None
+            names = []
+            for entry in os.scandir(source):
+                if entry.is_dir():
+                    names += [f"{entry.name}/{name}" for name in os.listdir(entry.path)]
+                else:
+                    names.append(entry.name)
+        elif zipfile.is_zipfile(source):
+            self.archive = zipfile.ZipFile(source)
+            names = self.archive.namelist()
+        else:
+            raise ValueError(f"无法识别的回放源: {source}")
+
+        # 按区域（子目录名，顶层为''）分组
+        self.groups = {}
+        for name in sorted(names):
+            folder, _, filename = name.rpartition('/')
+            if filename.lower().endswith(IMAGE_EXTENSIONS) and '/' not in folder:
+                self.groups.setdefault(folder, []).append(name)
+
+        if not self.groups:
+            raise ValueError(f"回放源中没有图片: {source}")
+
+    def _read(self, name):
+        """读取一帧"""
+        if self.archive is None:
+            image = Image.open(os.path.join(self.source, *name.split('/')))
+        else:
+            image = Image.open(io.BytesIO(self.archive.read(name)))
+        return image.convert('RGB')
+
+    def grab(self, region=None, name=None):
+        """返回监控区域name的下一帧，播放完毕后循环或一直返回最后一帧（截图范围被忽略）"""
+        with self.lock:
+            stream = self.streams.get(name)
+            if stream is None:
+                source = replay_source_region(name, self.groups)
+                stream = self.streams[name] = ReplayStream(source, self.groups[source])
+
+            if stream.position >= len(stream.items):
+                if not self.loop:
+                    stream.finished = True
+                    self.finished = all(s.finished for s in self.streams.values())
+                    return stream.last_frame
+                stream.position = 0
+
+            stream.last_frame = self._read(stream.items[stream.position])
+            stream.position += 1
+            return stream.last_frame
+
+    def close(self):
+        """释放资源"""
+        if self.archive is not None:
+            self.archive.close()
+
+
+class ArchiveCapture:
+    """
+    帧存档回放：内存映射录制的存档，每个监控区域按录制顺序回放存档中同名区域的帧
+    speed为回放倍速（按录制时间戳控制间隔），0表示不等待、尽快回放
+    """
+    name = 'archive'
+
+    def __init__(self, path, loop=False, speed=0):
+        self.reader = FrameArchiveReader(path)
+        if not len(self.reader):
+            self.reader.close()
+            raise ValueError(f"存档中没有帧: {path}")
+
+        self.loop = loop
+        self.speed = speed
+        self.timestamps = self.reader.frame_timestamps()
+        self.streams = {}
+        self.clock = None  # 最近回放的一帧的录制时间
+        self.finished = False
+        self.lock = threading.Lock()
+
+    def grab(self, region=None, name=None):
+        """返回监控区域name的下一帧，播放完毕后循环或一直返回最后一帧（截图范围被忽略）"""
+        with self.lock:
+            stream = self.streams.get(name)
+            if stream is None:
+                source = replay_source_region(name, self.timestamps)
+                stream = self.streams[name] = ReplayStream(source, self.timestamps[source])
+
+            if stream.position >= len(stream.items):
+                if not self.loop:
+                    stream.finished = True
+                    self.finished = all(s.finished for s in self.streams.values())
+                    return stream.last_frame
+                stream.frames = None
+                stream.position = 0
+
+            if stream.frames is None:
+                stream.frames = self.reader.iter_frames(stream.source)
+            _, _, stream.last_frame = next(stream.frames)
+            self.clock = stream.items[stream.position]
+            stream.position += 1
+            return stream.last_frame
+
+    def replay_delay(self):
+        """到下一帧的等待时间（秒），按录制间隔和倍速计算"""
+        upcoming = [stream.items[stream.position] for stream in self.streams.values()
+                    if stream.position < len(stream.items)]
+        if not self.speed or self.clock is None or not upcoming:
+            return 0
+        return max(0.0, min(upcoming) - self.clock) / self.speed
+
+    def close(self):
+        """释放资源"""
+        self.reader.close()
+
+
+def create_capture_backend(name='auto', replay_source='', replay_loop=False, replay_speed=0,
+                           log=None):
+    """创建截图后端，auto模式下Linux优先X11共享内存，失败时回退到pyautogui"""
+    if name == 'replay':
+        if is_frame_archive(replay_source):
+            return ArchiveCapture(replay_source, replay_loop, replay_speed)
+        return ReplayCapture(replay_source, replay_loop)
+
+    if name == 'x11shm' or (name == 'auto' and sys.platform.startswith('linux')
+                            and os.environ.get('DISPLAY')):
+        try:
+            return X11ShmCapture(log=log)
+        except Exception as e:
+            if log:
+                log(f"X11共享内存截图不可用，改用pyautogui: {str(e)}", 'warning')
+
+    return PyautoguiCapture()
@@ -0,0 +1,141 @@
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+
+# inotify事件（见 man 7 inotify）
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+EVENT_HEADER = struct.Struct('iIII')
+
+
+def _open_inotify(directory):
+    """创建监视directory的inotify句柄，不支持时返回None"""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            return None
+        if libc.inotify_add_watch(fd, os.fsencode(directory), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+            os.close(fd)
+            return None
+        return fd
+    except (OSError, AttributeError):
+        return None
+
+
+def file_signature(path):
+    """文件的(修改时间, 大小, inode)，不存在时返回None"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
+class ConfigWatcher:
+    """
+    监视配置文件变化：Linux上用inotify监视所在目录（编辑器常写临时文件后改名替换原文件），
+    其他平台或inotify不可用时每interval秒检查一次修改时间和大小；
+    文件稳定settle秒后在监视线程中调用on_change(path)
+    """
+    def __init__(self, path, on_change, interval=1.0, settle=0.2, log=None):
+        self.path = os.path.abspath(path)
+        self.on_change = on_change
+        self.interval = interval
+        self.settle = settle
+        self.log = log
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.mode = None
+
+        self.inotify_fd = _open_inotify(os.path.dirname(self.path))
+        self.wake_read, self.wake_write = os.pipe() if self.inotify_fd is not None else (None, None)
+
+    def start(self):
+        """启动监视线程"""
+        self.mode = 'inotify' if self.inotify_fd is not None else 'poll'
+        self.thread = threading.Thread(target=self.run, name='config-watch', daemon=True)
+        self.thread.start()
+
+    def run(self):
+        """监视线程"""
+        if self.inotify_fd is not None:
+            self.run_inotify()
+        else:
+            self.run_poll()
+
+    def run_inotify(self):
+        """等待inotify事件，只关心目标文件（写完关闭或改名到该位置）"""
+        name = os.fsencode(os.path.basename(self.path))
+        while not self.stop_event.is_set():
+            readable, _, _ = select.select([self.inotify_fd, self.wake_read], [], [])
+            if self.stop_event.is_set():
+                return
+            if self.inotify_fd in readable and name in self.read_events():
+                # 短时间内的多次写入合并为一次
+                while not self.stop_event.wait(self.settle):
+                    if name not in self.read_events():
+                        break
+                self.notify()
+
+    def read_events(self):
+        """读出所有待处理的事件，返回涉及的文件名集合"""
+        names = set()
+        while True:
+            try:
+                data = os.read(self.inotify_fd, 4096)
+            except BlockingIOError:
+                return names
+            offset = 0
+            while offset + EVENT_HEADER.size <= len(data):
+                _, _, _, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                names.add(data[offset:offset + length].rstrip(b'\0'))
+                offset += length
+
+    def run_poll(self):
+        """定时检查修改时间和大小，变化后等文件稳定再通知"""
+        signature = file_signature(self.path)
+        while not self.stop_event.wait(self.interval):
+            current = file_signature(self.path)
+            if current == signature:
+                continue
+            while not self.stop_event.wait(self.settle):
+                latest = file_signature(self.path)
+                if latest == current:
+                    break
+                current = latest
+            signature = current
+            if current is not None:
+                self.notify()
+
+    def notify(self):
+        """调用回调，回调出错不影响继续监视"""
+        if self.stop_event.is_set():
+            return
+        try:
+            self.on_change(self.path)
+        except Exception as e:
+            if self.log:
+                self.log(f"处理配置文件变化失败: {str(e)}", 'error')
+
+    def close(self):
+        """停止监视并释放句柄"""
+        self.stop_event.set()
+        if self.wake_write is not None:
+            os.write(self.wake_write, b'\0')
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join(2)
+        for fd in (self.inotify_fd, self.wake_read, self.wake_write):
+            if fd is not None:
+                os.close(fd)
+        self.inotify_fd = self.wake_read = self.wake_write = None
@@ -0,0 +1,110 @@
+
+import hashlib
+import os
+import struct
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+# 每条记录的大致内存占用：OrderedDict节点 + int摘要 + float时间戳
+ENTRY_BYTES = 104 + sys.getsizeof(2 ** 63) + sys.getsizeof(0.0)
+
+_RECORD = struct.Struct('<Qd')
+
+
+def message_digest(text):
+    """稳定的64位消息摘要（不受Python字符串哈希随机化影响，可持久化/共享）"""
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+class DedupStore:
+    """有界去重记录：LRU容量上限 + TTL过期，查询和插入均为O(1)"""
+    def __init__(self, max_entries=50000, ttl=86400):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.evicted = 0
+        self.expired = 0
+
+    def configure(self, max_entries, ttl):
+        """调整容量和过期时间，保留现有记录"""
+        with self.lock:
+            self.max_entries = max_entries
+            self.ttl = ttl
+            self._evict(time.time())
+
+    def seen(self, text):
+        """检查消息是否已处理过；未处理过则记录下来并返回False"""
+        digest = message_digest(text)
+        now = time.time()
+
+        with self.lock:
+            self._evict(now)
+            if digest in self.entries:
+                self.entries.move_to_end(digest)
+                self.entries[digest] = now
+                return True
+
+            self.entries[digest] = now
+            self._evict(now)
+            return False
+
+    def _evict(self, now):
+        """淘汰过期记录和超出容量的最久未用记录（记录按最近使用时间排列）"""
+        entries = self.entries
+        if self.ttl:
+            deadline = now - self.ttl
+            while entries:
+                digest, last_seen = next(iter(entries.items()))
+                if last_seen >= deadline:
+                    break
+                entries.popitem(last=False)
+                self.expired += 1
+
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+            self.evicted += 1
+
+    def clear(self):
+        """清空记录"""
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        """记录数、淘汰数和估算内存占用"""
+        with self.lock:
+            count = len(self.entries)
+            return {
+                'entries': count,
+                'max_entries': self.max_entries,
+                'evicted': self.evicted,
+                'expired': self.expired,
+                'memory_kb': round(count * ENTRY_BYTES / 1024, 1),
+            }
+
+    def save(self, path):
+        """保存到文件（每条记录16字节：摘要 + 最后出现时间）"""
+        with self.lock:
+            data = b''.join(_RECORD.pack(digest, last_seen)
+                            for digest, last_seen in self.entries.items())
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def load(self, path):
+        """从文件加载记录，返回加载条数"""
+        if not os.path.exists(path):
+            return 0
+
+        with open(path, 'rb') as f:
+            data = f.read()
+
+        with self.lock:
+            for digest, last_seen in _RECORD.iter_unpack(data[:len(data) - len(data) % _RECORD.size]):
+                self.entries[digest] = last_seen
+                self.entries.move_to_end(digest)
+            self._evict(time.time())
+            return len(self.entries)
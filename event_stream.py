@@ -0,0 +1,136 @@
+
+import json
+import os
+import stat
+import sys
+import threading
+import time
+from collections import deque
+
+
+class JsonLinesWriter:
+    """
+    检测事件输出：每个事件一行JSON（JSON Lines），写到标准输出('-')或文件/命名管道(FIFO)
+    普通文件以追加方式写入；fifo为True且路径不存在时创建命名管道（已是命名管道的路径直接使用）
+    emit()只把事件放入队列，由后台线程攒成小批量后一次写入并flush，不阻塞监控线程
+    命名管道的读取端断开后等待新的读取端，未写出的批次重新写入；队列满时丢弃最早的事件
+    """
+    def __init__(self, target='-', batch_size=64, flush_interval=0.05, maxsize=10000, log=None,
+                 fifo=False):
+        self.target = target
+        self.fifo = fifo
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.log = log
+
+        self.events = deque(maxlen=maxsize)
+        self.cond = threading.Condition()
+        self.closed = False
+        self.dropped = 0
+        self.written = 0
+        self.stream = None
+        self.thread = None
+
+    @property
+    def is_fifo(self):
+        """输出目标是否为命名管道"""
+        try:
+            return stat.S_ISFIFO(os.stat(self.target).st_mode)
+        except OSError:
+            return False
+
+    def start(self):
+        """启动写入线程（要求使用命名管道且路径不存在时创建）"""
+        if self.fifo and self.target != '-' and not os.path.exists(self.target):
+            if not hasattr(os, 'mkfifo'):
+                raise OSError("当前系统不支持命名管道")
+            os.mkfifo(self.target)
+        self.thread = threading.Thread(target=self.run, name='events', daemon=True)
+        self.thread.start()
+
+    def emit(self, event):
+        """放入一个事件（线程安全，不阻塞）"""
+        with self.cond:
+            if self.closed:
+                return
+            if len(self.events) == self.events.maxlen:
+                self.dropped += 1  # 读取端跟不上，最早的事件被覆盖
+            self.events.append(event)
+            # 第一个事件唤醒写入线程开始计时，攒够一批时立即写出
+            if len(self.events) == 1 or len(self.events) >= self.batch_size:
+                self.cond.notify()
+
+    def take_batch(self):
+        """等待事件，攒够batch_size个或等满flush_interval后取出；关闭且已写完时返回None"""
+        with self.cond:
+            while not self.events and not self.closed:
+                self.cond.wait()
+            if not self.events:
+                return None
+            if len(self.events) < self.batch_size and not self.closed:
+                self.cond.wait(self.flush_interval)
+            batch = [self.events.popleft() for _ in range(min(len(self.events), self.batch_size))]
+        return batch
+
+    def run(self):
+        """写入线程"""
+        while True:
+            batch = self.take_batch()
+            if batch is None:
+                break
+            data = ''.join(json.dumps(event, ensure_ascii=False, separators=(',', ':')) + '\n'
+                           for event in batch).encode('utf-8')
+            if not self.write(data):
+                break
+            self.written += len(batch)
+        self.close_stream()
+
+    def open_stream(self):
+        """打开输出（文件以追加方式打开，命名管道在有读取端之前会阻塞）"""
+        if self.target == '-':
+            return sys.stdout.buffer
+        return open(self.target, 'ab')
+
+    def write(self, data):
+        """写入一批并flush，返回是否可以继续输出"""
+        while True:
+            try:
+                if self.stream is None:
+                    self.stream = self.open_stream()
+                self.stream.write(data)
+                self.stream.flush()
+                return True
+            except BrokenPipeError:
+                self.close_stream()
+                if self.target == '-' or not self.is_fifo or self.closed:
+                    self.report("事件输出的读取端已关闭，停止输出", 'warning')
+                    return False
+                time.sleep(0.1)  # 等待新的读取端打开管道后重新写入本批
+            except Exception as e:
+                self.close_stream()
+                self.report(f"写入事件失败: {str(e)}", 'error')
+                return False
+
+    def close_stream(self):
+        """关闭输出（标准输出不关闭）"""
+        if self.stream is not None and self.stream is not sys.stdout.buffer:
+            try:
+                self.stream.close()
+            except OSError:
+                pass
+        self.stream = None
+
+    def report(self, message, level):
+        """通过日志回调报告问题"""
+        if self.log:
+            self.log(message, level)
+
+    def close(self, timeout=2):
+        """写完队列中剩余的事件后停止（最多等待timeout秒）"""
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join(timeout)
+        if self.dropped:
+            self.report(f"事件输出来不及写出，丢弃{self.dropped}个事件", 'warning')
@@ -0,0 +1,177 @@
+
+import json
+import mmap
+import struct
+import threading
+import zlib
+import numpy as np
+from PIL import Image
+
+MAGIC = b'WDFA\x01'
+
+# 记录头：类型、时间戳、元数据长度、数据长度
+_RECORD = struct.Struct('<BdII')
+KIND_FRAME = 1
+KIND_RESULT = 2
+
+
+def is_frame_archive(path):
+    """判断文件是否为帧存档"""
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+class FrameArchiveWriter:
+    """
+    会话录制：把截图帧写入紧凑存档，供离线回放
+    每帧与同一区域的上一帧按字节异或后zlib压缩（聊天画面大部分不变，异或后几乎全是0）
+    每隔keyframe_interval帧写一个完整关键帧，同时记录每次识别/匹配的结果
+    """
+    def __init__(self, path, keyframe_interval=100, compress_level=1):
+        self.path = path
+        self.keyframe_interval = keyframe_interval
+        self.compress_level = compress_level
+        self.previous = {}
+        self.frame_count = {}
+        self.bytes_written = len(MAGIC)
+        self.raw_bytes = 0
+        self.lock = threading.Lock()
+
+        self.file = open(path, 'wb')
+        self.file.write(MAGIC)
+
+    def _write(self, kind, timestamp, meta, data=b''):
+        """写入一条记录（存档关闭后忽略）"""
+        if self.file.closed:
+            return
+        meta_bytes = json.dumps(meta, ensure_ascii=False).encode('utf-8')
+        record = _RECORD.pack(kind, timestamp, len(meta_bytes), len(data)) + meta_bytes + data
+        self.file.write(record)
+        self.bytes_written += len(record)
+
+    def write_frame(self, region, image, timestamp):
+        """写入一帧截图"""
+        frame = np.asarray(image.convert('RGB'))
+        with self.lock:
+            previous = self.previous.get(region)
+            count = self.frame_count.get(region, 0)
+            keyframe = (previous is None or previous.shape != frame.shape
+                        or count % self.keyframe_interval == 0)
+
+            payload = frame if keyframe else np.bitwise_xor(frame, previous)
+            data = zlib.compress(payload.tobytes(), self.compress_level)
+            meta = {'region': region, 'width': frame.shape[1], 'height': frame.shape[0],
+                    'key': keyframe}
+            self._write(KIND_FRAME, timestamp, meta, data)
+
+            self.previous[region] = frame
+            self.frame_count[region] = count + 1
+            self.raw_bytes += frame.nbytes
+
+    def write_result(self, region, timestamp, text, cities):
+        """写入一次识别和匹配结果"""
+        with self.lock:
+            self._write(KIND_RESULT, timestamp, {'region': region, 'text': text, 'cities': cities})
+
+    def stats(self):
+        """录制统计：帧数、存档大小和压缩比"""
+        with self.lock:
+            return {
+                'frames': sum(self.frame_count.values()),
+                'archive_kb': round(self.bytes_written / 1024, 1),
+                'ratio': round(self.raw_bytes / self.bytes_written, 1) if self.raw_bytes else 0,
+            }
+
+    def flush(self):
+        """刷新到磁盘"""
+        with self.lock:
+            self.file.flush()
+
+    def close(self):
+        """关闭存档"""
+        with self.lock:
+            if not self.file.closed:
+                self.file.close()
+
+
+class FrameArchiveReader:
+    """帧存档读取：内存映射文件，打开时只扫描记录头建立索引，按需解码"""
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.data[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"不是帧存档文件: {path}")
+
+        # 记录索引：(类型, 时间戳, 元数据起始, 元数据长度, 数据长度)
+        self.records = []
+        offset = len(MAGIC)
+        while offset + _RECORD.size <= len(self.data):
+            kind, timestamp, meta_len, data_len = _RECORD.unpack_from(self.data, offset)
+            start = offset + _RECORD.size
+            if start + meta_len + data_len > len(self.data):
+                break  # 录制中断导致的不完整记录
+            self.records.append((kind, timestamp, start, meta_len, data_len))
+            offset = start + meta_len + data_len
+
+        self.frame_indexes = [i for i, record in enumerate(self.records) if record[0] == KIND_FRAME]
+
+    def __len__(self):
+        return len(self.frame_indexes)
+
+    def _meta(self, record):
+        """解析记录的元数据"""
+        _, _, start, meta_len, _ = record
+        return json.loads(bytes(self.data[start:start + meta_len]).decode('utf-8'))
+
+    def iter_records(self, region=None):
+        """
+        按录制顺序返回('frame', 时间戳, 区域, 图像)或('result', 时间戳, 区域, 结果)
+        指定region时只返回该区域的记录（其他区域的帧不解码）
+        """
+        previous = {}
+        for record in self.records:
+            kind, timestamp, start, meta_len, data_len = record
+            meta = self._meta(record)
+            if region is not None and meta['region'] != region:
+                continue
+            if kind == KIND_RESULT:
+                yield 'result', timestamp, meta['region'], meta
+                continue
+
+            data_start = start + meta_len
+            raw = zlib.decompress(self.data[data_start:data_start + data_len])
+            frame = np.frombuffer(raw, dtype=np.uint8).reshape(meta['height'], meta['width'], 3)
+            if not meta['key']:
+                frame = np.bitwise_xor(frame, previous[meta['region']])
+            previous[meta['region']] = frame
+            yield 'frame', timestamp, meta['region'], Image.fromarray(frame)
+
+    def iter_frames(self, region=None):
+        """按录制顺序返回(时间戳, 区域, 图像)，指定region时只返回该区域的帧"""
+        for kind, timestamp, frame_region, item in self.iter_records(region):
+            if kind == 'frame':
+                yield timestamp, frame_region, item
+
+    def frame_timestamps(self):
+        """各区域的帧时间戳 {区域: [时间戳, ...]}（只解析元数据，不解码）"""
+        timestamps = {}
+        for index in self.frame_indexes:
+            record = self.records[index]
+            timestamps.setdefault(self._meta(record)['region'], []).append(record[1])
+        return timestamps
+
+    def results(self):
+        """录制时的识别/匹配结果列表"""
+        return [dict(self._meta(record), timestamp=record[1])
+                for record in self.records if record[0] == KIND_RESULT]
+
+    def close(self):
+        """关闭存档"""
+        if getattr(self, 'data', None) is not None:
+            self.data.close()
+            self.data = None
+        self.file.close()
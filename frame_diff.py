@@ -0,0 +1,161 @@
+
+import numpy as np
+
+
+_WEIGHTS_CACHE = {}
+
+
+def _get_weights(length):
+    """每个64位字位置对应的随机奇数权重（线性摘要，向量化计算）"""
+    weights = _WEIGHTS_CACHE.get(length)
+    if weights is None:
+        rng = np.random.default_rng(0x5EED)
+        weights = rng.integers(0, 2 ** 63, size=length, dtype=np.uint64)
+        weights = weights * np.uint64(2) + np.uint64(1)
+        _WEIGHTS_CACHE[length] = weights
+    return weights
+
+
+def row_signatures(frame):
+    """计算每一行像素的64位摘要，并标记纯色行（空白行不参与滚动估计）"""
+    frame = np.asarray(frame)
+    if frame.ndim == 2:
+        frame = frame[:, :, None]
+
+    height = frame.shape[0]
+    rows = np.ascontiguousarray(frame.astype(np.uint8, copy=False)).reshape(height, -1)
+    remainder = (-rows.shape[1]) % 8
+    if remainder:
+        rows = np.concatenate([rows, np.zeros((height, remainder), dtype=np.uint8)], axis=1)
+
+    words = rows.view(np.uint64)
+    signatures = words @ _get_weights(words.shape[1])
+    blank = (frame == frame[:, :1]).all(axis=(1, 2))
+    return signatures, blank
+
+
+def estimate_scroll(prev_signatures, cur_signatures, cur_blank, min_rows=8, min_ratio=0.5):
+    """
+    估计画面向上滚动的行数（行摘要投票）
+    返回(偏移量, 第一处不一致的行号)，找不到一致的偏移时返回None
+    """
+    height = len(cur_signatures)
+    if len(prev_signatures) != height:
+        return None
+
+    # 上一帧中每个摘要出现的行号
+    positions = {}
+    for index, signature in enumerate(prev_signatures.tolist()):
+        positions.setdefault(signature, []).append(index)
+
+    # 当前帧第i行与上一帧第j行相同，则投票给偏移j-i
+    votes = {}
+    for index in np.flatnonzero(~cur_blank).tolist():
+        for prev_index in positions.get(int(cur_signatures[index]), ()):
+            shift = prev_index - index
+            if shift > 0:
+                votes[shift] = votes.get(shift, 0) + 1
+
+    if not votes:
+        return None
+
+    shift = max(votes, key=votes.get)
+    overlap = height - shift
+    content_rows = int((~cur_blank[:overlap]).sum())
+    if votes[shift] < min_rows or votes[shift] < content_rows * min_ratio:
+        return None
+
+    # 重叠部分中与平移后上一帧不一致的第一行
+    mismatched = np.flatnonzero(cur_signatures[:overlap] != prev_signatures[shift:])
+    first_mismatch = int(mismatched[0]) if len(mismatched) else overlap
+    return shift, first_mismatch
+
+
+class TileDiffer:
+    """分块变化检测：把画面切成网格，逐块计算摘要，只返回变化块的包围框"""
+    def __init__(self, tile_size=32, padding=4, detect_scroll=True):
+        # 块边长取8的倍数，保证每块字节数能按64位字读取
+        self.tile_size = max(8, int(tile_size) // 8 * 8)
+        self.padding = padding
+        self.detect_scroll = detect_scroll
+        self.last_digests = None
+        self.last_rows = None
+        self.last_shape = None
+        self.last_scroll = 0
+
+    @property
+    def params(self):
+        """(块边长, 边距, 是否检测滚动)，参数相同的检测器才能互相替换"""
+        return self.tile_size, self.padding, self.detect_scroll
+
+    def reset(self):
+        """清空上一帧记录，下一帧按全帧变化处理"""
+        self.last_digests = None
+        self.last_rows = None
+        self.last_shape = None
+        self.last_scroll = 0
+
+    def digest(self, image):
+        """计算每个块的64位摘要，返回形状为(行块数, 列块数)的数组"""
+        frame = np.asarray(image)
+        if frame.ndim == 2:
+            frame = frame[:, :, None]
+
+        height, width, channels = frame.shape
+        size = self.tile_size
+        rows = -(-height // size)
+        cols = -(-width // size)
+
+        # 补齐到整块大小
+        if rows * size != height or cols * size != width:
+            padded = np.zeros((rows * size, cols * size, channels), dtype=frame.dtype)
+            padded[:height, :width] = frame
+            frame = padded
+
+        tiles = frame.astype(np.uint8, copy=False).reshape(rows, size, cols, size, channels)
+        tiles = np.ascontiguousarray(tiles.swapaxes(1, 2))
+        words = tiles.reshape(rows, cols, -1).view(np.uint64)
+        return words @ _get_weights(words.shape[-1])
+
+    def diff(self, image):
+        """与上一帧比较，返回变化区域(left, top, right, bottom)，无变化返回None"""
+        frame = np.asarray(image)
+        frame_shape = (image.height, image.width)
+        digests = self.digest(frame)
+        last_digests = self.last_digests
+        last_rows = self.last_rows
+        self.last_digests = digests
+        self.last_scroll = 0
+
+        # 首帧或尺寸变化时视为全帧变化
+        if last_digests is None or self.last_shape != frame_shape:
+            self.last_shape = frame_shape
+            self.last_rows = row_signatures(frame) if self.detect_scroll else None
+            return (0, 0, image.width, image.height)
+
+        changed = digests != last_digests
+        if not changed.any():
+            return None
+
+        rows = np.flatnonzero(changed.any(axis=1))
+
+        # 变化跨越多行块时，可能是新消息导致整体上滚，只识别底部新出现的部分
+        # （上一帧没有行摘要时无法估计滚动，按分块结果处理）
+        if self.detect_scroll and len(rows) > 1:
+            signatures, blank = row_signatures(frame)
+            self.last_rows = (signatures, blank)
+            scroll = estimate_scroll(last_rows[0], signatures, blank) if last_rows is not None else None
+            if scroll is not None:
+                self.last_scroll, first_mismatch = scroll
+                top = max(0, first_mismatch - self.padding)
+                return (0, int(top), image.width, image.height)
+        else:
+            self.last_rows = row_signatures(frame) if self.detect_scroll else None
+
+        cols = np.flatnonzero(changed.any(axis=0))
+        size = self.tile_size
+        left = max(0, cols[0] * size - self.padding)
+        top = max(0, rows[0] * size - self.padding)
+        right = min(image.width, (cols[-1] + 1) * size + self.padding)
+        bottom = min(image.height, (rows[-1] + 1) * size + self.padding)
+        return (int(left), int(top), int(right), int(bottom))
@@ -0,0 +1,227 @@
+
+from collections import deque
+
+# OCR常见的形近字，同一组内的字视为同一个字（不计入编辑距离）
+OCR_CONFUSIONS = [
+    '天夭', '大太犬', '津律', '沈沉', '州洲', '广厂', '南甫', '春眷', '连违', '庄压',
+    '岛鸟乌', '阳阴', '西酉', '京景', '安妥', '原厡', '宁亍', '杭抗', '深探', '温湿',
+    '已己巳', '未末', '土士', '入人', '日曰', '王玉', '贝见', '候侯', '戊戌戍', '代伐',
+    '免兔', '折拆', '刀力', '口囗', '〇0Oo', '1lI|',
+]
+
+
+def _build_normalize_table():
+    """形近字和全角字符映射到同一个字（一对一替换，不改变文本长度和位置）"""
+    table = {}
+    for group in OCR_CONFUSIONS:
+        for char in group[1:]:
+            table[ord(char)] = group[0]
+    for code in range(0xFF01, 0xFF5F):
+        char = chr(code - 0xFEE0)
+        table[code] = table.get(ord(char), char)
+    table[0x3000] = ' '
+    return table
+
+
+NORMALIZE_TABLE = _build_normalize_table()
+
+
+def normalize(text):
+    """归一化形近字和全角字符"""
+    return text.translate(NORMALIZE_TABLE)
+
+
+def allowed_distance(keyword, max_distance):
+    """
+    按关键词长度限制允许的编辑距离：2个字及以下只容忍形近字（否则一个字就能命中），
+    3-5个字最多1处，6个字及以上最多2处，且不超过max_distance
+    """
+    if len(keyword) <= 2:
+        return 0
+    return min(max_distance, 1 if len(keyword) <= 5 else 2)
+
+
+def split_pieces(keyword, count):
+    """把关键词尽量均分成count段，返回[(段, 段在关键词中的位置)]"""
+    size, extra = divmod(len(keyword), count)
+    pieces = []
+    start = 0
+    for index in range(count):
+        end = start + size + (1 if index < extra else 0)
+        pieces.append((keyword[start:end], start))
+        start = end
+    return pieces
+
+
+def substring_distance(pattern, text, limit):
+    """pattern与text中最接近的子串之间的编辑距离，超过limit时提前返回limit+1"""
+    previous = [0] * (len(text) + 1)
+    for i, char in enumerate(pattern, 1):
+        current = [i] * (len(text) + 1)
+        for j, other in enumerate(text, 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char != other))
+        # 每行最小值单调不减，已超过上限就不必再算
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return min(min(previous), limit + 1)
+
+
+class KeywordMatcher:
+    """Aho-Corasick多模式匹配：关键词编译一次，单次扫描找出所有命中及所在行"""
+    def __init__(self, keywords):
+        # 去重并保持原有顺序
+        self.keywords = list(dict.fromkeys(k for k in keywords if k))
+        self._build()
+
+    def _build(self):
+        """构建自动机（goto表、失败指针、输出表）"""
+        goto = [{}]
+        outputs = [[]]
+
+        for index, keyword in enumerate(self.keywords):
+            state = 0
+            for char in keyword:
+                next_state = goto[state].get(char)
+                if next_state is None:
+                    next_state = len(goto)
+                    goto[state][char] = next_state
+                    goto.append({})
+                    outputs.append([])
+                state = next_state
+            outputs[state].append(index)
+
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in goto[state].items():
+                queue.append(next_state)
+                fallback = fail[state]
+                while fallback and char not in goto[fallback]:
+                    fallback = fail[fallback]
+                fail[next_state] = goto[fallback].get(char, 0)
+                outputs[next_state] = outputs[next_state] + outputs[fail[next_state]]
+
+        self.goto = goto
+        self.fail = fail
+        self.outputs = outputs
+
+    def iter_matches(self, text):
+        """逐个返回(关键词序号, 行号)，关键词不跨行匹配"""
+        goto = self.goto
+        fail = self.fail
+        outputs = self.outputs
+        state = 0
+        line_index = 0
+
+        for char in text:
+            if char == '\n':
+                line_index += 1
+                state = 0
+                continue
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for index in outputs[state]:
+                yield index, line_index
+
+    def iter_ends(self, text):
+        """逐个返回(关键词序号, 结束位置)，结束位置为命中部分之后一个字符的下标"""
+        goto = self.goto
+        fail = self.fail
+        outputs = self.outputs
+        state = 0
+
+        for position, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for index in outputs[state]:
+                yield index, position + 1
+
+    def match_lines(self, text):
+        """
+        单次扫描文本，返回[(关键词, [所在行, ...]), ...]
+        按关键词列表顺序排列，每行只记录一次，行内容已去除首尾空白
+        """
+        if not self.keywords:
+            return []
+
+        hits = {}
+        for index, line_index in self.iter_matches(text):
+            hit_lines = hits.setdefault(index, [])
+            if not hit_lines or hit_lines[-1] != line_index:
+                hit_lines.append(line_index)
+
+        if not hits:
+            return []
+
+        lines = text.split('\n')
+        return [(self.keywords[index], [lines[i].strip() for i in hits[index]])
+                for index in sorted(hits)]
+
+
+class FuzzyMatcher:
+    """
+    容错匹配：OCR把城市名认错个别字时仍能命中
+    形近字先归一化（不计错），较长的关键词再允许少量编辑距离（见allowed_distance）
+    允许k处错误的关键词切成k+1段，至少有一段会原样出现；所有段编译成一个自动机作为索引，
+    只在某段命中的位置附近做有界编辑距离校验，耗时与关键词数量基本无关
+    """
+    def __init__(self, keywords, max_distance=1):
+        # 去重并保持原有顺序
+        self.keywords = list(dict.fromkeys(k for k in keywords if k))
+        self.max_distance = max_distance
+        self.normalized = [normalize(k) for k in self.keywords]
+        self.distances = [allowed_distance(k, max_distance) for k in self.normalized]
+
+        # 段 → [(关键词序号, 段在关键词中的位置)]
+        owners = {}
+        for index, (keyword, distance) in enumerate(zip(self.normalized, self.distances)):
+            for piece, offset in split_pieces(keyword, distance + 1):
+                owners.setdefault(piece, []).append((index, offset))
+        self.index = KeywordMatcher(owners)
+        self.owners = [owners[piece] for piece in self.index.keywords]
+
+    def match_line(self, line):
+        """一行（已归一化）文本中命中的关键词序号集合"""
+        found = set()
+        pieces = self.index.keywords
+        for piece_index, end in self.index.iter_ends(line):
+            for index, offset in self.owners[piece_index]:
+                if index in found:
+                    continue
+                distance = self.distances[index]
+                if not distance:
+                    # 不容错的关键词只有一段，即整个关键词原样出现
+                    found.add(index)
+                    continue
+
+                # 段之前最多有distance处增删，关键词必定落在这个窗口内
+                keyword = self.normalized[index]
+                start = end - len(pieces[piece_index]) - offset
+                window = line[max(0, start - distance):start + len(keyword) + distance]
+                if substring_distance(keyword, window, distance) <= distance:
+                    found.add(index)
+        return found
+
+    def match_lines(self, text):
+        """
+        逐行匹配，返回[(关键词, [所在行, ...]), ...]，格式与KeywordMatcher.match_lines相同
+        按关键词列表顺序排列，行内容为原文（未归一化）并去除首尾空白
+        """
+        if not self.keywords:
+            return []
+
+        hits = {}
+        for line_index, line in enumerate(normalize(text).split('\n')):
+            for index in self.match_line(line):
+                hits.setdefault(index, []).append(line_index)
+
+        if not hits:
+            return []
+
+        lines = text.split('\n')
+        return [(self.keywords[index], [lines[i].strip() for i in hits[index]])
+                for index in sorted(hits)]
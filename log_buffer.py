@@ -0,0 +1,44 @@
+
+import threading
+from collections import deque
+
+
+class LogBuffer:
+    """
+    界面日志缓冲：任意线程写入，界面线程定时批量取出
+    待显示的日志和已显示的日志都是固定容量的环形缓冲，日志再多内存也不增长
+    """
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        self.pending = deque(maxlen=capacity)
+        self.history = deque(maxlen=capacity)
+        self.skipped = 0
+        self.lock = threading.Lock()
+
+    def push(self, line):
+        """写入一行日志（线程安全，不阻塞）"""
+        with self.lock:
+            if len(self.pending) == self.capacity:
+                self.skipped += 1  # 界面来不及显示，最早的一行直接丢弃
+            self.pending.append(line)
+            self.history.append(line)
+
+    def drain(self):
+        """取出所有待显示的日志，返回(日志列表, 来不及显示而丢弃的行数)"""
+        with self.lock:
+            lines = list(self.pending)
+            self.pending.clear()
+            skipped, self.skipped = self.skipped, 0
+            return lines, skipped
+
+    def lines(self):
+        """最近capacity行日志"""
+        with self.lock:
+            return list(self.history)
+
+    def clear(self):
+        """清空所有日志"""
+        with self.lock:
+            self.pending.clear()
+            self.history.clear()
+            self.skipped = 0
@@ -0,0 +1,179 @@
+
+import atexit
+import gzip
+import logging
+import logging.handlers
+import os
+import queue
+import re
+import shutil
+from datetime import date
+
+LOGGER_NAME = 'WeChatMonitor'
+LOG_FILE = 'wechat_monitor.log'
+
+LOG_FORMAT = logging.Formatter(
+    '%(asctime)s - %(levelname)s - %(message)s',
+    datefmt='%Y-%m-%d %H:%M:%S'
+)
+
+# 后台写日志的监听线程及其输出
+_listener = None
+_console_handler = None
+_file_handler = None
+_file_options = {}
+
+
+class RotatingLogHandler(logging.handlers.BaseRotatingHandler):
+    """
+    按天和按大小轮转的日志文件：跨天或超过max_bytes时把当前文件改名为
+    wechat_monitor_日期[_序号].log 并gzip压缩，只保留最近backup_count个旧文件
+    """
+    def __init__(self, filename=LOG_FILE, max_bytes=10 * 1024 * 1024, backup_count=14,
+                 compress=True):
+        super().__init__(filename, 'a', encoding='utf-8', delay=True)
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.compress = compress
+        self.setFormatter(LOG_FORMAT)
+
+        # 已有日志文件按最后修改日期归属
+        if os.path.exists(self.baseFilename):
+            self.current_day = date.fromtimestamp(os.path.getmtime(self.baseFilename))
+        else:
+            self.current_day = date.today()
+
+    def shouldRollover(self, record):
+        """跨天或写入后超过大小上限时轮转"""
+        if date.today() != self.current_day:
+            return True
+        if not self.max_bytes or not os.path.exists(self.baseFilename):
+            return False
+        if self.stream is None:
+            self.stream = self._open()
+        size = self.stream.tell() + len(self.format(record).encode('utf-8')) + 1
+        return size > self.max_bytes
+
+    def backup_name(self):
+        """当前文件轮转后的名字（同一天多次轮转时加序号）"""
+        root, ext = os.path.splitext(self.baseFilename)
+        stamp = self.current_day.strftime('%Y%m%d')
+        index = 1
+        while True:
+            name = f"{root}_{stamp}{ext}" if index == 1 else f"{root}_{stamp}_{index}{ext}"
+            if not os.path.exists(name) and not os.path.exists(name + '.gz'):
+                return name
+            index += 1
+
+    def doRollover(self):
+        """改名、压缩并清理旧文件，然后重新打开当前日志"""
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+
+        if os.path.exists(self.baseFilename) and os.path.getsize(self.baseFilename):
+            target = self.backup_name()
+            os.replace(self.baseFilename, target)
+            if self.compress:
+                self.compress_file(target)
+            self.remove_old_backups()
+
+        self.current_day = date.today()
+
+    @staticmethod
+    def compress_file(path):
+        """gzip压缩并删除原文件"""
+        with open(path, 'rb') as src, gzip.open(path + '.gz', 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(path)
+
+    def remove_old_backups(self):
+        """
+        只保留最近backup_count个轮转后的压缩文件（名字为 wechat_monitor_日期[_序号].log.gz）
+        旧版本按天写的 wechat_monitor_日期.log 不是本处理器生成的，不删除
+        """
+        if not self.backup_count:
+            return
+        directory = os.path.dirname(self.baseFilename)
+        root, ext = os.path.splitext(os.path.basename(self.baseFilename))
+        pattern = re.compile(re.escape(root) + r'_\d{8}(_\d+)?' + re.escape(ext + '.gz'))
+        backups = [os.path.join(directory, name) for name in os.listdir(directory)
+                   if pattern.fullmatch(name)]
+        backups.sort(key=os.path.getmtime)
+        for path in backups[:-self.backup_count]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def setup_logging(log_to_file=True):
+    """
+    设置日志系统：各线程只把日志放入队列，由后台线程写控制台和文件，
+    磁盘卡顿不会阻塞截图和识别
+    """
+    global _listener, _console_handler
+    logger = logging.getLogger(LOGGER_NAME)
+    if _listener is not None:
+        return logger
+
+    # 控制台日志
+    _console_handler = logging.StreamHandler()
+    _console_handler.setFormatter(LOG_FORMAT)
+
+    log_queue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(log_queue, _console_handler,
+                                               respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+    # 配置logger
+    logger.setLevel(logging.INFO)
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+
+    # 文件日志
+    set_file_logging(log_to_file)
+    return logger
+
+
+def set_file_logging(enabled, max_bytes=None, backup_count=None):
+    """开启/关闭文件日志或调整轮转参数（日志系统未设置时只记下参数）"""
+    global _file_handler
+    if max_bytes is not None:
+        _file_options['max_bytes'] = max_bytes
+    if backup_count is not None:
+        _file_options['backup_count'] = backup_count
+    if _listener is None:
+        return
+
+    if _file_handler is not None:
+        if enabled and all(getattr(_file_handler, name) == value
+                           for name, value in _file_options.items()):
+            return
+        _replace_handlers(_console_handler)
+        _file_handler.close()
+        _file_handler = None
+
+    if enabled:
+        _file_handler = RotatingLogHandler(LOG_FILE, **_file_options)
+        _replace_handlers(_console_handler, _file_handler)
+
+
+def _replace_handlers(*handlers):
+    """替换监听线程的输出（先停下线程，保证队列中已有的日志写完）"""
+    _listener.stop()
+    _listener.handlers = handlers
+    _listener.start()
+
+
+def shutdown_logging():
+    """写完队列中剩余的日志并关闭文件"""
+    global _listener, _file_handler
+    if _listener is None:
+        return
+    _listener.stop()
+    _listener = None
+    if _file_handler is not None:
+        _file_handler.close()
+        _file_handler = None
+    logging.getLogger(LOGGER_NAME).handlers.clear()
@@ -0,0 +1,201 @@
+
+import threading
+import time
+from bisect import bisect_left
+
+# 延迟直方图的桶上限（秒），覆盖截图的毫秒级到回复的秒级
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+def _escape_label(value):
+    """按Prometheus文本格式转义标签值（反斜杠、双引号、换行）"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels_text(labels):
+    """标签格式化为Prometheus文本格式"""
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape_label(value)}"' for name, value in labels) + '}'
+
+
+class Histogram:
+    """固定桶延迟直方图：记录O(log桶数)，内存固定"""
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # 最后一个桶为+Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        """记录一次耗时（秒）"""
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """按桶线性插值估算分位数（秒），没有数据时返回None"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for i, bucket_count in enumerate(self.counts):
+            if cumulative + bucket_count >= rank and bucket_count:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return self.buckets[-1]
+
+
+class Metrics:
+    """
+    引擎指标：各阶段耗时直方图、计数器和按需读取的瞬时值
+    指标名和标签组合在首次使用时创建，之后更新只需一次加锁
+    """
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self.help = {}
+        self.lock = threading.Lock()
+
+    def describe(self, name, text):
+        """设置指标说明（输出为# HELP）"""
+        self.help[name] = text
+
+    def observe(self, name, seconds, **labels):
+        """记录一次耗时"""
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def inc(self, name, amount=1, **labels):
+        """计数器加amount"""
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def gauge(self, name, func):
+        """注册瞬时值，导出时调用func()读取"""
+        self.gauges[name] = func
+
+    def timer(self, name, **labels):
+        """计时上下文：with metrics.timer('wdchat_stage_seconds', stage='ocr'): ..."""
+        return _Timer(self, name, labels)
+
+    def counter_value(self, name, **labels):
+        """读取计数器当前值"""
+        with self.lock:
+            return self.counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def counter_total(self, name):
+        """计数器所有标签组合的合计"""
+        with self.lock:
+            return sum(value for (metric, _), value in self.counters.items() if metric == name)
+
+    def summary(self, name):
+        """按标签汇总某个直方图：{标签值: (次数, p50秒, p99秒)}，供界面显示"""
+        with self.lock:
+            return {
+                ','.join(str(value) for _, value in labels): (
+                    histogram.count, histogram.quantile(0.5), histogram.quantile(0.99))
+                for (metric, labels), histogram in self.histograms.items() if metric == name
+            }
+
+    def reset(self):
+        """清空所有直方图和计数器"""
+        with self.lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+    def render_prometheus(self):
+        """导出为Prometheus文本格式"""
+        lines = []
+        described = set()
+
+        def header(name, kind):
+            if name not in described:
+                described.add(name)
+                if name in self.help:
+                    lines.append(f"# HELP {name} {self.help[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        with self.lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                header(name, 'counter')
+                lines.append(f"{name}{_labels_text(labels)} {value}")
+
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                header(name, 'histogram')
+                cumulative = 0
+                for bucket, bucket_count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+                    cumulative += bucket_count
+                    bucket_labels = labels + (('le', bucket),)
+                    lines.append(f"{name}_bucket{_labels_text(bucket_labels)} {cumulative}")
+                lines.append(f"{name}_sum{_labels_text(labels)} {histogram.sum:.6f}")
+                lines.append(f"{name}_count{_labels_text(labels)} {histogram.count}")
+
+        for name, func in sorted(self.gauges.items()):
+            try:
+                value = func()
+            except Exception:
+                continue
+            header(name, 'gauge')
+            lines.append(f"{name} {value}")
+
+        return '\n'.join(lines) + '\n'
+
+
+class _Timer:
+    """Metrics.timer返回的计时上下文"""
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class MetricsServer:
+    """本机HTTP指标接口：GET /metrics 返回Prometheus文本格式，在后台线程中运行"""
+    def __init__(self, metrics, port, host='127.0.0.1'):
+        # 默认不开启指标接口，http.server只在用到时导入
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        self.metrics = metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(handler):
+                if handler.path.split('?')[0] not in ('/metrics', '/'):
+                    handler.send_error(404)
+                    return
+                body = metrics.render_prometheus().encode('utf-8')
+                handler.send_response(200)
+                handler.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                handler.send_header('Content-Length', str(len(body)))
+                handler.end_headers()
+                handler.wfile.write(body)
+
+            def log_message(handler, *args):
+                pass  # 不输出访问日志
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.address = self.server.server_address
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True,
+                                       name='metrics-http')
+        self.thread.start()
+
+    def close(self):
+        """停止服务"""
+        self.server.shutdown()
+        self.server.server_close()
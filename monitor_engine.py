@@ -0,0 +1,1095 @@
+
+import threading
+import time
+import copy
+import hashlib
+import json
+import os
+import logging
+from collections import OrderedDict, namedtuple
+from datetime import datetime
+from types import MappingProxyType
+from concurrent.futures import ThreadPoolExecutor
+from frame_diff import TileDiffer
+from ocr_backend import create_ocr_backend, filter_lines, lines_to_text, OcrLine
+from preprocess import Preprocessor, calibrate_scale
+from rule_engine import Rule, RuleSet, parse_rules, DEFAULT_RULE_NAME
+from dedup_store import DedupStore
+from pipeline import FrameSlot, DropQueue
+from scheduler import PollScheduler
+from capture_backend import create_capture_backend
+from frame_archive import FrameArchiveWriter
+from metrics import Metrics, MetricsServer
+from logging_setup import set_file_logging
+from bubble_layout import segment, overlaps, MESSAGE
+from reply_dispatcher import ReplyDispatcher, DROP_POLICIES
+from reply_input import ReplyInput, DryRunInput, REPLY_METHODS
+from config_watcher import ConfigWatcher
+
+CONFIG_FILE = 'config.json'
+
+DEFAULT_CITIES = [
+    '天津', '重庆', '北京', '杭州', '烟台', '郑州', '沈阳', '温州',
+    '南昌', '深圳', '广州', '太原', '福州', '南宁', '呼和浩特',
+    '上海', '长春', '西安', '大连', '石家庄', '青岛'
+]
+
+# 气泡识别结果缓存的条数（按气泡像素摘要，画面未变的气泡不重复识别）
+BUBBLE_CACHE_SIZE = 256
+
+# 停止监控时等待各级线程退出的最长时间（秒）
+STOP_TIMEOUT = 3
+
+# 默认配置
+DEFAULT_CONFIG = {
+    'region': (100, 100, 800, 600),  # 截图区域
+    'reply_text': '2',  # 固定回复内容
+    'check_interval': 3,  # 3秒检测间隔（空闲时退避的最长间隔）
+    'min_interval': 0.5,  # 画面有变化时的最短检测间隔（秒）
+    'backoff_factor': 1.5,  # 空闲时间隔增长倍数
+    'cities': list(DEFAULT_CITIES),
+    'log_to_file': True,  # 日志写入文件（后台线程写入，按天和大小轮转并压缩）
+    'log_max_mb': 10,  # 单个日志文件大小上限（MB），超过后轮转
+    'log_backup_count': 14,  # 保留的轮转日志文件数
+    'window_title': '微信群监控工具',
+    'auto_start': False,
+    'ocr_confidence': 60,  # 低于该置信度(0-100)的识别行被丢弃
+    'fuzzy_match': False,  # 容错匹配：形近字视为相同，较长的城市名允许认错个别字
+    'fuzzy_max_distance': 1,  # 容错匹配最多允许的错字数(0-2)，2个字的城市名只容忍形近字
+    'tile_size': 32,  # 变化检测分块大小（像素）
+    'detect_scroll': True,  # 检测聊天滚动，只识别新出现的消息
+    'ocr_backend': 'auto',  # OCR后端: auto/tesserocr/capi/pytesseract
+    'preprocess': True,  # OCR前灰度化、二值化、去背景
+    'preprocess_scale': 1.0,  # 预处理缩放比例（可通过校准自动选择）
+    'bubble_segmentation': True,  # 按聊天气泡分割，逐条消息识别，跳过自己发的绿色气泡和头像、时间
+    'dedup_max_entries': 50000,  # 去重记录上限
+    'dedup_ttl': 86400,  # 去重记录过期时间（秒），0表示不过期
+    'dedup_file': '',  # 去重记录持久化文件，留空则不保存
+    'stats_log_interval': 600,  # 运行统计写入日志的间隔（秒）
+    'queue_size': 8,  # 流水线各级之间的队列长度
+    'ocr_workers': 2,  # OCR线程数，所有监控区域共用
+    'regions': [],  # 多个监控区域，留空则使用上面的region/cities/reply_text
+    'rules': [],  # 回复规则（关键词/正则→回复、优先级、生效时段、冷却，见rule_engine.Rule），城市列表为默认规则
+    'capture_backend': 'auto',  # 截图后端: auto/x11shm/pyautogui/replay
+    'replay_source': '',  # 回放模式读取的图片目录或zip压缩包
+    'replay_loop': False,  # 回放结束后是否从头循环
+    'replay_speed': 0,  # 帧存档回放倍速，0表示尽快回放
+    'record_file': '',  # 录制文件，设置后把变化的帧和识别结果写入帧存档
+    'metrics_port': 0,  # 本机Prometheus指标端口（http://127.0.0.1:端口/metrics），0表示不开启
+    'reply_method': 'paste',  # 回复方式: paste(剪贴板粘贴，支持中文)/typewrite(逐字输入)
+    'target_window_title': '微信',  # 发送前确认前台窗口标题包含该文字，留空不检查
+    'allow_unknown_window': False,  # 读取前台窗口标题失败（如macOS未授权辅助功能）时仍然发送
+    'reply_rate': 0.5,  # 平均每秒最多回复次数（令牌桶限速），0表示不限速
+    'reply_burst': 1,  # 最多连续回复次数
+    'reply_coalesce_ms': 500,  # 同一区域在该时间窗口内的多条检测结果合并为一次回复（毫秒）
+    'reply_queue_size': 16,  # 待回复队列长度
+    'reply_drop_policy': 'oldest',  # 待回复队列满时丢弃最早(oldest)还是新到(newest)的检测结果
+    'config_watch': True  # 监控时监视配置文件，修改后自动重新加载，无需重新开始监控
+}
+
+# 重新加载配置文件时不会立即生效、需要重新开始监控的配置项
+RESTART_KEYS = ('queue_size', 'ocr_workers', 'ocr_backend', 'capture_backend', 'replay_source',
+                'replay_loop', 'replay_speed', 'record_file', 'metrics_port', 'dedup_file',
+                'config_watch')
+
+# 不可变的配置快照：配置副本（只读）和据此预编译的监控区域、预处理器
+# 各工作线程每轮只读取一次engine.snapshot，重新加载时整体替换，读取无需加锁
+ConfigSnapshot = namedtuple('ConfigSnapshot', ['config', 'regions', 'regions_by_name', 'preprocessor'])
+
+
+class MonitorRegion:
+    """单个监控区域：截图范围、城市列表、回复内容，以及预编译的规则集和变化检测器"""
+    def __init__(self, name, region, cities, reply_text, input_point=None, target_title=None,
+                 fuzzy_distance=None, rules=()):
+        self.name = name
+        self.region = tuple(region)
+        self.cities = list(cities)
+        self.reply_text = reply_text
+        # 回复前点击的输入框位置，多个群同时监控时用于切换焦点
+        self.input_point = tuple(input_point) if input_point else None
+        # 发送前确认的前台窗口标题（独立聊天窗口的标题是群名），None表示使用全局设置
+        self.target_title = target_title
+        # 城市列表→回复内容作为默认规则，与适用于本区域的其他规则编译成一个规则集
+        # fuzzy_distance为None时精确匹配，否则为容错匹配允许的最大错字数
+        rules = [Rule(DEFAULT_RULE_NAME, reply_text, self.cities)] + [
+            rule for rule in rules if rule.applies_to(name)]
+        self.rules = RuleSet(rules, fuzzy_distance)
+        self.differ = None
+
+
+class MonitorEngine:
+    """监控引擎：截图→变化检测→OCR→匹配→回复，不依赖GUI"""
+    def __init__(self, config=None, log_callback=None, event_callback=None):
+        self.monitoring = False
+        self.monitor_thread = None
+        self.threads = []
+        # 每次开始监控加1，各级线程只处理启动时那一轮，重新开始后上一轮的线程自行退出
+        self.run_id = 0
+        self.scheduler = PollScheduler()
+
+        # 流水线各级之间的队列：截图→OCR只保留最新帧，其余为有界队列
+        self.frame_slot = None
+        self.text_queue = None
+        self.reply_dispatcher = None
+
+        # 流水线中尚未处理完的帧/消息数量，回放结束时等待清空
+        self.inflight = 0
+        self.inflight_lock = threading.Lock()
+
+        # 会话录制
+        self.recorder = None
+
+        # 各阶段耗时和计数指标
+        self.metrics = Metrics()
+        self.metrics_server = None
+        self.register_metrics()
+
+        self.config = dict(DEFAULT_CONFIG)
+        self.config['cities'] = list(DEFAULT_CITIES)
+        if config:
+            self.config.update(config)
+
+        # 日志回调（GUI模式下由界面接管显示）
+        self.log_callback = log_callback
+        # 检测事件回调：每条检测结果回复完成（或被丢弃）后以字典形式传出，见detection_event
+        self.event_callback = event_callback
+        self.logger = logging.getLogger('WeChatMonitor')
+
+        # 消息历史，避免重复回复（有界，稳定摘要）
+        self.dedup = DedupStore(self.config['dedup_max_entries'], self.config['dedup_ttl'])
+
+        # 各规则上次触发的时间 {(区域名, 规则名): time.monotonic()}，重新编译规则后保留
+        self.rule_fired = {}
+
+        # 配置快照及配置文件监视（文件内容摘要用于忽略自己保存引起的变化）
+        self.snapshot = None
+        self.snapshot_lock = threading.Lock()
+        self.config_path = CONFIG_FILE
+        self.config_digest = None
+        self.config_watcher = None
+        self.config_version = 0  # 每次替换快照加1，界面据此刷新显示
+        self.last_stats_log = time.time()
+
+        # 截图后端，首次截图时创建
+        self.capture = None
+        self.capture_lock = threading.Lock()
+
+        # 回复输入（剪贴板粘贴/逐字输入），首次回复时创建
+        self.reply_input = None
+
+        # 常驻OCR引擎，每个OCR线程一个（按线程对象索引），首次识别时创建，线程退出后关闭
+        self.ocr_backends = {}
+        self.ocr_lock = threading.Lock()
+
+        # OCR线程池（ocr_workers个线程，所有区域共用）：识别都在池中执行，只有池中线程持有OCR引擎
+        # OCR阶段的线程只负责分割和分派，同一帧的多个气泡并行识别
+        self.ocr_pool = None
+        self.bubble_cache = OrderedDict()
+        self.bubble_cache_lock = threading.Lock()
+
+        # 配置相关的预编译对象（监控区域、预处理器、规则集）
+        self.compile_config()
+
+    @property
+    def regions(self):
+        """当前快照中的监控区域"""
+        return self.snapshot.regions
+
+    @property
+    def regions_by_name(self):
+        """当前快照中按名称索引的监控区域"""
+        return self.snapshot.regions_by_name
+
+    @property
+    def preprocessor(self):
+        """当前快照中的预处理器"""
+        return self.snapshot.preprocessor
+
+    def register_metrics(self):
+        """登记指标说明和瞬时值"""
+        metrics = self.metrics
+        metrics.describe('wdchat_stage_seconds', "各阶段耗时（截图/变化检测/OCR/匹配/回复）")
+        metrics.describe('wdchat_detection_to_reply_seconds', "检测到城市到回复发送完成的延迟")
+        metrics.describe('wdchat_capture_to_reply_seconds', "截图到回复发送完成的端到端延迟")
+        metrics.describe('wdchat_frames_total', "截取的帧数")
+        metrics.describe('wdchat_frames_skipped_total', "画面无变化、跳过OCR的帧数")
+        metrics.describe('wdchat_frames_coalesced_total', "OCR来不及处理、与新帧合并的帧数")
+        metrics.describe('wdchat_detections_total', "检测到城市的消息数")
+        metrics.describe('wdchat_replies_total', "发送的回复数")
+        metrics.describe('wdchat_replies_coalesced_total', "合并到其他回复中、未单独发送的检测结果数")
+        metrics.describe('wdchat_queue_dropped_total', "队列满时丢弃的元素数")
+        metrics.describe('wdchat_errors_total', "各阶段出错次数")
+        metrics.describe('wdchat_bubbles_total', "分割出的气泡数（按类型）")
+        metrics.describe('wdchat_bubble_cache_hits_total', "命中识别缓存、无需OCR的气泡数")
+        metrics.describe('wdchat_bubble_fallback_total', "没有分割出消息气泡、改为识别整个变化区域的帧数")
+        metrics.describe('wdchat_dedup_entries', "去重记录条数")
+        metrics.describe('wdchat_inflight', "流水线中未处理完的帧和消息数")
+        metrics.describe('wdchat_poll_interval_seconds', "当前检测间隔")
+        metrics.gauge('wdchat_dedup_entries', lambda: len(self.dedup.entries))
+        metrics.gauge('wdchat_inflight', lambda: self.inflight)
+        metrics.gauge('wdchat_poll_interval_seconds', lambda: self.scheduler.interval)
+
+    def start_metrics_server(self):
+        """按配置启动本机指标接口（已在该端口启动时跳过，端口变化时重新启动）"""
+        port = self.config.get('metrics_port', 0)
+        if self.metrics_server and self.metrics_server.address[1] != port:
+            self.metrics_server.close()
+            self.metrics_server = None
+        if not port or self.metrics_server:
+            return
+        try:
+            self.metrics_server = MetricsServer(self.metrics, port)
+            self.log(f"指标接口: http://127.0.0.1:{port}/metrics")
+        except Exception as e:
+            self.log(f"启动指标接口失败: {str(e)}", 'error')
+
+    def log(self, message, level='info'):
+        """记录日志"""
+        if self.log_callback:
+            self.log_callback(message, level)
+            return
+
+        if level == 'info':
+            self.logger.info(message)
+        elif level == 'error':
+            self.logger.error(message)
+        elif level == 'warning':
+            self.logger.warning(message)
+
+    def load_config(self, path=CONFIG_FILE):
+        """加载配置文件，返回是否成功加载"""
+        self.config_path = path
+        if not os.path.exists(path):
+            return False
+
+        saved_config, digest = self.read_config_file(path)
+        self.config.update(saved_config)
+        self.config_digest = digest
+        self.compile_config()
+        return True
+
+    @staticmethod
+    def read_config_file(path):
+        """读取配置文件，返回(配置, 文件内容摘要)"""
+        with open(path, 'rb') as f:
+            data = f.read()
+        saved_config = json.loads(data.decode('utf-8'))
+        if 'region' in saved_config:
+            saved_config['region'] = tuple(saved_config['region'])
+        return saved_config, hashlib.blake2b(data, digest_size=16).digest()
+
+    def save_config(self, path=CONFIG_FILE):
+        """保存配置文件"""
+        data = json.dumps(self.config, ensure_ascii=False, indent=2).encode('utf-8')
+        # 先记下摘要，监视线程看到的是自己保存的内容时不重新加载
+        self.config_digest = hashlib.blake2b(data, digest_size=16).digest()
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    def validate_config(self, config=None):
+        """验证配置（默认为当前配置），无效时抛出ValueError"""
+        config = self.config if config is None else config
+        regions = self.build_regions(config)
+        for region in regions:
+            if not all(isinstance(x, int) and x > 0 for x in region.region):
+                raise ValueError(f"截图区域配置无效: {region.name}")
+
+            if not region.cities:
+                raise ValueError(f"城市列表为空: {region.name}")
+
+        if len({region.name for region in regions}) != len(regions):
+            raise ValueError("监控区域名称重复")
+
+        for rule in parse_rules(config.get('rules')):
+            unknown = rule.regions - {region.name for region in regions}
+            if unknown:
+                raise ValueError(f"规则“{rule.name}”的监控区域不存在: {', '.join(sorted(unknown))}")
+
+        if not 0 < config['min_interval'] <= config['check_interval']:
+            raise ValueError("最短检测间隔必须大于0且不超过检测间隔")
+
+        if config['reply_rate'] < 0 or config['reply_burst'] < 1:
+            raise ValueError("回复速率不能为负数，连续回复次数至少为1")
+
+        if config.get('fuzzy_max_distance', 1) not in (0, 1, 2):
+            raise ValueError("容错匹配最多错字数必须为0、1或2")
+
+        if config['reply_method'] not in REPLY_METHODS:
+            raise ValueError(f"回复方式无效: {config['reply_method']}")
+
+        if config['reply_drop_policy'] not in DROP_POLICIES:
+            raise ValueError(f"回复队列丢弃策略无效: {config['reply_drop_policy']}")
+
+    def apply_config(self, new_config):
+        """应用新配置并重新编译匹配器等对象"""
+        self.config.update(new_config)
+        self.compile_config()
+
+    def build_regions(self, config=None):
+        """根据配置（默认为当前配置）生成监控区域列表，未配置regions时使用单个默认区域"""
+        config = self.config if config is None else config
+        fuzzy_distance = None
+        if config.get('fuzzy_match', False):
+            fuzzy_distance = config.get('fuzzy_max_distance', 1)
+        rules = parse_rules(config.get('rules'))
+
+        if not config.get('regions'):
+            return [MonitorRegion('默认', config['region'], config['cities'],
+                                  config['reply_text'], fuzzy_distance=fuzzy_distance,
+                                  rules=rules)]
+
+        return [MonitorRegion(item.get('name') or f"区域{index + 1}",
+                              item['region'],
+                              item.get('cities') or config['cities'],
+                              item.get('reply_text', config['reply_text']),
+                              item.get('input_point'),
+                              item.get('target_window_title'),
+                              fuzzy_distance, rules)
+                for index, item in enumerate(config['regions'])]
+
+    def compile_config(self):
+        """根据当前配置预编译并替换快照，只在配置变化时调用"""
+        self.install_snapshot(self.build_snapshot(self.config))
+
+    def build_snapshot(self, config):
+        """由配置生成不可变快照：各区域的城市列表和规则编译成规则集，创建预处理器"""
+        config = copy.deepcopy(config)
+        regions = tuple(self.build_regions(config))
+        return ConfigSnapshot(MappingProxyType(config), regions,
+                              MappingProxyType({region.name: region for region in regions}),
+                              self.create_preprocessor(config))
+
+    def install_snapshot(self, snapshot):
+        """替换配置快照（一次赋值，工作线程下一轮即使用新快照），并调整运行中的各组件"""
+        with self.snapshot_lock:
+            previous = self.snapshot
+            config = snapshot.config
+
+            # 截图范围和检测器参数都不变的区域沿用原变化检测器，重新加载后不必全帧重新识别；
+            # 参数变化的区域首次截图时按新参数重新创建
+            if previous is not None:
+                params = self.create_differ(config).params
+                for region in snapshot.regions:
+                    old = previous.regions_by_name.get(region.name)
+                    if (old is not None and old.differ is not None and old.region == region.region
+                            and old.differ.params == params):
+                        region.differ = old.differ
+
+            self.snapshot = snapshot
+            self.config_version += 1
+
+        self.dedup.configure(config['dedup_max_entries'], config['dedup_ttl'])
+        self.scheduler.configure(config['min_interval'], config['check_interval'],
+                                 config['backoff_factor'])
+        set_file_logging(config.get('log_to_file', True),
+                         int(config.get('log_max_mb', 10) * 1024 * 1024),
+                         config.get('log_backup_count', 14))
+        if self.reply_dispatcher:
+            self.reply_dispatcher.configure(*self.reply_settings(config))
+
+        self.reply_input = None  # 回复方式可能变化，下次回复时重新创建
+
+        # 置信度、缩放等变化后缓存的识别结果失效
+        with self.bubble_cache_lock:
+            self.bubble_cache.clear()
+
+    def reload_config(self, path=None):
+        """
+        配置文件变化后重新加载：在调用线程（配置监视线程）中解析、验证和预编译，
+        全部成功后一次性替换快照；文件无效时保留原配置，返回是否重新加载
+        """
+        path = path or self.config_path
+        try:
+            saved_config, digest = self.read_config_file(path)
+            if digest == self.config_digest:
+                return False  # 内容未变（例如本程序刚保存的）
+            config = dict(self.config)
+            config.update(saved_config)
+            self.validate_config(config)
+            snapshot = self.build_snapshot(config)
+        except Exception as e:
+            self.log(f"重新加载配置失败，继续使用原配置: {str(e)}", 'error')
+            return False
+
+        restart = [key for key in RESTART_KEYS if config.get(key) != self.snapshot.config.get(key)]
+        self.config_digest = digest
+        self.config.update(saved_config)
+        self.install_snapshot(snapshot)
+
+        self.log("配置文件已修改，已重新加载")
+        if restart and self.monitoring:
+            self.log(f"以下配置需要重新开始监控后生效: {', '.join(restart)}", 'warning')
+        return True
+
+    def start_config_watcher(self):
+        """按配置开始监视配置文件（已在监视时跳过）"""
+        if not self.config.get('config_watch', True) or self.config_watcher:
+            return
+        try:
+            self.config_watcher = ConfigWatcher(self.config_path, self.reload_config, log=self.log)
+            self.config_watcher.start()
+        except Exception as e:
+            self.config_watcher = None
+            self.log(f"监视配置文件失败: {str(e)}", 'error')
+
+    def stop_config_watcher(self):
+        """停止监视配置文件"""
+        if self.config_watcher:
+            self.config_watcher.close()
+            self.config_watcher = None
+
+    def reply_settings(self, config=None):
+        """回复调度参数：(速率, 连续次数, 合并窗口秒数, 队列长度, 丢弃策略)"""
+        config = self.snapshot.config if config is None else config
+        return (config.get('reply_rate', 0.5), config.get('reply_burst', 1),
+                config.get('reply_coalesce_ms', 500) / 1000,
+                config.get('reply_queue_size', 16), config.get('reply_drop_policy', 'oldest'))
+
+    def create_differ(self, config=None):
+        """根据配置（默认为当前快照）创建变化检测器"""
+        config = self.snapshot.config if config is None else config
+        return TileDiffer(config.get('tile_size', 32),
+                          detect_scroll=config.get('detect_scroll', True))
+
+    def create_preprocessor(self, config=None):
+        """根据配置（默认为当前快照）创建图像预处理器"""
+        config = self.snapshot.config if config is None else config
+        return Preprocessor(scale=config.get('preprocess_scale', 1.0))
+
+    def start(self):
+        """开始监控（截图、OCR、匹配、回复各在一个线程中流水线运行）"""
+        if self.monitoring:
+            return False
+
+        self.validate_config()
+
+        if self.config.get('dedup_file'):
+            count = self.dedup.load(self.config['dedup_file'])
+            self.log(f"已加载去重记录: {count}条")
+
+        self.compile_config()
+        self.monitoring = True
+        self.run_id += 1
+        run_id = self.run_id
+        self.scheduler = PollScheduler(self.config['min_interval'], self.config['check_interval'],
+                                       self.config['backoff_factor'])
+
+        if self.config.get('record_file'):
+            self.recorder = FrameArchiveWriter(self.config['record_file'])
+            self.log(f"开始录制: {self.config['record_file']}")
+
+        self.start_metrics_server()
+        self.start_config_watcher()
+
+        self.inflight = 0
+        queue_size = self.config.get('queue_size', 8)
+        self.frame_slot = FrameSlot()
+        self.text_queue = DropQueue(queue_size)
+
+        # 回复在独立的调度线程中限速、合并后发送，检测不等待键盘操作
+        self.reply_dispatcher = ReplyDispatcher(self.dispatch_reply, *self.reply_settings(),
+                                                on_drop=self.on_reply_dropped)
+        self.reply_dispatcher.start()
+
+        self.ocr_pool = ThreadPoolExecutor(max(1, self.config.get('ocr_workers', 2)),
+                                           thread_name_prefix='ocr-pool')
+
+        # OCR阶段线程（分割、分派），数量不超过区域数
+        ocr_workers = max(1, min(self.config.get('ocr_workers', 2), len(self.regions)))
+        self.threads = [threading.Thread(target=self.capture_loop, args=(run_id,), name='capture',
+                                         daemon=True)]
+        self.threads += [threading.Thread(target=self.ocr_loop, args=(run_id,), name=f'ocr-{index + 1}',
+                                          daemon=True)
+                         for index in range(ocr_workers)]
+        self.threads.append(threading.Thread(target=self.match_loop, args=(run_id,), name='match',
+                                             daemon=True))
+        for thread in self.threads:
+            thread.start()
+        self.monitor_thread = self.threads[0]
+
+        self.log(f"监控区域: {', '.join(region.name for region in self.regions)}")
+        return True
+
+    def running(self, run_id):
+        """run_id这一轮监控是否仍在运行"""
+        return self.monitoring and self.run_id == run_id
+
+    @property
+    def paused(self):
+        """是否已暂停"""
+        return self.scheduler.paused
+
+    def pause(self):
+        """暂停监控（立即生效，待发送的回复保留到恢复后发送）"""
+        self.scheduler.pause()
+        if self.reply_dispatcher is not None:
+            self.reply_dispatcher.pause()
+
+    def resume(self):
+        """恢复监控（立即开始下一次检测）"""
+        if self.reply_dispatcher is not None:
+            self.reply_dispatcher.resume()
+        self.scheduler.resume()
+
+    def stop(self):
+        """停止监控：立即唤醒所有等待中的线程，并等待它们退出"""
+        self.monitoring = False
+        self.scheduler.stop()
+        self.stop_config_watcher()
+
+        # 唤醒阻塞在队列上的各级线程（队列为空时长度为0，不能按真假判断）
+        for queue in (self.frame_slot, self.text_queue, self.reply_dispatcher):
+            if queue is not None:
+                queue.close()
+
+        if self.ocr_pool:
+            self.ocr_pool.shutdown(wait=False, cancel_futures=True)
+            self.ocr_pool = None
+
+        # 等待本轮各级线程退出，重新开始时不会与新线程同时运行
+        threads = list(self.threads)
+        if self.reply_dispatcher is not None and self.reply_dispatcher.thread:
+            threads.append(self.reply_dispatcher.thread)
+        alive = self.join_threads(threads)
+        if alive:
+            self.log(f"以下线程未能及时退出，将在当前操作完成后退出: {', '.join(alive)}", 'warning')
+        self.release_ocr_backends()
+
+        # 截图后端下次开始时按当时的配置重新创建（回放从头开始，capture_backend等修改生效）
+        self.close_capture()
+
+        if self.recorder:
+            stats = self.recorder.stats()
+            self.recorder.close()
+            self.recorder = None
+            self.log(f"录制结束: {stats['frames']}帧, {stats['archive_kb']}KB, 压缩比{stats['ratio']}")
+
+    @staticmethod
+    def join_threads(threads, timeout=STOP_TIMEOUT):
+        """等待线程退出（跳过当前线程），最多共等待timeout秒，返回仍未退出的线程名"""
+        deadline = time.time() + timeout
+        alive = []
+        for thread in threads:
+            if thread is threading.current_thread():
+                continue
+            thread.join(max(0, deadline - time.time()))
+            if thread.is_alive():
+                alive.append(thread.name)
+        return alive
+
+    def run_forever(self):
+        """无界面运行：启动监控并阻塞直到停止或被中断"""
+        self.start()
+        self.log("开始监控微信群聊（无界面模式）")
+        try:
+            while self.monitor_thread.is_alive():
+                self.monitor_thread.join(0.5)
+        except KeyboardInterrupt:
+            self.log("收到中断信号，正在停止监控")
+        finally:
+            self.close()
+        self.log("监控已停止")
+
+    def close(self):
+        """停止监控，保存去重记录并释放OCR引擎"""
+        self.stop()
+        if self.config.get('dedup_file'):
+            try:
+                self.dedup.save(self.config['dedup_file'])
+            except Exception as e:
+                self.log(f"保存去重记录失败: {str(e)}", 'error')
+        with self.ocr_lock:
+            for backend in self.ocr_backends.values():
+                backend.close()
+            self.ocr_backends.clear()
+        self.close_capture()
+        if self.metrics_server:
+            self.metrics_server.close()
+            self.metrics_server = None
+
+    def capture_loop(self, run_id):
+        """截图线程：依次截取各区域并检测变化，变化区域交给OCR线程池"""
+        scheduler, frame_slot = self.scheduler, self.frame_slot
+        while self.running(run_id):
+            try:
+                snapshot = self.snapshot  # 本轮使用同一份配置
+                self.log_stats_if_due(snapshot.config)
+
+                active = False
+                for region in snapshot.regions:
+                    if region.differ is None:
+                        region.differ = self.create_differ(snapshot.config)
+
+                    # 截图
+                    with self.metrics.timer('wdchat_stage_seconds', stage='capture'):
+                        screenshot = self.capture_screen(region.region, region.name)
+                    if screenshot is None:
+                        self.metrics.inc('wdchat_errors_total', stage='capture')
+                        continue
+                    self.metrics.inc('wdchat_frames_total', region=region.name)
+
+                    # 分块检查截图是否变化，只识别变化区域（优化性能）
+                    captured_at = time.time()
+                    with self.metrics.timer('wdchat_stage_seconds', stage='diff'):
+                        dirty_box = region.differ.diff(screenshot)
+                    if dirty_box is None:
+                        self.metrics.inc('wdchat_frames_skipped_total', region=region.name)
+                    else:
+                        if self.recorder:
+                            self.recorder.write_frame(region.name, screenshot, captured_at)
+
+                        # OCR忙时覆盖该区域未处理的旧帧，变化区域合并
+                        self.track_inflight(1)
+                        if frame_slot.put(screenshot, dirty_box, region.differ.last_scroll,
+                                               captured_at, key=region.name):
+                            self.track_inflight(-1)
+                            self.metrics.inc('wdchat_frames_coalesced_total', region=region.name)
+                        active = True
+
+                if active:
+                    scheduler.on_activity()
+                else:
+                    scheduler.on_idle()
+
+                # 回放结束：等流水线处理完剩余帧后停止
+                capture = self.get_capture()
+                if getattr(capture, 'finished', False):
+                    self.log("回放结束")
+                    self.drain_and_stop(run_id)
+                    break
+
+            except Exception as e:
+                self.log(f"监控过程出错: {str(e)}", 'error')
+                capture = None
+
+            # 回放存档时按录制间隔等待，否则自适应间隔等待；暂停时阻塞到恢复，停止时立即返回
+            delay = capture.replay_delay() if hasattr(capture, 'replay_delay') else None
+            if not scheduler.wait_next(delay):
+                break
+
+    def track_inflight(self, delta):
+        """更新流水线中未处理完的数量"""
+        with self.inflight_lock:
+            self.inflight += delta
+
+    def drain_and_stop(self, run_id, timeout=60):
+        """等待流水线中的帧和消息全部处理完，然后停止run_id这一轮监控"""
+        deadline = time.time() + timeout
+        while self.running(run_id) and self.inflight > 0 and time.time() < deadline:
+            self.scheduler.stop_event.wait(0.05)
+        if self.running(run_id):
+            self.stop()
+
+    def ocr_loop(self, run_id):
+        """OCR线程（线程池中的一个）：识别某个区域最新一帧的变化区域"""
+        try:
+            self.run_ocr(run_id)
+        finally:
+            self.release_ocr()
+
+    def run_ocr(self, run_id):
+        """OCR线程的主循环"""
+        frame_slot, text_queue = self.frame_slot, self.text_queue
+        while self.running(run_id):
+            frame = frame_slot.take(timeout=1)
+            if frame is None:
+                continue
+
+            forwarded = False
+            try:
+                region_name, screenshot, dirty_box, captured_at = frame
+                with self.metrics.timer('wdchat_stage_seconds', stage='ocr'):
+                    if self.snapshot.config.get('bubble_segmentation', True):
+                        lines = self.extract_bubble_lines(screenshot, dirty_box)
+                    else:
+                        lines = self.run_in_pool(self.extract_dirty_lines, screenshot, dirty_box)
+                if lines:
+                    # 保留每行的位置和置信度，后续阶段可以按行处理
+                    item = {'region': region_name, 'text': lines_to_text(lines), 'lines': lines,
+                            'captured_at': captured_at, 'recognized_at': time.time()}
+                    forwarded = True
+                    if text_queue.put(item):
+                        self.track_inflight(-1)
+                        self.metrics.inc('wdchat_queue_dropped_total', queue='text')
+                        self.log("匹配队列已满，丢弃最早的识别结果", 'warning')
+            except Exception as e:
+                if self.running(run_id):  # 停止时取消中的气泡识别不算出错
+                    self.metrics.inc('wdchat_errors_total', stage='ocr')
+                    self.log(f"OCR过程出错: {str(e)}", 'error')
+
+            if not forwarded:
+                self.track_inflight(-1)
+
+    def match_loop(self, run_id):
+        """匹配线程：检查城市名称，命中后交给回复线程"""
+        text_queue, reply_dispatcher = self.text_queue, self.reply_dispatcher
+        while self.running(run_id):
+            item = text_queue.get(timeout=1)
+            if item is None:
+                continue
+
+            region = self.snapshot.regions_by_name.get(item['region'])
+            if region is None:
+                self.track_inflight(-1)
+                continue
+
+            forwarded = False
+            try:
+                with self.metrics.timer('wdchat_stage_seconds', stage='match'):
+                    hits = self.check_rules(item['text'], region)
+                if self.recorder:
+                    self.recorder.write_result(region.name, item['captured_at'], item['text'],
+                                               self.hit_keywords(hits))
+                if hits:
+                    # 每条命中的规则一条检测结果，按(区域, 回复内容)合并发送
+                    self.track_inflight(len(hits) - 1)
+                    forwarded = True
+                    detected_at = time.time()
+                    for rule, keywords, lines in hits:
+                        self.log(f"[{region.name}] 检测到: {', '.join(keywords)}（规则: {rule.name}）")
+                        self.metrics.inc('wdchat_detections_total', region=region.name)
+                        detection = {'region': region.name, 'rule': rule.name, 'reply': rule.reply,
+                                     'cities': keywords, 'lines': lines,
+                                     'captured_at': item['captured_at'],
+                                     'recognized_at': item.get('recognized_at', detected_at),
+                                     'detected_at': detected_at}
+                        reply_dispatcher.submit((region.name, rule.reply), detection)
+            except Exception as e:
+                self.metrics.inc('wdchat_errors_total', stage='match')
+                self.log(f"匹配过程出错: {str(e)}", 'error')
+
+            if not forwarded:
+                self.track_inflight(-1)
+
+    def dispatch_reply(self, key, detections):
+        """回复调度线程：对合并后的一组检测结果（同一区域、同一回复内容）发送一次回复"""
+        region_name, reply_text = key
+        region = self.snapshot.regions_by_name.get(region_name)
+        try:
+            if region is not None:
+                if len(detections) > 1:
+                    cities = list(dict.fromkeys(city for d in detections for city in d['cities']))
+                    self.log(f"[{region.name}] 合并{len(detections)}条检测结果({', '.join(cities)})为一次回复")
+                    self.metrics.inc('wdchat_replies_coalesced_total', len(detections) - 1)
+
+                with self.metrics.timer('wdchat_stage_seconds', stage='reply'):
+                    sent = self.send_reply(region, reply_text)
+                replied_at = time.time()
+                for detection in detections:
+                    self.emit_event(detection, 'sent' if sent else 'failed', replied_at, len(detections))
+                if sent:
+                    self.metrics.inc('wdchat_replies_total', region=region.name)
+                    for detection in detections:
+                        self.metrics.observe('wdchat_detection_to_reply_seconds',
+                                             replied_at - detection['detected_at'])
+                        self.metrics.observe('wdchat_capture_to_reply_seconds',
+                                             replied_at - detection['captured_at'])
+                else:
+                    self.metrics.inc('wdchat_errors_total', stage='reply')
+            else:
+                # 重新加载配置后该区域已不存在
+                for detection in detections:
+                    self.emit_event(detection, 'dropped')
+        except Exception as e:
+            self.metrics.inc('wdchat_errors_total', stage='reply')
+            self.log(f"回复过程出错: {str(e)}", 'error')
+        finally:
+            self.track_inflight(-len(detections))
+
+    def on_reply_dropped(self, detection, reason='full'):
+        """丢弃一条待回复的检测结果（待回复队列满，或停止监控时尚未发送）"""
+        self.emit_event(detection, 'dropped')
+        self.track_inflight(-1)
+        self.metrics.inc('wdchat_queue_dropped_total', queue='reply')
+        if reason == 'full':
+            self.log(f"回复队列已满，丢弃[{detection['region']}]的一条待回复消息", 'warning')
+        else:
+            self.log(f"监控已停止，[{detection['region']}]的一条待回复消息未发送", 'warning')
+
+    @staticmethod
+    def detection_event(detection, status, replied_at=None, batch=1):
+        """
+        检测事件：时间、区域、规则、城市、所在行、回复内容和结果(sent/failed/dropped)，
+        以及各段延迟（毫秒）：截图→识别完成、识别→匹配、匹配→回复完成、截图→回复完成
+        batch为与之合并为一次回复的检测结果数
+        """
+        def elapsed_ms(start, end):
+            return round((end - start) * 1000, 1) if end is not None else None
+
+        captured_at = detection['captured_at']
+        recognized_at = detection.get('recognized_at', detection['detected_at'])
+        detected_at = detection['detected_at']
+        return {
+            'time': datetime.fromtimestamp(detected_at).isoformat(timespec='milliseconds'),
+            'region': detection['region'],
+            'rule': detection.get('rule'),
+            'cities': detection['cities'],
+            'lines': detection.get('lines', []),
+            'reply': detection.get('reply'),
+            'reply_sent': status == 'sent',
+            'status': status,
+            'batch': batch,
+            'latency_ms': {
+                'ocr': elapsed_ms(captured_at, recognized_at),
+                'match': elapsed_ms(recognized_at, detected_at),
+                'reply': elapsed_ms(detected_at, replied_at),
+                'total': elapsed_ms(captured_at, replied_at),
+            },
+        }
+
+    def emit_event(self, detection, status, replied_at=None, batch=1):
+        """把检测事件交给事件回调（未设置时跳过）"""
+        if self.event_callback is None:
+            return
+        try:
+            self.event_callback(self.detection_event(detection, status, replied_at, batch))
+        except Exception as e:
+            self.log(f"输出检测事件失败: {str(e)}", 'error')
+
+    def log_stats_if_due(self, config=None):
+        """定期把去重记录的内存占用写入日志"""
+        config = self.snapshot.config if config is None else config
+        interval = config.get('stats_log_interval', 600)
+        if not interval or time.time() - self.last_stats_log < interval:
+            return
+
+        self.last_stats_log = time.time()
+        stats = self.dedup.stats()
+        self.log(f"去重记录: {stats['entries']}/{stats['max_entries']}条, "
+                 f"约{stats['memory_kb']}KB, 已淘汰{stats['evicted']}条, 已过期{stats['expired']}条")
+
+    def close_capture(self):
+        """关闭截图后端"""
+        with self.capture_lock:
+            if self.capture:
+                self.capture.close()
+                self.capture = None
+
+    def get_capture(self):
+        """获取截图后端（首次调用时按配置创建）"""
+        with self.capture_lock:
+            if self.capture is None:
+                self.capture = create_capture_backend(self.config.get('capture_backend', 'auto'),
+                                                      self.config.get('replay_source', ''),
+                                                      self.config.get('replay_loop', False),
+                                                      self.config.get('replay_speed', 0),
+                                                      log=self.log)
+                self.log(f"截图后端: {self.capture.name}")
+            return self.capture
+
+    def grab(self, region=None, name=None):
+        """截取区域（name为监控区域名称，回放时按区域取帧），失败时抛出异常"""
+        return self.get_capture().grab(region or self.config['region'], name)
+
+    def capture_screen(self, region=None, name=None):
+        """截取屏幕"""
+        try:
+            screenshot = self.grab(region, name)
+            return screenshot
+        except Exception as e:
+            self.log(f"截图失败: {str(e)}", 'error')
+            return None
+
+    def crop_dirty(self, screenshot, box):
+        """裁剪出变化区域，全帧变化时直接返回原图"""
+        left, top, right, bottom = box
+        box = (max(0, left), max(0, top), min(screenshot.width, right), min(screenshot.height, bottom))
+        if box == (0, 0, screenshot.width, screenshot.height):
+            return screenshot
+        return screenshot.crop(box)
+
+    def get_ocr(self):
+        """获取当前线程的常驻OCR引擎（首次调用时创建，之后各帧复用）"""
+        # 按线程对象而不是线程标识索引：标识在线程退出后会被新线程复用
+        thread = threading.current_thread()
+        with self.ocr_lock:
+            backend = self.ocr_backends.get(thread)
+            if backend is None:
+                backend = create_ocr_backend(self.config.get('ocr_backend', 'auto'), log=self.log)
+                if not self.ocr_backends:
+                    self.log(f"OCR后端: {backend.name}")
+                self.ocr_backends[thread] = backend
+            return backend
+
+    def release_ocr(self):
+        """关闭当前线程的OCR引擎（OCR线程退出时调用）"""
+        with self.ocr_lock:
+            backend = self.ocr_backends.pop(threading.current_thread(), None)
+        if backend is not None:
+            backend.close()
+
+    def release_ocr_backends(self):
+        """关闭已退出线程（如停止后的OCR线程池线程）的OCR引擎，仍在识别的线程退出时自行关闭"""
+        with self.ocr_lock:
+            finished = [thread for thread in self.ocr_backends if not thread.is_alive()]
+            backends = [self.ocr_backends.pop(thread) for thread in finished]
+        for backend in backends:
+            backend.close()
+
+    def extract_lines(self, image, offset=(0, 0)):
+        """
+        OCR文字识别，一次识别得到各行的文字、位置和置信度
+        丢弃置信度低于ocr_confidence的行，位置换算为截图坐标（image左上角位于截图的offset处）
+        """
+        snapshot = self.snapshot
+        try:
+            # 预处理图像：灰度化、二值化、去背景，图像更小更干净，识别更快
+            left, top, scale = 0, 0, 1.0
+            if snapshot.config.get('preprocess', True):
+                image, (left, top, scale) = snapshot.preprocessor.process(image)
+                if image is None:
+                    return []
+
+            lines = filter_lines(self.get_ocr().image_to_lines(image),
+                                 snapshot.config.get('ocr_confidence', 0))
+            for line in lines:
+                x1, y1, x2, y2 = line.box
+                line.box = (offset[0] + int((x1 + left) / scale), offset[1] + int((y1 + top) / scale),
+                            offset[0] + int((x2 + left) / scale), offset[1] + int((y2 + top) / scale))
+            return lines
+        except Exception as e:
+            self.log(f"OCR识别失败: {str(e)}", 'error')
+            return []
+
+    def run_in_pool(self, func, *args):
+        """在OCR线程池中执行并等待结果（未开始监控、没有线程池时直接执行）"""
+        pool = self.ocr_pool
+        if pool is None:
+            return func(*args)
+        return pool.submit(func, *args).result()
+
+    def extract_dirty_lines(self, screenshot, dirty_box):
+        """识别整个变化区域"""
+        offset = (max(0, dirty_box[0]), max(0, dirty_box[1]))
+        return self.extract_lines(self.crop_dirty(screenshot, dirty_box), offset)
+
+    def extract_bubble_lines(self, screenshot, dirty_box):
+        """
+        按气泡识别：分割整帧，只识别与变化区域相交的他人消息气泡（整个气泡，不截断）
+        自己发的气泡、头像和时间等不送OCR，多个气泡在线程池中并行识别
+        整帧没有分割出消息气泡时（深浅色主题不符、不是微信界面等）退回识别整个变化区域
+        """
+        blocks = segment(screenshot)
+        for _, kind in blocks:
+            self.metrics.inc('wdchat_bubbles_total', kind=kind)
+
+        if not any(kind == MESSAGE for _, kind in blocks):
+            self.metrics.inc('wdchat_bubble_fallback_total')
+            return self.run_in_pool(self.extract_dirty_lines, screenshot, dirty_box)
+
+        bubbles = [box for box, kind in blocks if kind == MESSAGE and overlaps(box, dirty_box)]
+        pool = self.ocr_pool
+        if pool is None:
+            results = [self.extract_bubble(screenshot.crop(box), box[:2]) for box in bubbles]
+        else:
+            futures = [pool.submit(self.extract_bubble, screenshot.crop(box), box[:2]) for box in bubbles]
+            results = [future.result() for future in futures]
+
+        return [line for lines in results for line in lines]
+
+    def extract_bubble(self, image, origin):
+        """识别单个气泡，相同像素的气泡直接使用缓存的结果（位置换算到origin处）"""
+        key = (image.size, hashlib.blake2b(image.tobytes(), digest_size=8).digest())
+        with self.bubble_cache_lock:
+            cached = self.bubble_cache.get(key)
+            if cached is not None:
+                self.bubble_cache.move_to_end(key)
+
+        if cached is None:
+            cached = [(line.text, line.box, line.confidence) for line in self.extract_lines(image)]
+            with self.bubble_cache_lock:
+                self.bubble_cache[key] = cached
+                while len(self.bubble_cache) > BUBBLE_CACHE_SIZE:
+                    self.bubble_cache.popitem(last=False)
+        else:
+            self.metrics.inc('wdchat_bubble_cache_hits_total')
+
+        x, y = origin
+        return [OcrLine(text, (box[0] + x, box[1] + y, box[2] + x, box[3] + y), confidence)
+                for text, box, confidence in cached]
+
+    def extract_text(self, image):
+        """OCR文字识别，返回置信度达标的各行文字"""
+        return lines_to_text(self.extract_lines(image))
+
+    def check_rules(self, text, region=None, now=None):
+        """
+        按规则集匹配文本，返回[(规则, [命中的关键词], [所在行]), ...]，同一规则多行命中时合并
+        每行只触发优先级最高、不在冷却中的一条规则；命中过的行记入去重记录，不再重复处理
+        """
+        region = region or self.regions[0]
+        now = time.time() if now is None else now
+        clock = time.monotonic()
+        fired = OrderedDict()
+
+        for line, matched in region.rules.match(text, now):
+            # 用稳定摘要去重（按区域区分），避免重复处理
+            if self.dedup.seen(f"{region.name}\n{line}"):
+                continue
+            for rule, keywords in matched:
+                key = (region.name, rule.name)
+                if rule not in fired:
+                    last = self.rule_fired.get(key)
+                    if rule.cooldown and last is not None and clock - last < rule.cooldown:
+                        continue
+                    self.rule_fired[key] = clock
+                    fired[rule] = ([], [])
+                fired[rule][0].extend(keywords)
+                fired[rule][1].append(line)
+                break
+
+        return [(rule, list(dict.fromkeys(keywords)), lines)
+                for rule, (keywords, lines) in fired.items()]
+
+    @staticmethod
+    def hit_keywords(hits):
+        """规则命中结果中的所有关键词（去重）"""
+        return list(dict.fromkeys(keyword for _, keywords, _ in hits for keyword in keywords))
+
+    def check_cities_in_text(self, text, region=None):
+        """检查文本中是否包含城市名称（或其他规则的关键词）"""
+        return self.hit_keywords(self.check_rules(text, region))
+
+    def send_reply(self, region=None, reply_text=None):
+        """发送回复（默认为区域的回复内容），返回是否成功"""
+        region = region or self.regions[0]
+        reply_text = region.reply_text if reply_text is None else reply_text
+        try:
+            # 多区域监控时先点击该群的输入框，确认窗口后粘贴（或逐字输入）并回车
+            reply_input = self.reply_input
+            if reply_input is None:
+                config = self.snapshot.config
+                if config.get('capture_backend') == 'replay':
+                    # 回放的是录制的画面，回复不能输入到当前的前台窗口
+                    reply_input = self.reply_input = DryRunInput()
+                else:
+                    reply_input = self.reply_input = ReplyInput(
+                        config.get('reply_method', 'paste'), config.get('target_window_title', ''),
+                        log=self.log, allow_unknown_title=config.get('allow_unknown_window', False))
+            reply_input.send(reply_text, region.input_point, region.target_title)
+
+            if reply_input.dry_run:
+                self.log(f"[{region.name}] 回放模式，模拟回复（未实际发送）: {reply_text}")
+            else:
+                self.log(f"[{region.name}] 已发送回复: {reply_text}")
+            return True
+
+        except Exception as e:
+            self.log(f"发送回复失败: {str(e)}", 'error')
+            return False
+
+    def calibrate_preprocess(self, min_accuracy=0.9):
+        """对当前截图区域校准预处理缩放比例，返回(最佳比例, 各比例结果)"""
+        screenshot = self.capture_screen()
+        if screenshot is None:
+            raise RuntimeError("截图失败，无法校准")
+
+        best_scale, results = calibrate_scale(screenshot, self.get_ocr(), min_accuracy=min_accuracy)
+        for result in results:
+            self.log(f"缩放 {result['scale']}: 耗时 {result['latency_ms']}ms, "
+                     f"准确率 {result['accuracy']:.0%}")
+
+        self.config['preprocess_scale'] = best_scale
+        self.compile_config()
+        self.log(f"预处理缩放比例已校准为 {best_scale}")
+        return best_scale, results
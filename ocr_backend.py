@@ -0,0 +1,407 @@
+
+import ctypes
+import ctypes.util
+import os
+import shutil
+import sys
+import threading
+import time
+
+TESSERACT_CMD = r"C:\Program Files (x86)\Tesseract-OCR\tesseract.exe"
+
+# pytesseract导入较慢（会连带导入pandas等），首次使用时才导入
+_pytesseract_module = None
+
+OCR_LANG = 'chi_sim'
+
+# 与tesseract命令行默认值一致的页面分割模式（PSM_AUTO）
+PAGE_SEG_MODE = 3
+
+# Tesseract结果迭代的层级：文本行
+RIL_TEXTLINE = 2
+
+
+class OcrLine:
+    """一行识别结果：文字、在图像中的位置(left, top, right, bottom)和置信度(0-100)"""
+    __slots__ = ('text', 'box', 'confidence')
+
+    def __init__(self, text, box, confidence):
+        self.text = text
+        self.box = box
+        self.confidence = confidence
+
+    def __repr__(self):
+        return f"OcrLine({self.text!r}, {self.box}, {self.confidence:.0f})"
+
+
+def _join_words(words):
+    """把一行中的词拼成文字：中文之间不加空格，英文和数字之间保留空格"""
+    text = ''
+    for word in words:
+        if text and _is_latin(text[-1]) and _is_latin(word[0]):
+            text += ' '
+        text += word
+    return text
+
+
+def _is_latin(char):
+    """英文字母或数字"""
+    return char.isascii() and char.isalnum()
+
+
+def filter_lines(lines, min_confidence):
+    """去掉置信度低于min_confidence的行和空行"""
+    return [line for line in lines if line.text and line.confidence >= min_confidence]
+
+
+def lines_to_text(lines):
+    """多行识别结果拼成文本"""
+    return '\n'.join(line.text for line in lines)
+
+
+def _pytesseract():
+    """导入pytesseract（只在第一次调用时导入），Windows默认安装路径存在时使用该路径，否则从PATH查找"""
+    global _pytesseract_module
+    if _pytesseract_module is None:
+        import pytesseract
+        if os.path.isfile(TESSERACT_CMD):
+            pytesseract.pytesseract.tesseract_cmd = TESSERACT_CMD
+        _pytesseract_module = pytesseract
+    return _pytesseract_module
+
+
+class PytesseractBackend:
+    """pytesseract后端：每次调用启动一个tesseract进程（兜底方案）"""
+    name = 'pytesseract'
+
+    def __init__(self, lang=OCR_LANG):
+        self.lang = lang
+        self.pytesseract = _pytesseract()
+
+    def image_to_string(self, image):
+        """识别图像中的文字"""
+        return self.pytesseract.image_to_string(image, lang=self.lang)
+
+    def image_to_lines(self, image):
+        """识别图像，返回每行的文字、位置和置信度（一次tesseract调用）"""
+        pytesseract = self.pytesseract
+        data = pytesseract.image_to_data(image, lang=self.lang, output_type=pytesseract.Output.DICT)
+
+        # 按(块, 段, 行)把词归成行
+        grouped = {}
+        for i, word in enumerate(data['text']):
+            confidence = float(data['conf'][i])
+            word = word.strip()
+            if confidence < 0 or not word:
+                continue
+            key = (data['block_num'][i], data['par_num'][i], data['line_num'][i])
+            box = (data['left'][i], data['top'][i],
+                   data['left'][i] + data['width'][i], data['top'][i] + data['height'][i])
+            grouped.setdefault(key, []).append((word, box, confidence))
+
+        lines = []
+        for words in grouped.values():
+            boxes = [box for _, box, _ in words]
+            lines.append(OcrLine(_join_words([word for word, _, _ in words]),
+                                 (min(b[0] for b in boxes), min(b[1] for b in boxes),
+                                  max(b[2] for b in boxes), max(b[3] for b in boxes)),
+                                 sum(confidence for _, _, confidence in words) / len(words)))
+        return lines
+
+    def close(self):
+        """释放资源"""
+        pass
+
+
+class TesserocrBackend:
+    """tesserocr后端：进程内常驻的Tesseract引擎，语言数据只加载一次"""
+    name = 'tesserocr'
+
+    def __init__(self, lang=OCR_LANG):
+        import tesserocr
+
+        tessdata = _find_tessdata()
+        kwargs = {'lang': lang, 'psm': PAGE_SEG_MODE}
+        if tessdata:
+            kwargs['path'] = tessdata
+        self.api = tesserocr.PyTessBaseAPI(**kwargs)
+        self.lock = threading.Lock()
+
+    def image_to_string(self, image):
+        """识别图像中的文字"""
+        with self.lock:
+            self.api.SetImage(image)
+            return self.api.GetUTF8Text()
+
+    def image_to_lines(self, image):
+        """识别图像，返回每行的文字、位置和置信度（一次识别）"""
+        import tesserocr
+
+        level = tesserocr.RIL.TEXTLINE
+        lines = []
+        with self.lock:
+            self.api.SetImage(image)
+            self.api.Recognize()
+            iterator = self.api.GetIterator()
+            if iterator is None:
+                return lines
+            for item in tesserocr.iterate_level(iterator, level):
+                text = item.GetUTF8Text(level)
+                box = item.BoundingBox(level)
+                if text and box:
+                    lines.append(OcrLine(text.strip(), tuple(box), item.Confidence(level)))
+        return lines
+
+    def close(self):
+        """释放资源"""
+        with self.lock:
+            self.api.End()
+
+
+class CApiBackend:
+    """Tesseract C API后端：通过ctypes直接调用libtesseract，引擎常驻内存"""
+    name = 'capi'
+
+    def __init__(self, lang=OCR_LANG):
+        self.lib = _load_libtesseract()
+        self._declare_functions()
+
+        self.api = self.lib.TessBaseAPICreate()
+        tessdata = _find_tessdata()
+        datapath = tessdata.encode('utf-8') if tessdata else None
+        if self.lib.TessBaseAPIInit3(self.api, datapath, lang.encode('utf-8')) != 0:
+            self.lib.TessBaseAPIDelete(self.api)
+            raise RuntimeError(f"Tesseract初始化失败，请检查{lang}语言包")
+
+        self.lib.TessBaseAPISetPageSegMode(self.api, PAGE_SEG_MODE)
+        self.lock = threading.Lock()
+
+    def _declare_functions(self):
+        """声明C函数签名"""
+        lib = self.lib
+        lib.TessBaseAPICreate.restype = ctypes.c_void_p
+        lib.TessBaseAPIInit3.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_char_p]
+        lib.TessBaseAPIInit3.restype = ctypes.c_int
+        lib.TessBaseAPISetPageSegMode.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        lib.TessBaseAPISetImage.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_int,
+                                            ctypes.c_int, ctypes.c_int, ctypes.c_int]
+        lib.TessBaseAPISetSourceResolution.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        lib.TessBaseAPIGetUTF8Text.argtypes = [ctypes.c_void_p]
+        lib.TessBaseAPIGetUTF8Text.restype = ctypes.c_void_p
+        lib.TessDeleteText.argtypes = [ctypes.c_void_p]
+        lib.TessBaseAPIRecognize.argtypes = [ctypes.c_void_p, ctypes.c_void_p]
+        lib.TessBaseAPIRecognize.restype = ctypes.c_int
+        lib.TessBaseAPIGetIterator.argtypes = [ctypes.c_void_p]
+        lib.TessBaseAPIGetIterator.restype = ctypes.c_void_p
+        lib.TessResultIteratorGetPageIterator.argtypes = [ctypes.c_void_p]
+        lib.TessResultIteratorGetPageIterator.restype = ctypes.c_void_p
+        lib.TessResultIteratorGetUTF8Text.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        lib.TessResultIteratorGetUTF8Text.restype = ctypes.c_void_p
+        lib.TessResultIteratorConfidence.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        lib.TessResultIteratorConfidence.restype = ctypes.c_float
+        lib.TessResultIteratorNext.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        lib.TessResultIteratorNext.restype = ctypes.c_int
+        lib.TessResultIteratorDelete.argtypes = [ctypes.c_void_p]
+        lib.TessPageIteratorBoundingBox.argtypes = [ctypes.c_void_p, ctypes.c_int] + \
+            [ctypes.POINTER(ctypes.c_int)] * 4
+        lib.TessPageIteratorBoundingBox.restype = ctypes.c_int
+        lib.TessBaseAPIClear.argtypes = [ctypes.c_void_p]
+        lib.TessBaseAPIEnd.argtypes = [ctypes.c_void_p]
+        lib.TessBaseAPIDelete.argtypes = [ctypes.c_void_p]
+
+    def _set_image(self, image):
+        """把图像交给引擎（调用方需持有锁）"""
+        if image.mode not in ('L', 'RGB'):
+            image = image.convert('RGB')
+        bytes_per_pixel = 1 if image.mode == 'L' else 3
+        data = image.tobytes()
+        self.lib.TessBaseAPISetImage(self.api, data, image.width, image.height,
+                                     bytes_per_pixel, image.width * bytes_per_pixel)
+        self.lib.TessBaseAPISetSourceResolution(self.api, 96)
+
+    def image_to_string(self, image):
+        """识别图像中的文字"""
+        with self.lock:
+            self._set_image(image)
+            text_ptr = self.lib.TessBaseAPIGetUTF8Text(self.api)
+            try:
+                return ctypes.string_at(text_ptr).decode('utf-8') if text_ptr else ""
+            finally:
+                if text_ptr:
+                    self.lib.TessDeleteText(text_ptr)
+                self.lib.TessBaseAPIClear(self.api)
+
+    def image_to_lines(self, image):
+        """识别图像，返回每行的文字、位置和置信度（一次识别，按行遍历结果）"""
+        lib = self.lib
+        lines = []
+        with self.lock:
+            self._set_image(image)
+            try:
+                if lib.TessBaseAPIRecognize(self.api, None) != 0:
+                    raise RuntimeError("Tesseract识别失败")
+                iterator = lib.TessBaseAPIGetIterator(self.api)
+                if not iterator:
+                    return lines
+                try:
+                    page_iterator = lib.TessResultIteratorGetPageIterator(iterator)
+                    coords = [ctypes.c_int() for _ in range(4)]
+                    while True:
+                        text_ptr = lib.TessResultIteratorGetUTF8Text(iterator, RIL_TEXTLINE)
+                        if text_ptr:
+                            text = ctypes.string_at(text_ptr).decode('utf-8').strip()
+                            lib.TessDeleteText(text_ptr)
+                            if lib.TessPageIteratorBoundingBox(page_iterator, RIL_TEXTLINE,
+                                                               *[ctypes.byref(c) for c in coords]):
+                                confidence = lib.TessResultIteratorConfidence(iterator, RIL_TEXTLINE)
+                                lines.append(OcrLine(text, tuple(c.value for c in coords), confidence))
+                        if not lib.TessResultIteratorNext(iterator, RIL_TEXTLINE):
+                            break
+                finally:
+                    lib.TessResultIteratorDelete(iterator)
+            finally:
+                lib.TessBaseAPIClear(self.api)
+        return lines
+
+    def close(self):
+        """释放资源"""
+        with self.lock:
+            if self.api:
+                self.lib.TessBaseAPIEnd(self.api)
+                self.lib.TessBaseAPIDelete(self.api)
+                self.api = None
+
+
+BACKENDS = {
+    'tesserocr': TesserocrBackend,
+    'capi': CApiBackend,
+    'pytesseract': PytesseractBackend,
+}
+
+# auto模式下的尝试顺序：常驻引擎优先，pytesseract兜底
+AUTO_ORDER = ['tesserocr', 'capi', 'pytesseract']
+
+
+def _tesseract_dir():
+    """
+    Tesseract安装目录：Windows默认安装路径，否则为PATH中tesseract程序所在目录，找不到时返回None
+    （不导入pytesseract，常驻引擎后端不需要它）
+    """
+    if os.path.isfile(TESSERACT_CMD):
+        return os.path.dirname(TESSERACT_CMD)
+    found = shutil.which('tesseract')
+    return os.path.dirname(os.path.realpath(found)) if found else None
+
+
+def _find_tessdata():
+    """查找tessdata目录，找不到时返回None（使用库的默认路径）"""
+    if os.environ.get('TESSDATA_PREFIX'):
+        return os.environ['TESSDATA_PREFIX']
+
+    install_dir = _tesseract_dir()
+    if install_dir is None:
+        return None
+    # Windows安装包放在程序旁边，Homebrew等放在 <前缀>/share/tessdata
+    for tessdata in (os.path.join(install_dir, 'tessdata'),
+                     os.path.join(os.path.dirname(install_dir), 'share', 'tessdata')):
+        if os.path.isdir(tessdata):
+            return tessdata
+    return None
+
+
+def _load_libtesseract():
+    """加载libtesseract动态库"""
+    candidates = []
+    if sys.platform == 'win32':
+        install_dir = _tesseract_dir()
+        if install_dir and os.path.isdir(install_dir):
+            candidates += [os.path.join(install_dir, name) for name in os.listdir(install_dir)
+                           if name.startswith('libtesseract') and name.endswith('.dll')]
+            os.add_dll_directory(install_dir)
+    found = ctypes.util.find_library('tesseract')
+    if found:
+        candidates.append(found)
+    candidates += ['libtesseract.so.5', 'libtesseract.so.4', 'libtesseract.dylib']
+
+    for candidate in candidates:
+        try:
+            return ctypes.CDLL(candidate)
+        except OSError:
+            continue
+    raise OSError("找不到libtesseract动态库")
+
+
+def create_ocr_backend(name='auto', lang=OCR_LANG, log=None):
+    """创建OCR后端，auto模式下依次尝试，失败时回退到pytesseract"""
+    order = AUTO_ORDER if name == 'auto' else list(dict.fromkeys([name, 'pytesseract']))
+    for backend_name in order:
+        try:
+            return BACKENDS[backend_name](lang)
+        except Exception as e:
+            # auto模式下常驻引擎不可用属于正常情况，不打扰用户
+            if log and name != 'auto':
+                log(f"OCR后端{backend_name}不可用: {str(e)}", 'warning')
+    raise RuntimeError("没有可用的OCR后端")
+
+
+def measure_latency(backend, image, repeat=5):
+    """测量单次识别耗时（毫秒），首次调用单独统计"""
+    start = time.perf_counter()
+    backend.image_to_string(image)
+    first_ms = (time.perf_counter() - start) * 1000
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        backend.image_to_string(image)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    return {
+        'backend': backend.name,
+        'first_ms': round(first_ms, 1),
+        'mean_ms': round(sum(timings) / len(timings), 1),
+        'min_ms': round(min(timings), 1),
+    }
+
+
+def compare_backends(image, repeat=5, lang=OCR_LANG):
+    """对所有可用后端测量识别耗时，返回结果列表"""
+    results = []
+    for backend_name, backend_class in BACKENDS.items():
+        try:
+            start = time.perf_counter()
+            backend = backend_class(lang)
+            init_ms = (time.perf_counter() - start) * 1000
+        except Exception as e:
+            results.append({'backend': backend_name, 'error': str(e)})
+            continue
+
+        try:
+            result = measure_latency(backend, image, repeat)
+            result['init_ms'] = round(init_ms, 1)
+            results.append(result)
+        except Exception as e:
+            results.append({'backend': backend_name, 'error': str(e)})
+        finally:
+            backend.close()
+    return results
+
+
+def format_latency(result):
+    """格式化一条耗时测量结果"""
+    if 'error' in result:
+        return f"{result['backend']}: 不可用 ({result['error']})"
+    return (f"{result['backend']}: 初始化 {result['init_ms']}ms, 首次 {result['first_ms']}ms, "
+            f"平均 {result['mean_ms']}ms, 最快 {result['min_ms']}ms")
+
+
+if __name__ == "__main__":
+    from PIL import Image
+
+    if len(sys.argv) < 2:
+        print("用法: python ocr_backend.py <图片路径> [重复次数]")
+        sys.exit(1)
+
+    repeat_count = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    for item in compare_backends(Image.open(sys.argv[1]), repeat_count):
+        print(format_latency(item))
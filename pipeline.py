@@ -0,0 +1,94 @@
+
+import threading
+import time
+from collections import deque, OrderedDict
+
+
+def union_box(box_a, box_b):
+    """两个区域(left, top, right, bottom)的包围框"""
+    return (min(box_a[0], box_b[0]), min(box_a[1], box_b[1]),
+            max(box_a[2], box_b[2]), max(box_a[3], box_b[3]))
+
+
+class FrameSlot:
+    """
+    截图→OCR之间的帧槽位：每个监控区域只保留最新一帧，OCR来不及处理时覆盖旧帧
+    被覆盖的旧帧变化区域会合并到新帧中（按滚动量平移），不会漏掉变化
+    多个区域按等待先后依次取出，多个OCR线程可同时取帧
+    """
+    def __init__(self):
+        self.pending = OrderedDict()
+        self.closed = False
+        self.coalesced = 0
+        self.cond = threading.Condition()
+
+    def put(self, image, box, scroll=0, captured_at=None, key=None):
+        """
+        放入一帧及其变化区域，scroll为相对上一帧向上滚动的行数
+        返回是否与该区域未处理的旧帧合并
+        """
+        captured_at = captured_at or time.time()
+        with self.cond:
+            coalesced = key in self.pending
+            if coalesced:
+                _, old_box, old_captured_at = self.pending[key]
+                left, top, right, bottom = old_box
+                shifted = (left, max(0, top - scroll), right, max(0, bottom - scroll))
+                if shifted[3] > shifted[1]:
+                    box = union_box(shifted, box)
+                captured_at = old_captured_at
+                self.coalesced += 1
+            self.pending[key] = (image, box, captured_at)
+            self.cond.notify()
+            return coalesced
+
+    def take(self, timeout=None):
+        """取出等待最久的区域的最新一帧(key, image, box, captured_at)，关闭或超时返回None"""
+        with self.cond:
+            if not self.pending and not self.closed:
+                self.cond.wait(timeout)
+            if not self.pending:
+                return None
+            key, (image, box, captured_at) = self.pending.popitem(last=False)
+            return key, image, box, captured_at
+
+    def close(self):
+        """关闭槽位，唤醒等待的线程"""
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+
+class DropQueue:
+    """有界队列：满时丢弃最旧的元素，生产者永不阻塞"""
+    def __init__(self, maxsize=8):
+        self.items = deque(maxlen=maxsize)
+        self.closed = False
+        self.dropped = 0
+        self.cond = threading.Condition()
+
+    def put(self, item):
+        """放入元素，返回是否丢弃了旧元素"""
+        with self.cond:
+            dropped = len(self.items) == self.items.maxlen
+            if dropped:
+                self.dropped += 1
+            self.items.append(item)
+            self.cond.notify()
+            return dropped
+
+    def get(self, timeout=None):
+        """取出最早的元素，关闭或超时返回None"""
+        with self.cond:
+            if not self.items and not self.closed:
+                self.cond.wait(timeout)
+            return self.items.popleft() if self.items else None
+
+    def __len__(self):
+        return len(self.items)
+
+    def close(self):
+        """关闭队列，唤醒等待的线程"""
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
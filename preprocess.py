@@ -0,0 +1,130 @@
+
+import difflib
+import time
+import numpy as np
+from PIL import Image
+
+# 候选缩放比例（校准时逐个尝试）
+CALIBRATION_SCALES = (0.5, 0.75, 1.0, 1.25, 1.5, 2.0)
+
+
+def to_grayscale(frame):
+    """RGB转灰度（ITU-R 601加权）"""
+    if isinstance(frame, Image.Image):
+        return np.asarray(frame.convert('L'))
+    frame = np.asarray(frame)
+    if frame.ndim == 2:
+        return frame.astype(np.uint8, copy=False)
+    rgb = frame[:, :, :3].astype(np.uint16)
+    gray = (rgb[:, :, 0] * 77 + rgb[:, :, 1] * 150 + rgb[:, :, 2] * 29) >> 8
+    return gray.astype(np.uint8)
+
+
+def box_sum(gray, radius):
+    """积分图计算每个像素(2r+1)x(2r+1)邻域的灰度和"""
+    size = 2 * radius + 1
+    padded = np.pad(gray, radius, mode='edge')
+    integral = np.zeros((padded.shape[0] + 1, padded.shape[1] + 1), dtype=np.int32)
+    np.cumsum(padded, axis=0, dtype=np.int32, out=integral[1:, 1:])
+    np.cumsum(integral[1:, 1:], axis=1, out=integral[1:, 1:])
+    return (integral[size:, size:] - integral[:-size, size:]
+            - integral[size:, :-size] + integral[:-size, :-size])
+
+
+def adaptive_threshold(gray, radius=15, offset=30):
+    """自适应阈值：比邻域均值暗offset以上的像素视为文字，输出白底黑字"""
+    area = (2 * radius + 1) ** 2
+    # 整数比较，避免逐像素做除法
+    text_mask = gray.astype(np.int32) * area < box_sum(gray, radius) - offset * area
+    return np.where(text_mask, 0, 255).astype(np.uint8)
+
+
+def trim_background(binary, margin=4):
+    """裁掉四周没有文字的空白背景，返回(图像, 左, 上)，整幅无文字时图像为None"""
+    ink = binary == 0
+    rows = np.flatnonzero(ink.any(axis=1))
+    if len(rows) == 0:
+        return None, 0, 0
+    cols = np.flatnonzero(ink.any(axis=0))
+
+    top = max(0, rows[0] - margin)
+    bottom = min(binary.shape[0], rows[-1] + 1 + margin)
+    left = max(0, cols[0] - margin)
+    right = min(binary.shape[1], cols[-1] + 1 + margin)
+    return binary[top:bottom, left:right], int(left), int(top)
+
+
+class Preprocessor:
+    """OCR前的图像预处理：灰度化、缩放、自适应二值化、去背景"""
+    def __init__(self, scale=1.0, radius=15, offset=30):
+        self.scale = scale
+        self.radius = radius
+        self.offset = offset
+
+    def process(self, image):
+        """
+        处理截图，返回(处理后图像, (左, 上, 缩放比例))
+        处理后坐标(x, y)对应原图((x + 左) / 缩放比例, (y + 上) / 缩放比例)
+        没有文字时图像为None
+        """
+        gray = to_grayscale(image)
+
+        # 深色模式下反色，统一为浅底深字
+        if np.median(gray) < 128:
+            gray = 255 - gray
+
+        if self.scale != 1.0:
+            width = max(1, int(round(gray.shape[1] * self.scale)))
+            height = max(1, int(round(gray.shape[0] * self.scale)))
+            gray = np.asarray(Image.fromarray(gray).resize((width, height), Image.BILINEAR))
+
+        radius = max(3, int(round(self.radius * self.scale)))
+        binary = adaptive_threshold(gray, radius, self.offset)
+        binary, left, top = trim_background(binary)
+        if binary is None:
+            return None, (0, 0, self.scale)
+        return Image.fromarray(binary), (left, top, self.scale)
+
+
+def text_similarity(text, reference):
+    """去除空白后的字符相似度（0-1）"""
+    text = ''.join(text.split())
+    reference = ''.join(reference.split())
+    if not reference:
+        return 1.0 if not text else 0.0
+    return difflib.SequenceMatcher(None, text, reference).ratio()
+
+
+def calibrate_scale(image, ocr, scales=CALIBRATION_SCALES, min_accuracy=0.9, repeat=2,
+                    reference_text=None):
+    """
+    校准预处理缩放比例：对每个候选比例测量识别耗时和准确率
+    准确率以未预处理原图的识别结果（或给定的参考文本）为基准
+    返回(最佳比例, 结果列表)，最佳比例为准确率达标的最快比例
+    """
+    if reference_text is None:
+        reference_text = ocr.image_to_string(image)
+
+    results = []
+    for scale in scales:
+        preprocessor = Preprocessor(scale=scale)
+        timings = []
+        text = ""
+        for _ in range(repeat):
+            start = time.perf_counter()
+            processed, _ = preprocessor.process(image)
+            text = ocr.image_to_string(processed) if processed is not None else ""
+            timings.append((time.perf_counter() - start) * 1000)
+
+        results.append({
+            'scale': scale,
+            'latency_ms': round(min(timings), 1),
+            'accuracy': round(text_similarity(text, reference_text), 3),
+        })
+
+    acceptable = [r for r in results if r['accuracy'] >= min_accuracy]
+    if acceptable:
+        best = min(acceptable, key=lambda r: r['latency_ms'])
+    else:
+        best = max(results, key=lambda r: (r['accuracy'], -r['latency_ms']))
+    return best['scale'], results
@@ -0,0 +1,196 @@
+
+import threading
+import time
+from collections import deque, OrderedDict
+
+DROP_POLICIES = ('oldest', 'newest')
+
+
+class TokenBucket:
+    """令牌桶限速：平均每秒rate次，最多连续burst次；rate为0表示不限速"""
+    def __init__(self, rate=0.5, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def configure(self, rate, burst):
+        """调整速率，立即生效"""
+        with self.lock:
+            self._refill()
+            self.rate = rate
+            self.burst = burst
+            self.tokens = min(self.tokens, float(burst))
+
+    def _refill(self):
+        """按经过的时间补充令牌（调用方需持有锁）"""
+        now = time.monotonic()
+        if self.rate:
+            self.tokens = min(float(self.burst), self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+    def reserve(self):
+        """尝试取一个令牌，成功返回0，否则返回还需等待的秒数"""
+        with self.lock:
+            if not self.rate:
+                return 0
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    def refund(self):
+        """退还一个取得后未使用的令牌"""
+        with self.lock:
+            if self.rate:
+                self.tokens = min(float(self.burst), self.tokens + 1)
+
+    def acquire(self, stop_event):
+        """等待并取得一个令牌，stop_event置位时放弃并返回False"""
+        while True:
+            wait = self.reserve()
+            if not wait:
+                return True
+            if stop_event.wait(wait):
+                return False
+
+
+class ReplyDispatcher:
+    """
+    回复调度：检测结果放入有界队列后立即返回，由独立线程按令牌桶限速发送
+    同一区域在合并窗口内到达的多条检测结果合并为一次回复
+    队列满时按drop_policy丢弃最早(oldest)或新到(newest)的检测结果
+    暂停期间不发送，待发送的检测结果保留到恢复后发送
+    被丢弃的检测结果（队列满或关闭时尚未发送）逐条交给on_drop(检测结果, 原因)，原因为'full'或'stopped'
+    """
+    def __init__(self, send, rate=0.5, burst=1, coalesce_window=0.5, maxsize=16,
+                 drop_policy='oldest', on_drop=None):
+        self.send = send
+        self.on_drop = on_drop
+        self.bucket = TokenBucket(rate, burst)
+        self.coalesce_window = coalesce_window
+        self.maxsize = maxsize
+        self.drop_policy = drop_policy
+
+        self.items = deque()
+        self.cond = threading.Condition()
+        self.stop_event = threading.Event()
+        self.resumed = threading.Event()
+        self.resumed.set()
+        self.closed = False
+        self.dropped = 0
+        self.coalesced = 0
+        self.thread = None
+
+    def configure(self, rate, burst, coalesce_window, maxsize, drop_policy):
+        """调整限速、合并窗口和队列，立即生效"""
+        self.bucket.configure(rate, burst)
+        with self.cond:
+            self.coalesce_window = coalesce_window
+            self.maxsize = maxsize
+            self.drop_policy = drop_policy
+
+    def pause(self):
+        """暂停发送（正在等待令牌的回复也不再发送，恢复后再发送）"""
+        self.resumed.clear()
+
+    def resume(self):
+        """恢复发送"""
+        self.resumed.set()
+
+    def start(self):
+        """启动发送线程"""
+        self.thread = threading.Thread(target=self.run, name='reply', daemon=True)
+        self.thread.start()
+
+    def submit(self, key, detection):
+        """放入一条检测结果（不阻塞），返回是否被接受"""
+        dropped = None
+        with self.cond:
+            if self.closed:
+                return False
+            if len(self.items) >= self.maxsize:
+                self.dropped += 1
+                if self.drop_policy == 'newest':
+                    dropped = detection
+                else:
+                    dropped = self.items.popleft()[2]
+            if dropped is not detection:
+                self.items.append((time.monotonic(), key, detection))
+                self.cond.notify()
+
+        if dropped is not None and self.on_drop:
+            self.on_drop(dropped, 'full')
+        return dropped is not detection
+
+    def __len__(self):
+        return len(self.items)
+
+    def take_batch(self):
+        """等待第一条检测结果和合并窗口结束，按区域合并后取出；关闭时返回None"""
+        with self.cond:
+            while not self.items and not self.closed:
+                self.cond.wait(1)  # 定时醒来检查是否已关闭
+            if self.closed:
+                return None
+            first_arrival = self.items[0][0]
+
+        # 合并窗口：从第一条到达开始计时，期间同一区域的检测结果一起回复
+        remaining = self.coalesce_window - (time.monotonic() - first_arrival)
+        if remaining > 0 and self.stop_event.wait(remaining):
+            return None
+
+        batch = OrderedDict()
+        with self.cond:
+            while self.items:
+                _, key, detection = self.items.popleft()
+                batch.setdefault(key, []).append(detection)
+        self.coalesced += sum(len(detections) - 1 for detections in batch.values())
+        return batch
+
+    def run(self):
+        """发送线程：合并、限速后调用send(key, 检测结果列表)"""
+        while True:
+            batch = self.take_batch()
+            if batch is None:
+                return
+
+            pending = list(batch.values())
+            for key, detections in batch.items():
+                if not self.wait_turn():
+                    self.drop_unsent([d for group in pending for d in group])
+                    return
+                pending.pop(0)
+                self.send(key, detections)
+
+    def wait_turn(self):
+        """等到未暂停且取得令牌，等待令牌期间被暂停时退还令牌、恢复后重新取；停止时返回False"""
+        while True:
+            self.resumed.wait()
+            if self.stop_event.is_set() or not self.bucket.acquire(self.stop_event):
+                return False
+            if self.resumed.is_set():
+                return True
+            self.bucket.refund()
+
+    def drop_unsent(self, detections):
+        """关闭时丢弃尚未发送的检测结果"""
+        with self.cond:
+            self.dropped += len(detections)
+        if self.on_drop:
+            for detection in detections:
+                self.on_drop(detection, 'stopped')
+
+    def close(self):
+        """停止发送线程，未发送的检测结果按'stopped'丢弃，返回丢弃的条数"""
+        with self.cond:
+            self.closed = True
+            unsent = [detection for _, _, detection in self.items]
+            self.items.clear()
+            self.cond.notify_all()
+        self.stop_event.set()
+        self.resumed.set()  # 唤醒暂停中的发送线程
+        self.drop_unsent(unsent)
+        return len(unsent)
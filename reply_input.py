@@ -0,0 +1,348 @@
+
+import ctypes
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+REPLY_METHODS = ('paste', 'typewrite')
+
+CF_UNICODETEXT = 13
+GMEM_MOVEABLE = 0x0002
+
+
+class WindowsClipboard:
+    """Windows剪贴板：通过user32/kernel32读写Unicode文本"""
+    name = 'win32'
+
+    def __init__(self):
+        from ctypes import wintypes
+
+        self.user32 = ctypes.WinDLL('user32', use_last_error=True)
+        self.kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
+
+        user32, kernel32 = self.user32, self.kernel32
+        user32.OpenClipboard.argtypes = [wintypes.HWND]
+        user32.OpenClipboard.restype = wintypes.BOOL
+        user32.CloseClipboard.restype = wintypes.BOOL
+        user32.EmptyClipboard.restype = wintypes.BOOL
+        user32.IsClipboardFormatAvailable.argtypes = [wintypes.UINT]
+        user32.IsClipboardFormatAvailable.restype = wintypes.BOOL
+        user32.GetClipboardData.argtypes = [wintypes.UINT]
+        user32.GetClipboardData.restype = wintypes.HANDLE
+        user32.SetClipboardData.argtypes = [wintypes.UINT, wintypes.HANDLE]
+        user32.SetClipboardData.restype = wintypes.HANDLE
+        user32.GetForegroundWindow.restype = wintypes.HWND
+        user32.GetWindowTextLengthW.argtypes = [wintypes.HWND]
+        user32.GetWindowTextW.argtypes = [wintypes.HWND, wintypes.LPWSTR, ctypes.c_int]
+        kernel32.GlobalAlloc.argtypes = [wintypes.UINT, ctypes.c_size_t]
+        kernel32.GlobalAlloc.restype = wintypes.HGLOBAL
+        kernel32.GlobalLock.argtypes = [wintypes.HGLOBAL]
+        kernel32.GlobalLock.restype = ctypes.c_void_p
+        kernel32.GlobalUnlock.argtypes = [wintypes.HGLOBAL]
+        kernel32.GlobalFree.argtypes = [wintypes.HGLOBAL]
+
+    def _open(self):
+        """打开剪贴板，被其他程序占用时短暂重试"""
+        for _ in range(10):
+            if self.user32.OpenClipboard(None):
+                return
+            time.sleep(0.01)
+        raise RuntimeError("剪贴板被其他程序占用")
+
+    def get_text(self):
+        """读取剪贴板文本，不是文本时返回None"""
+        if not self.user32.IsClipboardFormatAvailable(CF_UNICODETEXT):
+            return None
+        self._open()
+        try:
+            handle = self.user32.GetClipboardData(CF_UNICODETEXT)
+            if not handle:
+                return None
+            pointer = self.kernel32.GlobalLock(handle)
+            try:
+                return ctypes.wstring_at(pointer)
+            finally:
+                self.kernel32.GlobalUnlock(handle)
+        finally:
+            self.user32.CloseClipboard()
+
+    def set_text(self, text):
+        """写入剪贴板文本"""
+        data = (text + '\0').encode('utf-16-le')
+        handle = self.kernel32.GlobalAlloc(GMEM_MOVEABLE, len(data))
+        if not handle:
+            raise RuntimeError("分配剪贴板内存失败")
+        pointer = self.kernel32.GlobalLock(handle)
+        ctypes.memmove(pointer, data, len(data))
+        self.kernel32.GlobalUnlock(handle)
+
+        self._open()
+        try:
+            self.user32.EmptyClipboard()
+            if not self.user32.SetClipboardData(CF_UNICODETEXT, handle):
+                self.kernel32.GlobalFree(handle)
+                raise RuntimeError("写入剪贴板失败")
+        finally:
+            self.user32.CloseClipboard()
+
+    def active_window_title(self):
+        """前台窗口标题"""
+        hwnd = self.user32.GetForegroundWindow()
+        if not hwnd:
+            return ''
+        length = self.user32.GetWindowTextLengthW(hwnd)
+        buffer = ctypes.create_unicode_buffer(length + 1)
+        self.user32.GetWindowTextW(hwnd, buffer, length + 1)
+        return buffer.value
+
+
+class CommandClipboard:
+    """通过命令行工具读写剪贴板（macOS: pbcopy/pbpaste，Linux: xclip/xsel/wl-clipboard）"""
+    COMMANDS = [
+        ('pbcopy', ['pbcopy'], ['pbpaste']),
+        ('xclip', ['xclip', '-selection', 'clipboard', '-i'], ['xclip', '-selection', 'clipboard', '-o']),
+        ('xsel', ['xsel', '--clipboard', '--input'], ['xsel', '--clipboard', '--output']),
+        ('wl-copy', ['wl-copy'], ['wl-paste', '--no-newline']),
+    ]
+
+    def __init__(self):
+        for name, copy_command, paste_command in self.COMMANDS:
+            if shutil.which(copy_command[0]) and shutil.which(paste_command[0]):
+                self.name = name
+                self.copy_command = copy_command
+                self.paste_command = paste_command
+                break
+        else:
+            raise RuntimeError("找不到剪贴板工具（需要xclip、xsel或wl-clipboard）")
+
+    def get_text(self):
+        """读取剪贴板文本，为空或不是文本时返回None"""
+        result = subprocess.run(self.paste_command, capture_output=True, timeout=2)
+        if result.returncode != 0:
+            return None
+        try:
+            return result.stdout.decode('utf-8')
+        except UnicodeDecodeError:
+            return None
+
+    def set_text(self, text):
+        """写入剪贴板文本"""
+        subprocess.run(self.copy_command, input=text.encode('utf-8'), check=True, timeout=2)
+
+
+# macOS：前台程序名和它最前面的窗口标题（需要在“辅助功能”中授权）
+MAC_TITLE_SCRIPT = '''
+tell application "System Events"
+    set frontApp to first application process whose frontmost is true
+    set title to name of frontApp
+    try
+        set title to title & " " & (name of front window of frontApp)
+    end try
+    return title
+end tell
+'''
+
+
+def _command_output(command):
+    """运行命令返回输出文本，失败时返回None"""
+    try:
+        result = subprocess.run(command, capture_output=True, timeout=2)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    if result.returncode != 0:
+        return None
+    return result.stdout.decode('utf-8', 'replace').strip()
+
+
+def _mac_title():
+    """macOS前台窗口标题（osascript）"""
+    return _command_output(['osascript', '-e', MAC_TITLE_SCRIPT])
+
+
+def _xdotool_title():
+    """X11前台窗口标题（xdotool）"""
+    return _command_output(['xdotool', 'getactivewindow', 'getwindowname'])
+
+
+def _xprop_title():
+    """X11前台窗口标题（xprop，未安装xdotool时使用）"""
+    # 输出形如 _NET_ACTIVE_WINDOW(WINDOW): window id # 0x3c00007
+    active = _command_output(['xprop', '-root', '_NET_ACTIVE_WINDOW'])
+    if not active or '#' not in active:
+        return None
+    window = active.rsplit('#', 1)[1].split(',')[0].strip()
+    if int(window, 16) == 0:
+        return None
+    # 输出形如 _NET_WM_NAME(UTF8_STRING) = "标题"
+    name = _command_output(['xprop', '-id', window, '_NET_WM_NAME'])
+    if not name or '=' not in name:
+        return None
+    return name.split('=', 1)[1].strip().strip('"')
+
+
+def _sway_title():
+    """sway（Wayland）前台窗口标题"""
+    output = _command_output(['swaymsg', '-t', 'get_tree', '-r'])
+    if not output:
+        return None
+    nodes = [json.loads(output)]
+    while nodes:
+        node = nodes.pop()
+        if node.get('focused'):
+            return node.get('name') or ''
+        nodes += node.get('nodes', []) + node.get('floating_nodes', [])
+    return None
+
+
+def _hyprland_title():
+    """Hyprland（Wayland）前台窗口标题"""
+    output = _command_output(['hyprctl', 'activewindow', '-j'])
+    if not output:
+        return None
+    return json.loads(output).get('title')
+
+
+def find_title_reader():
+    """当前平台可用的前台窗口标题读取函数（返回标题，读取失败时返回None），没有可用方法时返回None"""
+    if sys.platform == 'darwin':
+        return _mac_title if shutil.which('osascript') else None
+    if os.environ.get('SWAYSOCK') and shutil.which('swaymsg'):
+        return _sway_title
+    if os.environ.get('HYPRLAND_INSTANCE_SIGNATURE') and shutil.which('hyprctl'):
+        return _hyprland_title
+    if os.environ.get('DISPLAY'):
+        if shutil.which('xdotool'):
+            return _xdotool_title
+        if shutil.which('xprop'):
+            return _xprop_title
+    return None
+
+
+def create_clipboard():
+    """创建当前平台的剪贴板访问对象"""
+    if sys.platform == 'win32':
+        return WindowsClipboard()
+    return CommandClipboard()
+
+
+class DryRunInput:
+    """不实际发送的回复输入：回放录制的画面时使用，不会把按键发到当前的前台窗口"""
+    method = 'dry-run'
+    dry_run = True
+
+    def send(self, text, click_point=None, target_title=None):
+        """不操作键盘和鼠标"""
+        pass
+
+
+class ReplyInput:
+    """
+    发送回复：paste模式把回复放到剪贴板后一次粘贴（耗时与长度无关，支持中文），
+    粘贴前确认前台窗口标题包含target_title（读取标题失败时取消发送，除非allow_unknown_title；
+    当前平台没有读取标题的方法时提示一次后不检查），粘贴后恢复原剪贴板文本
+    剪贴板不可用时退回逐字输入（typewrite只能输入英文和数字），已按下粘贴键后出错不再逐字输入
+    """
+    dry_run = False
+
+    def __init__(self, method='paste', target_title='', restore_delay=0.15, log=None,
+                 allow_unknown_title=False):
+        import pyautogui
+
+        self.pyautogui = pyautogui
+        self.method = method
+        self.target_title = target_title
+        self.allow_unknown_title = allow_unknown_title
+        self.restore_delay = restore_delay
+        self.log = log
+        self.clipboard = None
+
+        # Windows的剪贴板对象同时用于读取前台窗口标题，逐字输入模式下也创建
+        try:
+            self.clipboard = create_clipboard()
+        except Exception as e:
+            if log and method == 'paste':
+                log(f"剪贴板不可用，回复改为逐字输入: {str(e)}", 'warning')
+
+        self.read_title = getattr(self.clipboard, 'active_window_title', None) or find_title_reader()
+        self.focus_warned = False
+
+        self.paste_keys = ('command', 'v') if sys.platform == 'darwin' else ('ctrl', 'v')
+
+    def check_focus(self, target_title):
+        """确认前台窗口标题包含target_title（未设置时不检查），不符合或读取标题失败时抛出RuntimeError"""
+        if not target_title:
+            return
+        if self.read_title is None:
+            if not self.focus_warned and self.log:
+                self.log("当前系统无法获取前台窗口标题（Linux可安装xdotool或xprop），发送前不检查前台窗口",
+                         'warning')
+            self.focus_warned = True
+            return
+
+        try:
+            title = self.read_title()
+        except Exception:
+            title = None  # 命令输出格式不符等
+        if title is None:
+            if self.allow_unknown_title:
+                return
+            raise RuntimeError("获取前台窗口标题失败，已取消发送（macOS需要在“辅助功能”中授权）")
+        if target_title not in title:
+            raise RuntimeError(f"前台窗口不是“{target_title}”，已取消发送")
+
+    def send(self, text, click_point=None, target_title=None):
+        """
+        发送一条回复（点击输入框、输入、回车），target_title为None时使用默认目标窗口
+        前台窗口不对时抛出RuntimeError，不会把回复发到别的窗口
+        """
+        if click_point:
+            self.pyautogui.click(*click_point)
+
+        target_title = self.target_title if target_title is None else target_title
+        self.check_focus(target_title)
+
+        if self.method == 'paste' and self.clipboard is not None:
+            try:
+                previous = self.set_clipboard(text)
+            except Exception as e:
+                # 还没有按下粘贴键，改为逐字输入不会重复发送
+                if not text.isascii():
+                    raise
+                if self.log:
+                    self.log(f"写入剪贴板失败，改为逐字输入: {str(e)}", 'warning')
+                self.typewrite(text)
+            else:
+                # 按下粘贴键后出错时回复可能已经粘贴，直接报错，不再逐字输入
+                self.paste(previous)
+        else:
+            self.typewrite(text)
+        self.pyautogui.press('enter')
+
+    def typewrite(self, text):
+        """逐字输入（每个字符一次按键，只支持英文和数字）"""
+        if not text.isascii():
+            raise RuntimeError("逐字输入不支持中文，请安装剪贴板工具或改为英文回复")
+        self.pyautogui.typewrite(text)
+
+    def set_clipboard(self, text):
+        """把回复放到剪贴板，返回原剪贴板文本（不是文本时为None）"""
+        previous = self.clipboard.get_text()
+        self.clipboard.set_text(text)
+        return previous
+
+    def paste(self, previous):
+        """按粘贴键，完成后恢复原剪贴板文本（恢复失败只记录日志）"""
+        try:
+            self.pyautogui.hotkey(*self.paste_keys)
+        finally:
+            if previous is not None:
+                # 目标程序异步读取剪贴板，稍等再恢复
+                time.sleep(self.restore_delay)
+                try:
+                    self.clipboard.set_text(previous)
+                except Exception as e:
+                    if self.log:
+                        self.log(f"恢复剪贴板失败: {str(e)}", 'warning')
@@ -0,0 +1,174 @@
+
+import re
+import time
+from keyword_matcher import KeywordMatcher, FuzzyMatcher
+
+# 由城市列表和回复内容生成的默认规则名
+DEFAULT_RULE_NAME = '城市'
+
+
+def parse_hours(hours):
+    """
+    解析生效时段，如 "08:00-22:00" 或 ["08:00-12:00", "22:00-02:00"]（可跨午夜），
+    返回[(起始分钟, 结束分钟)]，留空表示全天
+    """
+    if not hours:
+        return []
+    if isinstance(hours, str):
+        hours = [hours]
+
+    spans = []
+    for span in hours:
+        try:
+            start, end = (part.strip() for part in span.split('-'))
+            spans.append((_parse_minute(start), _parse_minute(end)))
+        except ValueError:
+            raise ValueError(f"生效时段格式无效: {span}（应为HH:MM-HH:MM）")
+    return spans
+
+
+def _parse_minute(text):
+    """HH:MM → 一天中的第几分钟"""
+    hour, minute = text.split(':')
+    hour, minute = int(hour), int(minute)
+    if not (0 <= hour <= 24 and 0 <= minute < 60 and hour * 60 + minute <= 24 * 60):
+        raise ValueError(text)
+    return hour * 60 + minute
+
+
+class Rule:
+    """
+    一条回复规则：关键词（任一命中）和/或正则表达式 → 回复内容
+    同时设置关键词和正则时，命中关键词的行还需匹配正则
+    priority越大越优先，hours为生效时段，cooldown为触发后的冷却秒数，
+    regions为适用的监控区域名称，留空表示所有区域
+    """
+    def __init__(self, name, reply, keywords=(), regex='', priority=0, hours=None,
+                 cooldown=0, regions=None):
+        self.name = name
+        self.reply = reply
+        self.keywords = list(dict.fromkeys(k for k in keywords if k))
+        self.pattern = re.compile(regex) if regex else None
+        self.priority = priority
+        self.hours = parse_hours(hours)
+        self.cooldown = cooldown
+        self.regions = set(regions or ())
+
+    def applies_to(self, region_name):
+        """是否适用于该监控区域"""
+        return not self.regions or region_name in self.regions
+
+    def active(self, minute):
+        """当前时刻（一天中的第几分钟）是否在生效时段内"""
+        if not self.hours:
+            return True
+        for start, end in self.hours:
+            if start <= end:
+                if start <= minute < end:
+                    return True
+            elif minute >= start or minute < end:  # 跨午夜
+                return True
+        return False
+
+
+def rule_from_config(item, index=0):
+    """由配置中的一项生成规则，配置无效时抛出ValueError"""
+    name = item.get('name') or f"规则{index + 1}"
+    keywords = item.get('keywords') or []
+    if isinstance(keywords, str):
+        keywords = [keywords]
+    regions = item.get('regions') or []
+    if isinstance(regions, str):
+        regions = [regions]
+    regex = item.get('regex', '')
+
+    if not item.get('reply'):
+        raise ValueError(f"规则“{name}”没有回复内容")
+    if not keywords and not regex:
+        raise ValueError(f"规则“{name}”至少需要关键词或正则表达式")
+    if item.get('cooldown', 0) < 0:
+        raise ValueError(f"规则“{name}”的冷却时间不能为负数")
+
+    try:
+        return Rule(name, item['reply'], keywords, regex, item.get('priority', 0),
+                    item.get('hours'), item.get('cooldown', 0), regions)
+    except re.error as e:
+        raise ValueError(f"规则“{name}”的正则表达式无效: {str(e)}")
+
+
+def parse_rules(items):
+    """解析配置中的规则列表，名称重复或配置无效时抛出ValueError"""
+    rules = [rule_from_config(item, index) for index, item in enumerate(items or [])]
+    names = [rule.name for rule in rules]
+    if len(set(names)) != len(names) or DEFAULT_RULE_NAME in names:
+        raise ValueError(f"规则名称重复（“{DEFAULT_RULE_NAME}”为默认规则保留）")
+    return rules
+
+
+class RuleSet:
+    """
+    编译后的规则集：所有规则的关键词合并为一个匹配器（自动机或容错匹配器），
+    每个关键词记录所属规则，单次扫描后每行只检查命中关键词所属的候选规则，
+    规则再多每帧的耗时也基本不变；只有正则、没有关键词的规则需要逐行检查
+    """
+    def __init__(self, rules, fuzzy_distance=None):
+        # 按优先级从高到低排列，同优先级保持配置顺序
+        self.rules = sorted(rules, key=lambda rule: -rule.priority)
+
+        self.keyword_rules = {}
+        self.unindexed = []
+        for rule_index, rule in enumerate(self.rules):
+            for keyword in rule.keywords:
+                self.keyword_rules.setdefault(keyword, []).append(rule_index)
+            if not rule.keywords:
+                self.unindexed.append(rule_index)
+
+        if fuzzy_distance is None:
+            self.matcher = KeywordMatcher(self.keyword_rules)
+        else:
+            self.matcher = FuzzyMatcher(self.keyword_rules, fuzzy_distance)
+
+    def candidates(self, text):
+        """每行的候选规则及命中的关键词：{行: {规则序号: [关键词]}}，行已去除首尾空白"""
+        by_line = {}
+        for keyword, lines in self.matcher.match_lines(text):
+            for line in lines:
+                line_rules = by_line.setdefault(line, {})
+                for rule_index in self.keyword_rules[keyword]:
+                    line_rules.setdefault(rule_index, []).append(keyword)
+
+        if self.unindexed:
+            for line in text.split('\n'):
+                line = line.strip()
+                if line:
+                    line_rules = by_line.setdefault(line, {})
+                    for rule_index in self.unindexed:
+                        line_rules.setdefault(rule_index, [])
+        return by_line
+
+    def match(self, text, now=None):
+        """
+        返回[(行, [(规则, [命中的关键词]), ...]), ...]，每行的规则按优先级排列
+        已过滤掉不在生效时段或正则不匹配的规则；只有正则的规则以匹配到的文字作为关键词
+        """
+        now = time.localtime(now)
+        minute = now.tm_hour * 60 + now.tm_min
+
+        result = []
+        for line, line_rules in self.candidates(text).items():
+            matched = []
+            for rule_index in sorted(line_rules):
+                rule = self.rules[rule_index]
+                if not rule.active(minute):
+                    continue
+                keywords = line_rules[rule_index]
+                if rule.pattern is not None:
+                    found = rule.pattern.search(line)
+                    if found is None:
+                        continue
+                    if not keywords:
+                        keywords = [found.group(0)]
+                matched.append((rule, keywords))
+            if matched:
+                result.append((line, matched))
+        return result
@@ -0,0 +1,71 @@
+
+import threading
+
+
+class PollScheduler:
+    """
+    自适应轮询调度：画面有变化时按最短间隔检测，空闲时指数退避到最长间隔
+    所有等待都基于threading.Event，停止/暂停/恢复立即生效
+    """
+    def __init__(self, min_interval=0.5, max_interval=3, backoff=1.5):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.interval = min_interval
+
+        self.stopped = False
+        self.paused = False
+        self.wakeup = threading.Event()
+        # 只在停止时置位，供其他线程做可中断的延迟
+        self.stop_event = threading.Event()
+
+    def configure(self, min_interval, max_interval, backoff):
+        """调整间隔范围，立即生效"""
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.backoff = backoff
+        self.interval = min(max(self.interval, self.min_interval), self.max_interval)
+        self.wakeup.set()
+
+    def on_activity(self):
+        """画面有变化：回到最短间隔"""
+        self.interval = self.min_interval
+
+    def on_idle(self):
+        """画面无变化：间隔按倍数增长，不超过最长间隔"""
+        self.interval = min(self.max_interval, self.interval * self.backoff)
+
+    def sleep(self, seconds):
+        """可中断的等待，返回False表示已停止"""
+        if not self.stopped:
+            self.wakeup.wait(seconds)
+            self.wakeup.clear()
+        return not self.stopped
+
+    def wait_next(self, seconds=None):
+        """等待下一次检测（默认按当前间隔）：暂停时一直等到恢复，返回False表示已停止"""
+        if not self.sleep(self.interval if seconds is None else seconds):
+            return False
+
+        while self.paused and not self.stopped:
+            self.wakeup.wait()
+            self.wakeup.clear()
+        return not self.stopped
+
+    def pause(self):
+        """暂停"""
+        self.paused = True
+        self.wakeup.set()
+
+    def resume(self):
+        """恢复，并按最短间隔立即开始检测"""
+        self.paused = False
+        self.interval = self.min_interval
+        self.wakeup.set()
+
+    def stop(self):
+        """停止，唤醒所有等待"""
+        self.stopped = True
+        self.paused = False
+        self.stop_event.set()
+        self.wakeup.set()
@@ -1,85 +1,75 @@
 
-import tkinter as tk
-from tkinter import ttk, messagebox, filedialog
-import pyautogui
-import pytesseract
+import importlib.util
+import signal
 import threading
-import time
-import json
 import os
-import logging
 import sys
 from datetime import datetime
-from PIL import Image, ImageTk, ImageGrab
-import pystray
-from pystray import MenuItem as Item
-import webbrowser
-pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files (x86)\Tesseract-OCR\tesseract.exe"
+from monitor_engine import MonitorEngine, DEFAULT_CITIES
+from logging_setup import setup_logging
+from ocr_backend import compare_backends, format_latency
+from log_buffer import LogBuffer
+from event_stream import JsonLinesWriter
+
+# 日志区域最多保留的行数
+LOG_VIEW_LINES = 1000
+# 日志区域刷新间隔（毫秒）
+LOG_FLUSH_MS = 100
+# 窗口显示后再创建托盘图标的延迟（毫秒），不拖慢启动
+TRAY_DELAY_MS = 500
+
+# tkinter在创建界面时才导入，无界面模式和校准不加载
+tk = ttk = messagebox = filedialog = None
+
+
+def import_tk():
+    """导入tkinter（创建界面前调用）"""
+    global tk, ttk, messagebox, filedialog
+    if tk is None:
+        import tkinter
+        from tkinter import ttk as tk_ttk, messagebox as tk_messagebox, filedialog as tk_filedialog
+        tk, ttk, messagebox, filedialog = tkinter, tk_ttk, tk_messagebox, tk_filedialog
+
 
 class WeChatMonitorPro:
     def __init__(self):
+        import_tk()
         self.version = "1.0"
-        self.monitoring = False
-        self.monitor_thread = None
         self.tray_icon = None
         self.root = None
         self.is_closing = False
 
-        # 默认配置
-        self.config = {
-            'region': (100, 100, 800, 600),  # 截图区域
-            'reply_text': '2',  # 固定回复内容
-            'check_interval': 3,  # 3秒检测间隔
-            'cities': [
-                '天津', '重庆', '北京', '杭州', '烟台', '郑州', '沈阳', '温州',
-                '南昌', '深圳', '广州', '太原', '福州', '南宁', '呼和浩特',
-                '上海', '长春', '西安', '大连', '石家庄', '青岛'
-            ],
-            'log_to_file': True,
-            'window_title': '微信群监控工具',
-            'auto_start': False,
-            'ocr_confidence': 60
-        }
-
-        # 消息历史，避免重复回复
-        self.message_history = set()
-        self.last_screenshot_hash = None
-
         # 设置日志
         self.setup_logging()
 
+        # 界面日志缓冲：各线程写入，界面线程定时批量显示
+        self.log_buffer = LogBuffer(LOG_VIEW_LINES)
+        self.log_view_lines = 0
+
+        # 监控引擎（截图、OCR、匹配、回复均由引擎完成，GUI只负责展示和控制）
+        self.engine = MonitorEngine(log_callback=self.log)
+        self.config = self.engine.config
+        self.config_version = 0  # 界面显示的配置对应的快照版本
+
         # 创建GUI
         self.create_gui()
 
         # 加载配置
         self.load_config()
 
-        # 设置系统托盘
-        self.setup_tray()
+        # 窗口显示后再在后台线程中创建系统托盘
+        self.root.after(TRAY_DELAY_MS, self.setup_tray)
 
         self.log("程序启动完成")
 
+    @property
+    def monitoring(self):
+        """是否正在监控"""
+        return self.engine.monitoring
+
     def setup_logging(self):
         """设置日志系统"""
-        log_formatter = logging.Formatter(
-            '%(asctime)s - %(levelname)s - %(message)s',
-            datefmt='%Y-%m-%d %H:%M:%S'
-        )
-
-        # 文件日志
-        log_filename = f"wechat_monitor_{datetime.now().strftime('%Y%m%d')}.log"
-        file_handler = logging.FileHandler(log_filename, encoding='utf-8')
-        file_handler.setFormatter(log_formatter)
-
-        # 控制台日志
-        console_handler = logging.StreamHandler()
-        console_handler.setFormatter(log_formatter)
-
-        # 配置logger
-        self.logger = logging.getLogger('WeChatMonitor')
-        self.logger.setLevel(logging.INFO)
-        self.logger.addHandler(file_handler)
-        self.logger.addHandler(console_handler)
+        self.logger = setup_logging()
 
     def log(self, message, level='info'):
         """记录日志"""
@@ -90,17 +80,35 @@ class WeChatMonitorPro:
         elif level == 'warning':
             self.logger.warning(message)
 
-        # 同时显示在GUI日志区域
-        if hasattr(self, 'log_text'):
-            timestamp = datetime.now().strftime('%H:%M:%S')
-            log_msg = f"[{timestamp}] {message}\n"
-            self.log_text.insert(tk.END, log_msg)
-            self.log_text.see(tk.END)
+        # 同时显示在GUI日志区域（可能在任意线程调用，只写入缓冲，由界面线程定时显示）
+        timestamp = datetime.now().strftime('%H:%M:%S')
+        self.log_buffer.push(f"[{timestamp}] {message}\n")
+
+    def flush_log(self):
+        """定时把缓冲中的日志批量写入日志区域，超出行数上限时删除最早的行"""
+        if self.is_closing:
+            return
+
+        lines, skipped = self.log_buffer.drain()
+        if skipped:
+            lines.insert(0, f"...（日志过多，{skipped}条未显示）\n")
+
+        if lines:
+            # 只有查看最新日志时才自动滚动，翻看历史日志时不打扰
+            at_bottom = self.log_text.yview()[1] >= 0.999
+            text = ''.join(lines)
+            self.log_text.insert(tk.END, text)
+            self.log_view_lines += text.count('\n')
+
+            excess = self.log_view_lines - LOG_VIEW_LINES
+            if excess > 0:
+                self.log_text.delete('1.0', f'{excess + 1}.0')
+                self.log_view_lines -= excess
 
-            # 限制日志长度，避免内存占用过多
-            lines = int(self.log_text.index('end-1c').split('.')[0])
-            if lines > 1000:
-                self.log_text.delete('1.0', '500.0')
+            if at_bottom:
+                self.log_text.see(tk.END)
+
+        self.root.after(LOG_FLUSH_MS, self.flush_log)
 
     def create_gui(self):
         """创建GUI界面"""
@@ -147,6 +155,8 @@ class WeChatMonitorPro:
         tools_menu.add_command(label="区域选择器", command=self.open_region_selector)
         tools_menu.add_command(label="测试截图", command=self.test_screenshot)
         tools_menu.add_command(label="测试OCR", command=self.test_ocr)
+        tools_menu.add_command(label="OCR耗时对比", command=self.test_ocr_latency)
+        tools_menu.add_command(label="校准OCR缩放", command=self.calibrate_ocr)
         tools_menu.add_separator()
         tools_menu.add_command(label="清空日志", command=self.clear_log)
         tools_menu.add_command(label="打开日志文件夹", command=self.open_log_folder)
@@ -169,6 +179,9 @@ class WeChatMonitorPro:
         # 控制面板
         self.create_control_panel(main_frame)
 
+        # 性能统计面板
+        self.create_stats_panel(main_frame)
+
         # 配置面板
         self.create_config_panel(main_frame)
 
@@ -237,7 +250,22 @@ class WeChatMonitorPro:
 
         ttk.Label(status_info_frame, text="城市数量:").pack(side="left")
         self.cities_label = ttk.Label(status_info_frame, text="21个")
-        self.cities_label.pack(side="left", padx=(5, 0))
+        self.cities_label.pack(side="left", padx=(5, 20))
+
+        ttk.Label(status_info_frame, text="去重记录:").pack(side="left")
+        self.dedup_label = ttk.Label(status_info_frame, text="0条")
+        self.dedup_label.pack(side="left", padx=(5, 0))
+
+    def create_stats_panel(self, parent):
+        """创建性能统计面板（各阶段延迟和计数）"""
+        stats_frame = ttk.LabelFrame(parent, text="性能统计", padding=10)
+        stats_frame.pack(fill="x", pady=(0, 10))
+
+        self.latency_label = ttk.Label(stats_frame, text="各阶段延迟: 暂无数据")
+        self.latency_label.pack(anchor="w")
+
+        self.counter_label = ttk.Label(stats_frame, text="")
+        self.counter_label.pack(anchor="w", pady=(3, 0))
 
     def create_config_panel(self, parent):
         """创建配置面板"""
@@ -307,6 +335,47 @@ class WeChatMonitorPro:
         ttk.Button(log_control_frame, text="打开日志文件夹",
                    command=self.open_log_folder).pack(side="right", padx=5)
 
+    def refresh_stats(self):
+        """定时刷新去重记录、各阶段延迟和计数"""
+        if self.is_closing:
+            return
+
+        # 配置文件被修改并自动重新加载后，刷新界面上的配置显示
+        if self.config_version != self.engine.config_version:
+            self.config_version = self.engine.config_version
+            self.update_ui_from_config()
+
+        stats = self.engine.dedup.stats()
+        self.dedup_label.config(text=f"{stats['entries']}条 (约{stats['memory_kb']}KB)")
+
+        metrics = self.engine.metrics
+        stage_names = [('capture', "截图"), ('diff', "变化检测"), ('ocr', "OCR"),
+                       ('match', "匹配"), ('reply', "回复")]
+        stages = metrics.summary('wdchat_stage_seconds')
+        parts = [f"{label} {self.format_latency_pair(stages[stage])}"
+                 for stage, label in stage_names if stage in stages]
+        reply_latency = metrics.summary('wdchat_detection_to_reply_seconds').get('')
+        if reply_latency:
+            parts.append(f"检测→回复 {self.format_latency_pair(reply_latency)}")
+        if parts:
+            self.latency_label.config(text="延迟(p50/p99): " + "  |  ".join(parts))
+
+        self.counter_label.config(
+            text=f"帧 {metrics.counter_total('wdchat_frames_total')}  "
+                 f"无变化跳过 {metrics.counter_total('wdchat_frames_skipped_total')}  "
+                 f"合并 {metrics.counter_total('wdchat_frames_coalesced_total')}  "
+                 f"检测 {metrics.counter_total('wdchat_detections_total')}  "
+                 f"回复 {metrics.counter_total('wdchat_replies_total')}  "
+                 f"丢弃 {metrics.counter_total('wdchat_queue_dropped_total')}  "
+                 f"出错 {metrics.counter_total('wdchat_errors_total')}")
+        self.root.after(5000, self.refresh_stats)
+
+    @staticmethod
+    def format_latency_pair(summary):
+        """格式化(次数, p50, p99)为'12/45ms'"""
+        _, p50, p99 = summary
+        return f"{p50 * 1000:.0f}/{p99 * 1000:.0f}ms"
+
     def center_window(self):
         """窗口居中"""
         self.root.update_idletasks()
@@ -350,7 +419,7 @@ class WeChatMonitorPro:
             region = self.config['region']
 
             # 截图
-            screenshot = pyautogui.screenshot(region=region)
+            screenshot = self.engine.grab(region)
 
             # 创建预览窗口
             preview_window = tk.Toplevel(self.root)
@@ -358,6 +427,7 @@ class WeChatMonitorPro:
             preview_window.geometry("600x400")
 
             # 调整图片大小
+            from PIL import Image, ImageTk
             img = screenshot.copy()
             img.thumbnail((580, 380), Image.Resampling.LANCZOS)
             photo = ImageTk.PhotoImage(img)
@@ -378,7 +448,7 @@ class WeChatMonitorPro:
             self.update_region_config()
             region = self.config['region']
 
-            screenshot = pyautogui.screenshot(region=region)
+            screenshot = self.engine.grab(region)
 
             # 保存测试截图
             filename = f"test_screenshot_{datetime.now().strftime('%Y%m%d_%H%M%S')}.png"
@@ -398,10 +468,10 @@ class WeChatMonitorPro:
             region = self.config['region']
 
             # 截图
-            screenshot = pyautogui.screenshot(region=region)
+            screenshot = self.engine.grab(region)
 
             # OCR识别
-            text = pytesseract.image_to_string(screenshot, lang='chi_sim')
+            text = self.engine.extract_text(screenshot)
 
             # 显示结果
             result_window = tk.Toplevel(self.root)
@@ -418,6 +488,41 @@ class WeChatMonitorPro:
             self.log(f"OCR测试失败: {str(e)}", 'error')
             messagebox.showerror("错误", f"OCR测试失败: {str(e)}")
 
+    def test_ocr_latency(self):
+        """对比各OCR后端的单次识别耗时"""
+        try:
+            self.update_region_config()
+            region = self.config['region']
+
+            # 截图
+            screenshot = self.engine.grab(region)
+
+            # 逐个后端测量
+            lines = [format_latency(result) for result in compare_backends(screenshot)]
+            for line in lines:
+                self.log(f"OCR耗时: {line}")
+
+            messagebox.showinfo("OCR耗时对比", '\n'.join(lines))
+
+        except Exception as e:
+            self.log(f"OCR耗时测试失败: {str(e)}", 'error')
+            messagebox.showerror("错误", f"OCR耗时测试失败: {str(e)}")
+
+    def calibrate_ocr(self):
+        """校准预处理缩放比例（在识别准确的前提下选耗时最短的比例）"""
+        try:
+            self.update_region_config()
+            best_scale, results = self.engine.calibrate_preprocess()
+
+            lines = [f"缩放 {r['scale']}: {r['latency_ms']}ms, 准确率 {r['accuracy']:.0%}"
+                     for r in results]
+            lines.append(f"\n已选择缩放比例: {best_scale}")
+            messagebox.showinfo("OCR缩放校准", '\n'.join(lines))
+
+        except Exception as e:
+            self.log(f"OCR缩放校准失败: {str(e)}", 'error')
+            messagebox.showerror("错误", f"OCR缩放校准失败: {str(e)}")
+
     def start_monitoring(self):
         """开始监控"""
         if self.monitoring:
@@ -427,12 +532,13 @@ class WeChatMonitorPro:
             self.update_region_config()
 
             # 验证配置
-            if not self.validate_config():
+            try:
+                self.engine.validate_config()
+            except ValueError as e:
+                messagebox.showerror("错误", str(e))
                 return
 
-            self.monitoring = True
-            self.monitor_thread = threading.Thread(target=self.monitor_loop, daemon=True)
-            self.monitor_thread.start()
+            self.engine.start()
 
             # 更新UI
             self.start_btn.config(state="disabled")
@@ -448,146 +554,42 @@ class WeChatMonitorPro:
 
     def pause_monitoring(self):
         """暂停/恢复监控"""
-        if hasattr(self, 'paused'):
-            self.paused = not self.paused
-            if self.paused:
-                self.pause_btn.config(text="恢复监控")
-                self.status_label.config(text="状态: 已暂停")
-                self.log("监控已暂停")
-            else:
-                self.pause_btn.config(text="暂停监控")
-                self.status_label.config(text="状态: 监控中...")
-                self.log("监控已恢复")
+        if self.engine.paused:
+            self.engine.resume()
         else:
-            self.paused = True
+            self.engine.pause()
+
+        if self.engine.paused:
             self.pause_btn.config(text="恢复监控")
             self.status_label.config(text="状态: 已暂停")
             self.log("监控已暂停")
+        else:
+            self.pause_btn.config(text="暂停监控")
+            self.status_label.config(text="状态: 监控中...")
+            self.log("监控已恢复")
 
     def stop_monitoring(self):
-        """停止监控"""
-        self.monitoring = False
-        self.paused = False
-
-        # 更新UI
-        self.start_btn.config(state="normal")
+        """停止监控（引擎要等待各级线程退出，在后台线程中停止，界面不卡住）"""
+        self.start_btn.config(state="disabled")
         self.pause_btn.config(state="disabled", text="暂停监控")
         self.stop_btn.config(state="disabled")
-        self.status_label.config(text="状态: 已停止")
-
-        self.log("监控已停止")
+        self.status_label.config(text="状态: 正在停止...")
+        threading.Thread(target=self.run_stop, name='stop', daemon=True).start()
 
-    def validate_config(self):
-        """验证配置"""
+    def run_stop(self):
+        """停止线程：停止引擎后回到界面线程更新界面"""
         try:
-            region = self.config['region']
-            if not all(isinstance(x, int) and x > 0 for x in region):
-                messagebox.showerror("错误", "截图区域配置无效")
-                return False
+            self.engine.stop()
+        finally:
+            if not self.is_closing:
+                self.root.after(0, self.on_monitoring_stopped)
 
-            if not self.config['cities']:
-                messagebox.showerror("错误", "城市列表为空")
-                return False
-
-            return True
-
-        except Exception as e:
-            messagebox.showerror("错误", f"配置验证失败: {str(e)}")
-            return False
-
-    def monitor_loop(self):
-        """监控主循环"""
-        self.paused = False
-
-        while self.monitoring:
-            try:
-                # 检查是否暂停
-                if hasattr(self, 'paused') and self.paused:
-                    time.sleep(1)
-                    continue
-
-                # 截图
-                screenshot = self.capture_screen()
-                if screenshot is None:
-                    time.sleep(self.config['check_interval'])
-                    continue
-
-                # 检查截图是否变化（优化性能）
-                screenshot_hash = hash(screenshot.tobytes())
-                if screenshot_hash == self.last_screenshot_hash:
-                    time.sleep(self.config['check_interval'])
-                    continue
-
-                self.last_screenshot_hash = screenshot_hash
-
-                # OCR识别
-                text = self.extract_text(screenshot)
-                if not text:
-                    time.sleep(self.config['check_interval'])
-                    continue
-
-                # 检查城市名称
-                found_cities = self.check_cities_in_text(text)
-
-                if found_cities:
-                    self.log(f"检测到城市: {', '.join(found_cities)}")
-                    self.send_reply()
-                    time.sleep(2)  # 发送后延迟
-
-            except Exception as e:
-                self.log(f"监控过程出错: {str(e)}", 'error')
-
-            time.sleep(self.config['check_interval'])
-
-    def capture_screen(self):
-        """截取屏幕"""
-        try:
-            region = self.config['region']
-            screenshot = pyautogui.screenshot(region=region)
-            return screenshot
-        except Exception as e:
-            self.log(f"截图失败: {str(e)}", 'error')
-            return None
-
-    def extract_text(self, image):
-        """OCR文字识别"""
-        try:
-            # 预处理图像以提高识别率
-            # 可以添加灰度化、二值化等处理
-            text = pytesseract.image_to_string(image, lang='chi_sim')
-            return text.strip()
-        except Exception as e:
-            self.log(f"OCR识别失败: {str(e)}", 'error')
-            return ""
-
-    def check_cities_in_text(self, text):
-        """检查文本中是否包含城市名称"""
-        found_cities = []
-
-        for city in self.config['cities']:
-            if city in text:
-                # 生成消息哈希，避免重复处理
-                context_lines = [line.strip() for line in text.split('\n') if city in line]
-                for line in context_lines:
-                    msg_hash = hash(line)
-                    if msg_hash not in self.message_history:
-                        self.message_history.add(msg_hash)
-                        found_cities.append(city)
-                        break
-
-        return found_cities
-
-    def send_reply(self):
-        """发送回复"""
-        try:
-            # 模拟键盘输入
-            pyautogui.typewrite(self.config['reply_text'])
-            pyautogui.press('enter')
-
-            self.log(f"已发送回复: {self.config['reply_text']}")
+    def on_monitoring_stopped(self):
+        """引擎已停止，更新界面"""
+        self.start_btn.config(state="normal")
+        self.status_label.config(text="状态: 已停止")
 
-        except Exception as e:
-            self.log(f"发送回复失败: {str(e)}", 'error')
+        self.log("监控已停止")
 
     def open_settings(self):
         """打开设置窗口"""
@@ -595,7 +597,7 @@ class WeChatMonitorPro:
 
     def on_settings_changed(self, new_config):
         """设置更改的回调"""
-        self.config.update(new_config)
+        self.engine.apply_config(new_config)
         self.update_ui_from_config()
         self.log("配置已更新")
 
@@ -616,8 +618,7 @@ class WeChatMonitorPro:
         """保存配置"""
         try:
             self.update_region_config()
-            with open('config.json', 'w', encoding='utf-8') as f:
-                json.dump(self.config, f, ensure_ascii=False, indent=2)
+            self.engine.save_config()
             self.log("配置已保存")
             messagebox.showinfo("成功", "配置已保存")
         except Exception as e:
@@ -627,11 +628,7 @@ class WeChatMonitorPro:
     def load_config(self):
         """加载配置"""
         try:
-            if os.path.exists('config.json'):
-                with open('config.json', 'r', encoding='utf-8') as f:
-                    saved_config = json.load(f)
-                    self.config.update(saved_config)
-
+            if self.engine.load_config():
                 self.update_ui_from_config()
                 self.log("配置已加载")
             else:
@@ -641,7 +638,9 @@ class WeChatMonitorPro:
 
     def clear_log(self):
         """清空日志"""
+        self.log_buffer.clear()
         self.log_text.delete('1.0', tk.END)
+        self.log_view_lines = 0
         self.log("日志已清空")
 
     def save_log(self):
@@ -654,7 +653,7 @@ class WeChatMonitorPro:
             )
 
             if filename:
-                content = self.log_text.get('1.0', tk.END)
+                content = ''.join(self.log_buffer.lines())
                 with open(filename, 'w', encoding='utf-8') as f:
                     f.write(content)
                 self.log(f"日志已保存: {filename}")
@@ -681,8 +680,17 @@ class WeChatMonitorPro:
             self.log(f"打开文件夹失败: {str(e)}", 'error')
 
     def setup_tray(self):
-        """设置系统托盘"""
+        """在后台线程中设置并运行系统托盘（pystray导入较慢，不占用界面线程）"""
+        if self.is_closing or self.tray_icon:
+            return
+        threading.Thread(target=self.run_tray, name='tray', daemon=True).start()
+
+    def run_tray(self):
+        """托盘线程：创建托盘图标并运行"""
         try:
+            import pystray
+            from pystray import MenuItem as Item
+
             # 创建托盘菜单
             menu = pystray.Menu(
                 Item("显示窗口", self.show_window),
@@ -696,10 +704,8 @@ class WeChatMonitorPro:
             image = self.create_tray_icon()
 
             self.tray_icon = pystray.Icon("WeChatMonitor", image, "微信群监控工具", menu)
-
-            # 在单独线程中运行托盘
-            tray_thread = threading.Thread(target=self.tray_icon.run, daemon=True)
-            tray_thread.start()
+            if not self.is_closing:
+                self.tray_icon.run()
 
         except Exception as e:
             self.log(f"托盘设置失败: {str(e)}", 'error')
@@ -745,7 +751,7 @@ class WeChatMonitorPro:
                 return
 
         self.is_closing = True
-        self.monitoring = False
+        self.engine.close()
 
         # 停止托盘图标
         if self.tray_icon:
@@ -843,6 +849,10 @@ class WeChatMonitorPro:
             self.root.bind('<Control-s>', lambda e: self.save_config())
             self.root.bind('<F1>', lambda e: self.show_help())
 
+            # 定时刷新日志区域和运行统计
+            self.flush_log()
+            self.refresh_stats()
+
             self.root.mainloop()
 
         except KeyboardInterrupt:
@@ -1002,6 +1012,11 @@ class SettingsWindow:
         self.auto_start_var = tk.BooleanVar(value=self.config.get('auto_start', False))
         ttk.Checkbutton(basic_frame, text="程序启动时自动开始监控", variable=self.auto_start_var).grid(row=3, column=1, sticky="w", padx=10, pady=5)
 
+        # 最短检测间隔（画面变化时使用，空闲时逐步退避到检测间隔）
+        ttk.Label(basic_frame, text="最短间隔(秒):").grid(row=4, column=0, sticky="w", padx=10, pady=5)
+        self.min_interval_var = tk.StringVar(value=str(self.config.get('min_interval', 0.5)))
+        ttk.Entry(basic_frame, textvariable=self.min_interval_var, width=10).grid(row=4, column=1, sticky="w", padx=10, pady=5)
+
     def create_cities_tab(self, notebook):
         """创建城市设置页"""
         cities_frame = ttk.Frame(notebook)
@@ -1047,6 +1062,11 @@ class SettingsWindow:
         self.window_title_var = tk.StringVar(value=self.config.get('window_title', '微信群监控工具'))
         ttk.Entry(advanced_frame, textvariable=self.window_title_var, width=30).grid(row=1, column=1, columnspan=2, sticky="w", padx=10, pady=5)
 
+        # 容错匹配
+        ttk.Label(advanced_frame, text="城市匹配:").grid(row=2, column=0, sticky="w", padx=10, pady=5)
+        self.fuzzy_match_var = tk.BooleanVar(value=self.config.get('fuzzy_match', False))
+        ttk.Checkbutton(advanced_frame, text="容错匹配（OCR认错个别字时仍能识别）", variable=self.fuzzy_match_var).grid(row=2, column=1, columnspan=2, sticky="w", padx=10, pady=5)
+
     def create_buttons(self):
         """创建按钮区域"""
         btn_frame = ttk.Frame(self.window)
@@ -1058,14 +1078,8 @@ class SettingsWindow:
 
     def restore_default_cities(self):
         """恢复默认城市列表"""
-        default_cities = [
-            '天津', '重庆', '北京', '杭州', '烟台', '郑州', '沈阳', '温州',
-            '南昌', '深圳', '广州', '太原', '福州', '南宁', '呼和浩特',
-            '上海', '长春', '西安', '大连', '石家庄', '青岛'
-        ]
-
         self.cities_text.delete("1.0", tk.END)
-        self.cities_text.insert("1.0", '\n'.join(default_cities))
+        self.cities_text.insert("1.0", '\n'.join(DEFAULT_CITIES))
 
     def clear_cities(self):
         """清空城市列表"""
@@ -1082,17 +1096,22 @@ class SettingsWindow:
         try:
             # 更新配置
             self.config['check_interval'] = float(self.interval_var.get())
+            self.config['min_interval'] = float(self.min_interval_var.get())
             self.config['reply_text'] = self.reply_var.get()
             self.config['cities'] = self.get_cities_from_text()
             self.config['log_to_file'] = self.log_to_file_var.get()
             self.config['auto_start'] = self.auto_start_var.get()
             self.config['ocr_confidence'] = int(self.ocr_confidence_var.get())
             self.config['window_title'] = self.window_title_var.get()
+            self.config['fuzzy_match'] = self.fuzzy_match_var.get()
 
             # 验证配置
             if self.config['check_interval'] < 1:
                 raise ValueError("检测间隔不能小于1秒")
 
+            if not (0.1 <= self.config['min_interval'] <= self.config['check_interval']):
+                raise ValueError("最短间隔必须在0.1秒到检测间隔之间")
+
             if not self.config['cities']:
                 raise ValueError("城市列表不能为空")
 
@@ -1128,28 +1147,140 @@ class SettingsWindow:
         self.window.geometry(f"{width}x{height}+{x}+{y}")
 
 
-def main():
-    """主函数"""
-    print("=" * 60)
-    print("微信群监控工具 - 专业版")
-    print("功能：自动检测微信群中的城市名称并回复'2'")
-    print("=" * 60)
+def parse_args(argv=None):
+    """解析命令行参数"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="微信群监控工具")
+    parser.add_argument('--headless', action='store_true',
+                        help="无界面模式：不创建窗口和托盘，直接开始监控")
+    parser.add_argument('--calibrate', action='store_true',
+                        help="校准OCR预处理缩放比例并保存到配置文件后退出")
+    parser.add_argument('--record', metavar='FILE',
+                        help="无界面模式下把变化的帧和识别结果录制到帧存档")
+    parser.add_argument('--replay', metavar='FILE',
+                        help="无界面模式下回放帧存档或截图目录，回放结束后退出")
+    parser.add_argument('--replay-speed', type=float, default=0,
+                        help="帧存档回放倍速，0表示尽快回放（默认0）")
+    parser.add_argument('--daemon', action='store_true',
+                        help="守护进程模式：无界面监控，每条检测结果输出一行JSON（日志写到标准错误）")
+    parser.add_argument('--events', metavar='PATH', default='-',
+                        help="守护进程模式的事件输出：-表示标准输出（默认），或文件（追加写入）/命名管道路径")
+    parser.add_argument('--events-fifo', action='store_true',
+                        help="--events的路径不存在时创建命名管道（默认创建普通文件）")
+    return parser.parse_args(argv)
+
+
+def create_headless_engine(args=None):
+    """创建无界面引擎并加载配置，命令行的录制/回放参数覆盖配置文件"""
+    setup_logging()
+    engine = MonitorEngine()
+    if engine.load_config():
+        engine.log("配置已加载")
+    else:
+        engine.log("配置文件不存在，使用默认配置")
+
+    if args is not None and args.record:
+        engine.config['record_file'] = args.record
+    if args is not None and args.replay:
+        engine.config.update({'capture_backend': 'replay', 'replay_source': args.replay,
+                              'replay_loop': False, 'replay_speed': args.replay_speed})
+    engine.validate_config()
+    return engine
+
+
+def run_headless(args=None):
+    """无界面模式运行"""
+    try:
+        engine = create_headless_engine(args)
+    except Exception as e:
+        print(f"启动监控失败: {str(e)}")
+        return 1
+
+    engine.run_forever()
+    return 0
+
 
-    # 检查依赖
+def run_daemon(args):
+    """守护进程模式：无界面运行，检测事件以JSON Lines格式输出，收到SIGTERM后停止"""
     try:
-        import pyautogui
-        import pytesseract
-        import pystray
-        from PIL import Image
-        print("✓ 所有依赖库已安装")
-    except ImportError as e:
-        print(f"✗ 缺少依赖库: {e}")
-        print("请安装所需依赖:")
-        print("pip install pyautogui pytesseract pillow pystray")
+        engine = create_headless_engine(args)
+    except Exception as e:
+        print(f"启动监控失败: {str(e)}", file=sys.stderr)
+        return 1
+
+    writer = JsonLinesWriter(args.events, log=engine.log, fifo=args.events_fifo)
+    try:
+        writer.start()
+    except Exception as e:
+        engine.log(f"打开事件输出失败: {str(e)}", 'error')
+        engine.close()
+        return 1
+    engine.event_callback = writer.emit
+
+    if hasattr(signal, 'SIGTERM'):
+        signal.signal(signal.SIGTERM, lambda signum, frame: engine.stop())
+    try:
+        engine.run_forever()
+    finally:
+        writer.close()
+    return 0
+
+
+def run_calibration():
+    """命令行校准预处理缩放比例"""
+    try:
+        engine = create_headless_engine()
+    except Exception as e:
+        print(f"OCR缩放校准失败: {str(e)}")
+        return 1
+
+    try:
+        engine.calibrate_preprocess()
+        engine.save_config()
+        engine.log("配置已保存")
+    except Exception as e:
+        engine.log(f"OCR缩放校准失败: {str(e)}", 'error')
+        return 1
+    finally:
+        engine.close()
+    return 0
+
+
+def main():
+    """主函数"""
+    args = parse_args()
+
+    # 守护进程模式下标准输出只用于事件，提示信息写到标准错误
+    out = sys.stderr if args.daemon else sys.stdout
+    print("=" * 60, file=out)
+    print("微信群监控工具 - 专业版", file=out)
+    print("功能：自动检测微信群中的城市名称并回复'2'", file=out)
+    print("=" * 60, file=out)
+
+    # 检查依赖（只查找是否已安装，不导入，各模块在首次使用时才加载）
+    required = ['pyautogui', 'pytesseract', 'PIL']
+    if not (args.headless or args.calibrate or args.replay or args.daemon):
+        required.append('pystray')
+    missing = [name for name in required if importlib.util.find_spec(name) is None]
+    if missing:
+        print(f"✗ 缺少依赖库: {', '.join(missing)}", file=out)
+        print("请安装所需依赖:", file=out)
+        print("pip install pyautogui pytesseract pillow pystray", file=out)
         return
+    print("✓ 所有依赖库已安装", file=out)
+
+
+    print("启动程序...", file=out)
+
+    if args.calibrate:
+        return run_calibration()
 
+    if args.daemon:
+        return run_daemon(args)
 
-    print("启动程序...")
+    if args.headless or args.replay:
+        return run_headless(args)
 
     try:
         # 创建并运行应用
@@ -1164,4 +1295,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file